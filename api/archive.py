@@ -0,0 +1,78 @@
+from django.db import connection, transaction
+
+# Raw data models and the archive tables their rows move to once a project is closed
+ARCHIVES = [
+    ("api.ObservationModel", "api.ObservationArchiveModel"),
+    ("api.ImpressionModel", "api.ImpressionArchiveModel"),
+    ("api.QrCodeModel", "api.QrCodeArchiveModel"),
+]
+
+
+def archive_pairs(apps=None):
+    if apps is None:
+        from django.apps import apps
+    return [(apps.get_model(hot), apps.get_model(archive)) for hot, archive in ARCHIVES]
+
+
+def move_rows(source, target, project_id, chunk_size=5000):
+    """
+    Move a project's rows from one table to the other with INSERT ... SELECT and DELETE, one
+    transaction per chunk_size rows. Both tables have the same columns. Returns the rows moved.
+    """
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(field.column) for field in target._meta.concrete_fields)
+    source_table = qn(source._meta.db_table)
+    target_table = qn(target._meta.db_table)
+
+    moved = 0
+    while True:
+        ids = list(
+            source.objects.filter(project_id=project_id).order_by("pk").values_list("pk", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return moved
+        placeholders = ", ".join(["%s"] * len(ids))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {target_table} ({columns}) SELECT {columns} FROM {source_table} WHERE id IN ({placeholders})",
+                ids,
+            )
+            cursor.execute(f"DELETE FROM {source_table} WHERE id IN ({placeholders})", ids)
+        moved += len(ids)
+
+
+def restore_project(project_id, chunk_size=5000):
+    """
+    Move an archived project's rows back into the hot tables, in one transaction with the project
+    row locked, so concurrent requests wait for the first one instead of moving them twice.
+    Returns {table: rows moved}, empty if the project wasn't archived (anymore) or is in cold storage.
+    """
+    from django.utils import timezone
+    from api.models import ProjectModel
+
+    moved = {}
+    with transaction.atomic():
+        project = ProjectModel.objects.select_for_update().get(id=project_id)
+        if project.archived_at is None or project.cold_stored_at is not None:
+            return moved
+
+        for hot, archive in archive_pairs():
+            moved[hot._meta.db_table] = move_rows(archive, hot, project_id, chunk_size)
+
+        project.archived_at = None
+        project.archive_summary = None
+        project.archive_restored_at = timezone.now()
+        project.save(update_fields=["archived_at", "archive_summary", "archive_restored_at"])
+    return moved
+
+
+def archived_rows(project_id):
+    return sum(archive.objects.filter(project_id=project_id).count() for _, archive in archive_pairs())
+
+
+def compress_archive_tables(apps, schema_editor):
+    """Migration step: archive tables are write-once, so store them compressed on MySQL."""
+    if schema_editor.connection.vendor != "mysql":
+        return
+    for _, archive in archive_pairs(apps):
+        schema_editor.execute(f"ALTER TABLE {schema_editor.quote_name(archive._meta.db_table)} ROW_FORMAT=COMPRESSED")
@@ -0,0 +1,81 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+# User fields stamped into every token, enough for the permission classes. Project assignments are not
+# claims: they are checked against ProjectAssignmentModel (see permissions.scope_to_assigned_projects).
+CLAIM_FIELDS = ("email", "username", "is_active", "is_staff", "is_reviewer", "is_superuser")
+
+# Per process: user id -> {"checked_at", "changed_at", "fields"}. changed_at is when the user was last
+# changed through invalidate_user(), re-read from the cache every JWT_USER_CACHE_TTL seconds.
+# fields are the user's current claim fields, only loaded for users changed after their token was issued.
+_users = {}
+
+
+def stamp_claims(token, user):
+    for field in CLAIM_FIELDS:
+        token[field] = getattr(user, field)
+
+
+def changed_key(user_id):
+    return f"auth:user:{user_id}:changed_at"
+
+
+def invalidate_user(user_id):
+    """
+    Call after changing a user's flags, email or name (or deleting them): tokens
+    issued before now stop being trusted, in every process within JWT_USER_CACHE_TTL seconds.
+    """
+    lifetime = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+    cache.set(changed_key(user_id), time.time(), lifetime)
+    _users.pop(int(user_id), None)
+
+
+def user_from_fields(user_id, fields):
+    from api.models import ClaimsUserModel
+
+    data = {"id": user_id, **fields}
+    names = [field.attname for field in ClaimsUserModel._meta.concrete_fields if field.attname in data]
+    return ClaimsUserModel.from_db("default", names, [data[name] for name in names])
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the user query: request.user is built from the token's claims.
+    Tokens issued before the user was last changed (see invalidate_user) fall back to the database,
+    as do tokens without claims and every token while JWT_CLAIMS_AUTH is off.
+    """
+
+    def get_user(self, validated_token):
+        if not settings.JWT_CLAIMS_AUTH or any(field not in validated_token for field in CLAIM_FIELDS):
+            return super().get_user(validated_token)
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        now = time.time()
+        entry = _users.get(user_id)
+        if entry is None or now - entry["checked_at"] > settings.JWT_USER_CACHE_TTL:
+            try:
+                changed_at = cache.get(changed_key(user_id))
+            except Exception as e:
+                print(f"Error reading the auth cache for user {user_id}: {str(e)}")
+                return super().get_user(validated_token)
+            entry = {"checked_at": now, "changed_at": changed_at, "fields": None}
+            _users[user_id] = entry
+
+        if entry["changed_at"] is None or entry["changed_at"] <= validated_token["iat"]:
+            fields = {field: validated_token[field] for field in CLAIM_FIELDS}
+        elif entry["fields"] is None:
+            # The claims are stale, load the user and remember the current values for this process
+            user = super().get_user(validated_token)
+            entry["fields"] = {field: getattr(user, field) for field in CLAIM_FIELDS}
+            return user
+        else:
+            fields = entry["fields"]
+
+        if not fields["is_active"]:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user_from_fields(user_id, fields)
+
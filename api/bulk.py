@@ -0,0 +1,201 @@
+from itertools import islice
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import FloatField, Max
+from django.utils import timezone
+
+# Floats in natural keys are compared at this precision, so values that went through the
+# database (or a JSON round trip) still match
+KEY_FLOAT_DIGITS = 6
+
+
+def normalize(value):
+    return round(value, KEY_FLOAT_DIGITS) if isinstance(value, float) else value
+
+
+def bulk_upsert(model, objects, key_fields, update_fields, scope=None, batch_size=1000):
+    """
+    Create or update unsaved `objects` of `model` by natural key, a batch at a time.
+
+    For every batch the existing rows are fetched with one query: `scope` (e.g. {"project": project})
+    plus an IN on each key field that can be compared exactly (not nullable, not a float). Rows are
+    then matched on all key fields in Python. Matching rows get `update_fields` written when any of
+    them changed, the rest are inserted with bulk_create.
+
+    Keys are treated as a multiset: if the payload has the same key twice and the table once,
+    one row is updated and one created, so re-syncing the same payload never adds rows.
+
+    Returns {"created": n, "updated": n, "unchanged": n}.
+    """
+    opts = model._meta
+    key_attnames = [opts.get_field(name).attname for name in key_fields]
+    update_attnames = [opts.get_field(name).attname for name in update_fields]
+    lookup_attnames = [
+        field.attname for field in map(opts.get_field, key_fields)
+        if not field.null and not isinstance(field, FloatField)
+    ]
+    if not lookup_attnames:
+        raise ValueError(f"{model.__name__}: at least one key field must be non-null and not a float.")
+    scope = scope or {}
+    base = model.objects.filter(**scope)
+
+    # Rows this call inserts must not be matched by a later batch; bulk_create doesn't return
+    # primary keys on every backend, so only rows that existed before the call are candidates
+    max_pk = base.aggregate(max_pk=Max("pk"))["max_pk"]
+    claimed = set()
+    result = {"created": 0, "updated": 0, "unchanged": 0}
+
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            break
+
+        existing = defaultdict(list)
+        if max_pk is not None:
+            lookups = {f"{attname}__in": {getattr(obj, attname) for obj in batch} for attname in lookup_attnames}
+            rows = base.filter(pk__lte=max_pk, **lookups)
+            for row in rows.order_by("pk").values_list("pk", *key_attnames, *update_attnames):
+                if row[0] in claimed:
+                    continue
+                key = tuple(normalize(v) for v in row[1:len(key_attnames) + 1])
+                existing[key].append((row[0], row[len(key_attnames) + 1:]))
+
+        to_create = []
+        to_update = []
+        for obj in batch:
+            key = tuple(normalize(getattr(obj, attname)) for attname in key_attnames)
+            matches = existing.get(key)
+            if not matches:
+                to_create.append(obj)
+                continue
+
+            pk, current = matches.pop(0)
+            claimed.add(pk)
+            new = tuple(getattr(obj, attname) for attname in update_attnames)
+            if tuple(map(normalize, current)) == tuple(map(normalize, new)):
+                result["unchanged"] += 1
+            else:
+                obj.pk = pk
+                to_update.append(obj)
+
+        with transaction.atomic():
+            if to_create:
+                model.objects.bulk_create(to_create, batch_size=batch_size)
+            if to_update:
+                model.objects.bulk_update(to_update, update_fields, batch_size=batch_size)
+        result["created"] += len(to_create)
+        result["updated"] += len(to_update)
+
+    return result
+
+
+class ChangePlan:
+    """
+    The writes needed to bring derived `fields` of `model` rows to freshly computed values.
+    add() every row with its computed values, then apply() to write them or counts() for a dry run.
+
+        plan = ChangePlan(SessionAnalyticsModel, ["male_ratio", ...])
+        plan.add(existing_row or SessionAnalyticsModel(...), {"male_ratio": 0.4, ...})
+        plan.apply()
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = list(fields)
+        self.to_create = []
+        self.to_update = []
+        self.unchanged = 0
+
+    def add(self, obj, values):
+        if obj.pk is not None and all(normalize(getattr(obj, f)) == normalize(v) for f, v in values.items()):
+            self.unchanged += 1
+            return
+        for field, value in values.items():
+            setattr(obj, field, value)
+        (self.to_update if obj.pk is not None else self.to_create).append(obj)
+
+    def counts(self):
+        return {"created": len(self.to_create), "updated": len(self.to_update), "unchanged": self.unchanged}
+
+    def apply(self, chunk_size=1000):
+        """Write the plan, one transaction per chunk_size rows."""
+        # bulk_update skips auto_now fields unless they're written explicitly
+        auto_now = [f.name for f in self.model._meta.concrete_fields if getattr(f, "auto_now", False)]
+        now = timezone.now()
+        for obj in self.to_update:
+            for field in auto_now:
+                setattr(obj, field, now)
+
+        for i in range(0, len(self.to_create), chunk_size):
+            with transaction.atomic():
+                self.model.objects.bulk_create(self.to_create[i:i + chunk_size])
+        for i in range(0, len(self.to_update), chunk_size):
+            with transaction.atomic():
+                self.model.objects.bulk_update(self.to_update[i:i + chunk_size], self.fields + auto_now)
+        return self.counts()
+
+
+def reconcile(queryset, objects, key_field, update_fields, protect=None, delete=True, batch_size=1000):
+    """
+    Make the rows of `queryset` (e.g. one project's booths) match `objects`, unsaved instances built
+    from an upstream payload, by the upstream id in `key_field`: objects without a row are created,
+    rows whose `update_fields` differ are updated and rows missing from `objects` are deleted.
+
+    The rows are loaded with one query and written with one bulk_create, one bulk_update and one
+    delete, in a single transaction. An id listed twice is written with its last entry.
+
+    Pass delete=False when the payload may be incomplete (rows that failed to parse), and `protect`,
+    a function from the rows to delete to the pks to keep, for rows that hold more than the payload.
+
+    Returns {"created": n, "updated": n, "unchanged": n, "deleted": n, "kept": n}, kept being the
+    protected rows that are gone upstream.
+    """
+    model = queryset.model
+    opts = model._meta
+    key_attname = opts.get_field(key_field).attname
+    # Compared and set by attname, so foreign keys don't load their related rows
+    update_attnames = [opts.get_field(name).attname for name in update_fields]
+
+    existing = defaultdict(list)
+    for row in queryset.order_by("pk"):
+        existing[getattr(row, key_attname)].append(row)
+    incoming = {getattr(obj, key_attname): obj for obj in objects}
+
+    to_create = []
+    to_update = []
+    unchanged = 0
+    for key, obj in incoming.items():
+        rows = existing.get(key)
+        if not rows:
+            to_create.append(obj)
+            continue
+
+        row = rows.pop(0)  # Rows left under the key are duplicates and go with the stale ones
+        new = [getattr(obj, attname) for attname in update_attnames]
+        if [normalize(getattr(row, attname)) for attname in update_attnames] == list(map(normalize, new)):
+            unchanged += 1
+            continue
+        for attname, value in zip(update_attnames, new):
+            setattr(row, attname, value)
+        to_update.append(row)
+
+    stale = [row for rows in existing.values() for row in rows] if delete else []
+    kept = protect(stale) if protect and stale else set()
+    to_delete = [row.pk for row in stale if row.pk not in kept]
+
+    with transaction.atomic():
+        if to_create:
+            model.objects.bulk_create(to_create, batch_size=batch_size)
+        if to_update:
+            model.objects.bulk_update(to_update, update_fields, batch_size=batch_size)
+        if to_delete:
+            model.objects.filter(pk__in=to_delete).delete()
+
+    return {
+        "created": len(to_create),
+        "updated": len(to_update),
+        "unchanged": unchanged,
+        "deleted": len(to_delete),
+        "kept": len(stale) - len(to_delete),
+    }
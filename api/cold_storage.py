@@ -0,0 +1,375 @@
+import os
+import gzip
+import json
+import shutil
+import datetime
+import tempfile
+import boto3
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from api.archive import archive_pairs, archived_rows, restore_project
+from api.processing_cache import hash_file
+
+FILE_EXTENSIONS = {"json": "json.gz", "parquet": "parquet"}
+
+
+class ColdStorageError(Exception):
+    pass
+
+
+class LocalColdStorage:
+    """Keeps cold storage files in a directory on local disk."""
+
+    def __init__(self, location):
+        self.location = location
+
+    def _path(self, key):
+        return os.path.join(self.location, key)
+
+    def upload(self, local_path, key):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        shutil.copyfile(local_path, tmp_path)
+        os.replace(tmp_path, path)  # A re-export never leaves a half written file behind
+
+    def download(self, key, local_path):
+        try:
+            shutil.copyfile(self._path(key), local_path)
+        except FileNotFoundError:
+            raise ColdStorageError(f"Cold storage file {key} is missing")
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3ColdStorage:
+    """Keeps cold storage files as objects under a prefix in the S3 bucket."""
+
+    def __init__(self, location):
+        self.prefix = location.strip("/")
+        self.bucket_name = os.environ.get("AWS_S3_BUCKET_NAME")
+        self.s3 = boto3.client(
+            's3',
+            aws_access_key_id=os.environ.get("ACCESS_KEY"),
+            aws_secret_access_key=os.environ.get("SECRET_ACCESS_KEY"),
+            region_name=os.environ.get("AWS_REGION"))
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}"
+
+    def upload(self, local_path, key):
+        self.s3.upload_file(local_path, self.bucket_name, self._key(key))
+
+    def download(self, key, local_path):
+        self.s3.download_file(self.bucket_name, self._key(key), local_path)
+
+    def delete(self, key):
+        self.s3.delete_object(Bucket=self.bucket_name, Key=self._key(key))
+
+
+STORAGE_BACKENDS = {
+    "local": LocalColdStorage,
+    "s3": S3ColdStorage,
+}
+
+
+def get_storage():
+    config = settings.COLD_STORAGE
+    backend_cls = STORAGE_BACKENDS.get(config["BACKEND"])
+    if backend_cls is None:
+        raise ColdStorageError(f"Unknown cold storage backend {config['BACKEND']}")
+    return backend_cls(config["LOCATION"])
+
+
+def columns(model):
+    """The columns stored for a raw model; its archive model has the same ones."""
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+# Files hold row groups of chunk_size rows, each stored column by column, so neither writing nor
+# reading ever needs a whole project in memory.
+#
+# json: gzipped JSON lines, a header {"model": ..., "columns": [...]} then one line per row group
+#       with a list of values per column. Datetimes are ISO 8601 strings.
+# parquet: needs pyarrow, which is not in requirements.txt.
+
+def json_default(value):
+    # Not DjangoJSONEncoder, it cuts datetimes to milliseconds
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def write_json(path, model, row_groups):
+    rows = 0
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"model": model._meta.label, "columns": columns(model)}) + "\n")
+        for group in row_groups:
+            f.write(json.dumps([list(values) for values in zip(*group)], default=json_default) + "\n")
+            rows += len(group)
+    return rows
+
+
+def read_json(path, model):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        by_attname = {field.attname: field for field in model._meta.concrete_fields}
+        # Only datetimes need converting back from their JSON form
+        fields = [by_attname[attname] for attname in header["columns"]]
+        for line in f:
+            data = json.loads(line)
+            for index, field in enumerate(fields):
+                if field.get_internal_type() == "DateTimeField":
+                    data[index] = [field.to_python(value) for value in data[index]]
+            yield header["columns"], list(zip(*data))
+
+
+def parquet_schema(model):
+    import pyarrow as pa
+
+    types = {
+        "DateTimeField": pa.timestamp("us", tz="UTC"),
+        "FloatField": pa.float64(),
+        "CharField": pa.string(),
+        "BooleanField": pa.bool_(),
+    }
+    # Everything else in the raw tables is an integer (ids, counts, dwell times)
+    return pa.schema([
+        (field.attname, types.get(field.get_internal_type(), pa.int64())) for field in model._meta.concrete_fields
+    ])
+
+
+def write_parquet(path, model, row_groups):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema(model)
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for group in row_groups:
+            values = list(zip(*group))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(values, schema)], schema=schema
+            ))
+            rows += len(group)
+    return rows
+
+
+def read_parquet(path, model):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    for index in range(parquet_file.num_row_groups):
+        table = parquet_file.read_row_group(index)
+        yield table.column_names, list(zip(*(column.to_pylist() for column in table.columns)))
+
+
+FORMATS = {
+    "json": (write_json, read_json),
+    "parquet": (write_parquet, read_parquet),
+}
+
+
+def row_groups(querysets, attnames, chunk_size):
+    """Rows of every queryset as lists of tuples, paging on the primary key."""
+    for queryset in querysets:
+        last_pk = None
+        while True:
+            page = queryset.order_by("pk")
+            if last_pk is not None:
+                page = page.filter(pk__gt=last_pk)
+            group = list(page.values_list(*attnames)[:chunk_size])
+            if not group:
+                break
+            yield group
+            last_pk = group[-1][0]  # id is always the first column
+
+
+def delete_rows(model, project_id, chunk_size):
+    deleted = 0
+    while True:
+        ids = list(model.objects.filter(project_id=project_id).order_by("pk").values_list("pk", flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            model.objects.filter(pk__in=ids).delete()
+        deleted += len(ids)
+
+
+def export_project(project, chunk_size=5000, summary=None, file_format=None):
+    """
+    Write a project's raw observations, impressions and QR codes (hot or archived) to one cold
+    storage file per table, then delete them from the database. Each file is read back and counted
+    before any row is deleted. Session and impression analytics stay in place, and `summary`
+    (the project list analytics, which read raw rows) is kept on the project.
+    Returns {table: rows exported}.
+    """
+    from api.models import ColdStorageFileModel
+
+    file_format = file_format or settings.COLD_STORAGE["FORMAT"]
+    write, read = FORMATS[file_format]
+    storage = get_storage()
+    exported = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for hot, archive in archive_pairs():
+            attnames = columns(hot)
+            querysets = [hot.objects.filter(project_id=project.id), archive.objects.filter(project_id=project.id)]
+            table = hot._meta.db_table
+            path = os.path.join(tmp_dir, f"{table}.{FILE_EXTENSIONS[file_format]}")
+
+            rows = write(path, hot, row_groups(querysets, attnames, chunk_size))
+            read_back = sum(len(group) for _, group in read(path, hot))
+            if read_back != rows:
+                raise ColdStorageError(f"{table}: wrote {rows} rows but read back {read_back}")
+
+            key = f"projects/{project.id}/{table}.{FILE_EXTENSIONS[file_format]}"
+            storage.upload(path, key)
+            previous = ColdStorageFileModel.objects.filter(project=project, table=table).values_list("key", flat=True).first()
+            if previous and previous != key:
+                storage.delete(previous)  # Exported before in the other format
+            ColdStorageFileModel.objects.update_or_create(
+                project=project,
+                table=table,
+                defaults={
+                    "key": key,
+                    "format": file_format,
+                    "rows": rows,
+                    "size": os.path.getsize(path),
+                    "sha256": hash_file(path),
+                    "exported_at": timezone.now(),
+                    "rehydrated_at": None,
+                },
+            )
+            exported[table] = rows
+
+    # Every file is stored, only now remove the rows
+    for hot, archive in archive_pairs():
+        delete_rows(hot, project.id, chunk_size)
+        delete_rows(archive, project.id, chunk_size)
+
+    project.cold_stored_at = timezone.now()
+    project.cold_storage_summary = summary
+    project.save(update_fields=["cold_stored_at", "cold_storage_summary"])
+    return exported
+
+
+def rehydrate_project(project_id, chunk_size=5000):
+    """
+    Load a cold project's rows back into the hot tables, in one transaction with the project row
+    locked, so concurrent requests wait for the first one instead of loading the rows twice.
+    Returns {table: rows loaded}, empty if the project wasn't cold (anymore).
+    """
+    from api.models import ProjectModel
+
+    storage = get_storage()
+    hot_models = {hot._meta.db_table: hot for hot, _ in archive_pairs()}
+    loaded = {}
+
+    with transaction.atomic(), tempfile.TemporaryDirectory() as tmp_dir:
+        project = ProjectModel.objects.select_for_update().get(id=project_id)
+        if project.cold_stored_at is None:
+            return loaded
+
+        for manifest in project.cold_storage_files.all():
+            hot = hot_models[manifest.table]
+            _, read = FORMATS[manifest.format]
+            path = os.path.join(tmp_dir, os.path.basename(manifest.key))
+            storage.download(manifest.key, path)
+            if hash_file(path) != manifest.sha256:
+                raise ColdStorageError(f"Cold storage file {manifest.key} does not match its checksum")
+
+            rows = 0
+            for attnames, group in read(path, hot):
+                hot.objects.bulk_create([hot(**dict(zip(attnames, values))) for values in group], batch_size=chunk_size)
+                rows += len(group)
+            if rows != manifest.rows:
+                raise ColdStorageError(f"{manifest.table}: expected {manifest.rows} rows but the file has {rows}")
+
+            manifest.rehydrated_at = timezone.now()
+            manifest.save(update_fields=["rehydrated_at"])
+            loaded[manifest.table] = rows
+
+        # The rows are back in the hot tables, whether they came from them or from the archive ones
+        project.cold_stored_at = None
+        project.cold_storage_summary = None
+        project.archived_at = None
+        project.archive_summary = None
+        project.rehydrate_requested_at = None
+        project.save(
+            update_fields=["cold_stored_at", "cold_storage_summary", "archived_at", "archive_summary", "rehydrate_requested_at"]
+        )
+    return loaded
+
+
+def load_project(project_id, chunk_size=5000):
+    """Load a project's raw rows back from cold storage or the archive tables, whichever holds them."""
+    return rehydrate_project(project_id, chunk_size) or restore_project(project_id, chunk_size)
+
+
+def ensure_rehydrated(project_ids):
+    """
+    Called by the views that read raw rows, before reading them. Loads the rows of the projects in
+    cold storage or the archive tables back right away when there are at most
+    COLD_STORAGE_SYNC_REHYDRATE_MAX_ROWS, and queues the others for run_worker. Returns the ids of
+    the projects still being loaded, for the view to answer 202 instead of reading partial data.
+    Costs one query when none are cold or archived.
+    """
+    from api.models import ColdStorageFileModel, ProjectModel
+
+    stored = dict(
+        ProjectModel.objects.filter(id__in=set(project_ids))
+        .filter(Q(cold_stored_at__isnull=False) | Q(archived_at__isnull=False))
+        .values_list("id", "cold_stored_at")
+    )
+    if not stored:
+        return []
+
+    sizes = dict(
+        ColdStorageFileModel.objects.filter(project_id__in=[project_id for project_id, cold in stored.items() if cold])
+        .values_list("project_id")
+        .annotate(total=Sum("rows"))
+    )
+    pending = []
+    for project_id in sorted(stored):
+        rows = sizes.get(project_id, 0) if stored[project_id] else archived_rows(project_id)
+        if rows > settings.COLD_STORAGE_SYNC_REHYDRATE_MAX_ROWS:
+            pending.append(project_id)
+            continue
+        try:
+            loaded = load_project(project_id)
+            if loaded:
+                print(f"Loaded back the raw rows of project {project_id}: {loaded}")
+        except Exception as e:
+            # Leave it to the worker, which logs it again if it keeps failing
+            print(f"Error loading back the raw rows of project {project_id}: {str(e)}")
+            pending.append(project_id)
+
+    if pending:
+        ProjectModel.objects.filter(id__in=pending, rehydrate_requested_at__isnull=True).update(rehydrate_requested_at=timezone.now())
+    return pending
+
+
+def rehydrate_requested(max_projects=1):
+    """
+    Load back the rows of up to `max_projects` of the projects queued by ensure_rehydrated, oldest
+    request first. Called by run_worker. Returns {project_id: {table: rows loaded}}.
+    """
+    from api.models import ProjectModel
+
+    queued = ProjectModel.objects.filter(rehydrate_requested_at__isnull=False).order_by("rehydrate_requested_at")
+    done = {}
+    for project_id in queued.values_list("id", flat=True)[:max_projects]:
+        try:
+            done[project_id] = load_project(project_id)
+        except Exception as e:
+            print(f"Error loading back the raw rows of project {project_id}: {str(e)}")
+        # Done, no longer cold or failed: the next request for its raw data queues it again
+        ProjectModel.objects.filter(id=project_id).update(rehydrate_requested_at=None)
+    return done
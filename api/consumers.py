@@ -1,11 +1,14 @@
 import json
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 from channels.generic.websocket import WebsocketConsumer, AsyncWebsocketConsumer
 from django.core.exceptions import ValidationError
+from api.progress import progress_group_name, get_progress_state
 
 class VideoUploadProgressConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.room_group_name = "video_upload_progress"  # Name of the group
+        # ws/progress/<job_id>/ follows a single upload, ws/progress/ keeps the old shared group
+        self.job_id = self.scope["url_route"]["kwargs"].get("job_id")
+        self.room_group_name = progress_group_name(self.job_id)  # Name of the group
 
         # Join the room group
         await self.channel_layer.group_add(
@@ -14,6 +17,11 @@ class VideoUploadProgressConsumer(AsyncWebsocketConsumer):
         )
         await self.accept()
 
+        # Replay the last known state so reconnecting clients catch up
+        state = await sync_to_async(get_progress_state)(self.job_id)
+        if state:
+            await self.send(text_data=json.dumps({**state, "replay": True}))
+
     async def disconnect(self, close_code):
         # Leave the room group
         await self.channel_layer.group_discard(
@@ -26,6 +34,10 @@ class VideoUploadProgressConsumer(AsyncWebsocketConsumer):
         # Send message to WebSocket
         await self.send(text_data=json.dumps(event))
 
+    # Receive transcript sentences streamed while the upload is still processing
+    async def send_transcript(self, event):
+        await self.send(text_data=json.dumps(event))
+
     # Helper method to send progress updates
     def send_progress_update(self, stage, progress):
         # Send a progress update to the room group
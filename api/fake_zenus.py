@@ -0,0 +1,362 @@
+import re
+import json
+import hashlib
+import random
+import threading
+from functools import lru_cache
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+SEXES = ["male", "female"]
+AGE_GROUPS = ["18-24", "25-34", "35-44", "45-54", "55-64", "65+"]
+AGE_WEIGHTS = [12, 30, 26, 17, 10, 5]
+ZONES = ["internal", "aisle"]
+SERVICES = ["obs", "imp", "qr"]
+CITIES = [("US", "Las Vegas"), ("US", "Chicago"), ("US", "Orlando"), ("DE", "Berlin"), ("ES", "Barcelona")]
+
+# Show floors open 09:00-18:00, with traffic peaking around lunch
+OPENING_HOUR = 9
+CLOSING_HOUR = 18
+PEAK_HOUR = 12.5
+
+
+def iso(value):
+    # Zenus returns naive local datetimes, the sync makes them aware itself
+    if isinstance(value, datetime):
+        return value.replace(microsecond=0).isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class SyntheticZenusData:
+    """
+    Deterministic synthetic Zenus API payloads.
+
+    Every project is generated from its own seeded Random, so the same project id and
+    scale always produce the same payloads, however many times and in whatever order
+    the endpoints are requested. Datetimes are naive, like the ones Zenus returns, and
+    are only turned into strings when a payload is encoded.
+    """
+
+    def __init__(self, projects=3, days=3, stages=3, sessions_per_day=6, booths=4, devices=8,
+                 observations=5000, impressions=5000, unique_impressions=2000, qr_codes=2000,
+                 first_project_id=10000, start_date="2025-03-03", seed=1):
+        self.project_ids = list(range(first_project_id, first_project_id + projects))
+        self.days = days
+        self.stages = stages
+        self.sessions_per_day = sessions_per_day
+        self.booths = booths
+        self.devices = devices
+        self.observations = observations
+        self.impressions = impressions
+        self.unique_impressions = unique_impressions
+        self.qr_codes = qr_codes
+        self.start_date = datetime.fromisoformat(start_date)
+        self.seed = seed
+
+    def rng(self, project_id, name):
+        return random.Random(f"{self.seed}:{project_id}:{name}")
+
+    def day(self, project_id, index):
+        # Stagger projects so they don't all share the same dates
+        offset = (project_id - self.project_ids[0]) * 7
+        return self.start_date + timedelta(days=offset + index)
+
+    def floor_time(self, rng, day):
+        """Random moment on a show day, weighted towards the midday peak."""
+        hour = rng.triangular(OPENING_HOUR, CLOSING_HOUR, PEAK_HOUR)
+        return day + timedelta(hours=hour)
+
+    def project(self, project_id):
+        rng = self.rng(project_id, "project")
+        country, city = rng.choice(CITIES)
+        first_day = self.day(project_id, 0)
+        return {
+            "id": project_id,
+            "name": f"Synthetic Expo {project_id}",
+            "start_datetime": first_day + timedelta(hours=OPENING_HOUR),
+            "end_datetime": self.day(project_id, self.days - 1) + timedelta(hours=CLOSING_HOUR),
+            "deployment_timezone": "UTC",
+            "services": SERVICES,
+            "country": country,
+            "city": city,
+        }
+
+    def stage_id(self, project_id, index):
+        return project_id * 100 + index
+
+    def booth_id(self, project_id, index):
+        return f"{project_id}-booth-{index}"
+
+    def device_id(self, project_id, index):
+        return f"{project_id}-device-{index}"
+
+    def stage_list(self, project_id):
+        session_minutes = (CLOSING_HOUR - OPENING_HOUR) * 60 // self.sessions_per_day
+        stages = []
+        for s in range(self.stages):
+            sessions = []
+            for d in range(self.days):
+                day = self.day(project_id, d)
+                for n in range(self.sessions_per_day):
+                    start = day + timedelta(hours=OPENING_HOUR, minutes=n * session_minutes)
+                    # Leave a changeover gap so sessions on one stage never overlap
+                    end = start + timedelta(minutes=session_minutes - 10)
+                    sessions.append({
+                        "id": (self.stage_id(project_id, s) * 100 + d) * 100 + n,
+                        "name": f"Stage {s + 1} Day {d + 1} Session {n + 1}",
+                        "start_datetime": start,
+                        "end_datetime": end,
+                    })
+            stages.append({"id": self.stage_id(project_id, s), "name": f"Stage {s + 1}", "sessions": sessions})
+        return stages
+
+    def booth_list(self, project_id):
+        rng = self.rng(project_id, "booths")
+        booths = []
+        for b in range(self.booths):
+            booths.append({
+                "id": self.booth_id(project_id, b),
+                "name": f"Booth {b + 1}",
+                "size": rng.choice([9, 18, 36, 72]),
+                "operating_hours": [
+                    {
+                        "date": self.day(project_id, d),
+                        "active": True,
+                        "opening_time": f"{OPENING_HOUR:02d}:00",
+                        "closing_time": f"{CLOSING_HOUR:02d}:00",
+                    }
+                    for d in range(self.days)
+                ],
+            })
+        return booths
+
+    def device_list(self, project_id):
+        """Devices alternate between stages and booths, with one assignment per show day."""
+        devices = []
+        for i in range(self.devices):
+            on_stage = i % 2 == 0 or not self.booths
+            if on_stage and self.stages:
+                stage = (i // 2) % self.stages
+                area = {"type": "stages", "id": self.stage_id(project_id, stage)}
+                service = "obs"
+                # The QR analytics match scans to stages by the stage name in the device name
+                name = f"Device {i + 1} - Stage {stage + 1}"
+            else:
+                area = {"type": "booths", "id": self.booth_id(project_id, (i // 2) % max(self.booths, 1))}
+                service = "imp"
+                name = f"Device {i + 1}"
+            devices.append({
+                "id": self.device_id(project_id, i),
+                "name": name,
+                "service": service,
+                "assignments": [
+                    {"date": self.day(project_id, d), "active": True, "areas": [area]}
+                    for d in range(self.days)
+                ],
+            })
+        return devices
+
+    def devices_for(self, project_id, service):
+        devices = [d for d in self.device_list(project_id) if d["service"] == service]
+        return devices or self.device_list(project_id)
+
+    def demographics(self, rng):
+        return rng.choice(SEXES), rng.choices(AGE_GROUPS, AGE_WEIGHTS)[0]
+
+    def iter_observations(self, project_id):
+        rng = self.rng(project_id, "observations")
+        devices = self.devices_for(project_id, "obs")
+        for _ in range(self.observations):
+            device = rng.choice(devices)
+            day = self.day(project_id, rng.randrange(self.days))
+            total = max(0, round(rng.gauss(25, 10)))
+            male = round(total * rng.uniform(0.35, 0.65))
+            under_40 = round(total * rng.uniform(0.4, 0.7))
+            energy = rng.uniform(0.3, 0.9)
+            yield {
+                "datetime": self.floor_time(rng, day),
+                "device_id": device["id"],
+                "device_name": device["name"],
+                "count_total": total,
+                "count_male": male,
+                "count_female": total - male,
+                "count_under_40": under_40,
+                "count_over_40": total - under_40,
+                "energy": energy,
+                "energy_male": min(1, energy * rng.uniform(0.9, 1.1)),
+                "energy_female": min(1, energy * rng.uniform(0.9, 1.1)),
+                "energy_under_40": min(1, energy * rng.uniform(0.95, 1.15)),
+                "energy_over_40": min(1, energy * rng.uniform(0.85, 1.05)),
+            }
+
+    def iter_impressions(self, project_id):
+        rng = self.rng(project_id, "impressions")
+        devices = self.devices_for(project_id, "imp")
+        for _ in range(self.impressions):
+            device = rng.choice(devices)
+            day = self.day(project_id, rng.randrange(self.days))
+            sex, age = self.demographics(rng)
+            yield {
+                "latest_datetime": self.floor_time(rng, day),
+                "device_id": device["id"],
+                "device_name": device["name"],
+                "zone": rng.choices(ZONES, [3, 7])[0],
+                # Most passers-by glance, a few stop for minutes
+                "dwell_time": round(rng.lognormvariate(1.5, 1.0), 2),
+                "energy_median": round(rng.uniform(0.2, 0.9), 3),
+                "face_height_median": rng.randint(40, 220),
+                "biological_sex": sex,
+                "biological_age": age,
+            }
+
+    def iter_unique_impressions(self, project_id):
+        rng = self.rng(project_id, "unique-impressions")
+        devices = self.devices_for(project_id, "imp")
+        for _ in range(self.unique_impressions):
+            device = rng.choice(devices)
+            day = self.day(project_id, rng.randrange(self.days))
+            sex, age = self.demographics(rng)
+            impressions_total = max(1, int(rng.expovariate(1 / 3)))
+            yield {
+                "date": day,
+                "device_id": device["id"],
+                "zone": rng.choices(ZONES, [3, 7])[0],
+                "is_staff": rng.random() < 0.05,
+                "impressions_total": impressions_total,
+                "visit_duration": round(rng.lognormvariate(3, 0.8), 2),
+                "dwell_time": round(rng.lognormvariate(1.5, 1.0) * impressions_total, 2),
+                "energy_median": round(rng.uniform(0.2, 0.9), 3),
+                "face_height_median": round(rng.uniform(40, 220), 1),
+                "biological_sex": sex,
+                "biological_age": age,
+            }
+
+    def iter_qr_codes(self, project_id):
+        rng = self.rng(project_id, "qr-sessions")
+        devices = self.devices_for(project_id, "obs")
+        # Attendees scan several times a day, so draw codes from a smaller pool
+        attendees = [f"QR{project_id}{n:06d}" for n in range(max(1, self.qr_codes // 4))]
+        for _ in range(self.qr_codes):
+            device = rng.choice(devices)
+            day = self.day(project_id, rng.randrange(self.days))
+            yield {
+                "datetime": self.floor_time(rng, day),
+                "device_id": device["id"],
+                "device_name": device["name"],
+                "qr_code": rng.choice(attendees),
+            }
+
+    def payload(self, path):
+        """Return the JSON payload for an API path (without query string), or None for unknown paths."""
+        path = path.strip("/")
+        if path == "projects":
+            return {"projects": [{"id": pid, "name": self.project(pid)["name"]} for pid in self.project_ids]}
+
+        match = re.fullmatch(r"projects/(\d+)(?:/([\w-]+))?", path)
+        if not match or int(match.group(1)) not in self.project_ids:
+            return None
+
+        project_id, resource = int(match.group(1)), match.group(2)
+        resources = {
+            None: lambda: self.project(project_id),
+            "stages": lambda: {"stages": self.stage_list(project_id)},
+            "booths": lambda: {"booths": self.booth_list(project_id)},
+            "devices": lambda: {"devices": self.device_list(project_id)},
+            "observations": lambda: {"observations": list(self.iter_observations(project_id))},
+            "impressions": lambda: {"impressions": list(self.iter_impressions(project_id))},
+            "unique-impressions": lambda: {"uniqueImpressions": list(self.iter_unique_impressions(project_id))},
+            "qr-sessions": lambda: {"qr_codes": list(self.iter_qr_codes(project_id))},
+        }
+        if resource not in resources:
+            return None
+        return resources[resource]()
+
+
+def add_scale_arguments(parser):
+    """Command line options shared by the commands that build SyntheticZenusData."""
+    parser.add_argument("--projects", type=int, default=3, help="Number of projects")
+    parser.add_argument("--days", type=int, default=3, help="Show days per project")
+    parser.add_argument("--stages", type=int, default=3, help="Stages per project")
+    parser.add_argument("--sessions-per-day", type=int, default=6, help="Sessions per stage and day")
+    parser.add_argument("--booths", type=int, default=4, help="Booths per project")
+    parser.add_argument("--devices", type=int, default=8, help="Devices per project")
+    parser.add_argument("--observations", type=int, default=5000, help="Observations per project")
+    parser.add_argument("--impressions", type=int, default=5000, help="Impressions per project")
+    parser.add_argument("--unique-impressions", type=int, default=2000, help="Unique impressions per project")
+    parser.add_argument("--qr-codes", type=int, default=2000, help="QR code scans per project")
+    parser.add_argument("--first-project-id", type=int, default=10000, help="Id of the first synthetic project")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the generated data")
+
+
+def data_from_options(options):
+    return SyntheticZenusData(
+        projects=options["projects"],
+        days=options["days"],
+        stages=options["stages"],
+        sessions_per_day=options["sessions_per_day"],
+        booths=options["booths"],
+        devices=options["devices"],
+        observations=options["observations"],
+        impressions=options["impressions"],
+        unique_impressions=options["unique_impressions"],
+        qr_codes=options["qr_codes"],
+        first_project_id=options["first_project_id"],
+        seed=options["seed"],
+    )
+
+
+class FakeZenusServer(ThreadingHTTPServer):
+    """
+    Serves SyntheticZenusData over HTTP with the same paths and payload shapes as the Zenus API.
+    Responses carry an ETag and a matching If-None-Match gets a 304, like a conditional GET upstream.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, data):
+        super().__init__(address, FakeZenusRequestHandler)
+        self.data = data
+        self.encoded = lru_cache(maxsize=256)(self._encode)
+
+    def _encode(self, path):
+        """(body, etag) of the path, None if there's no such endpoint."""
+        payload = self.data.payload(path)
+        if payload is None:
+            return None
+        body = json.dumps(payload, default=iso).encode("utf-8")
+        return body, f'"{hashlib.md5(body).hexdigest()}"'
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeZenusRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        encoded = self.server.encoded(urlparse(self.path).path)
+        if encoded is None:
+            self.send_response(404)
+            body = json.dumps({"error": "Not found"}).encode("utf-8")
+        else:
+            body, etag = encoded
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per request drowns out the sync output
@@ -0,0 +1,117 @@
+import io
+import re
+import hashlib
+from PIL import Image, ImageOps, UnidentifiedImageError
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+# Uploaded avatars and project covers are decoded once and stored as WebP renditions, without
+# their EXIF/ICC/XMP metadata, under a name derived from the upload's content:
+#
+#     renditions/<kind>/<sha256>/{full,card,thumbnail}.webp
+#
+# The same bytes always get the same name, so the files never change and can be served with a
+# year long, immutable Cache-Control (see ImageCacheMiddleware), and re-uploading an image reuses
+# its renditions. The field on the model stores the full rendition's name; the others are derived
+# from it. Names from before the pipeline (the raw upload) get that file for every rendition.
+
+# (name, longest edge in pixels), largest first: each one is resized from the one before it
+RENDITIONS = [("full", 1920), ("card", 640), ("thumbnail", 160)]
+RENDITIONS_DIR = "renditions"
+SOURCE_FORMATS = ("JPEG", "PNG", "WEBP")
+WEBP_QUALITY = 82
+
+# Part of the content hash, so changing the sizes or the quality gives new names instead of
+# serving stale cached files
+PIPELINE_VERSION = f"{RENDITIONS}:{WEBP_QUALITY}".encode()
+
+RENDITION_NAME = re.compile(rf"^(?P<base>{RENDITIONS_DIR}/[\w-]+/[0-9a-f]{{64}})/full\.webp$")
+
+
+class ImageProcessingError(Exception):
+    pass
+
+
+def content_hash(file):
+    digest = hashlib.sha256(PIPELINE_VERSION)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def decode(file):
+    """The upload as an upright RGB(A) image, decoded once and only at the resolution needed."""
+    try:
+        image = Image.open(file)
+        if image.format not in SOURCE_FORMATS:
+            raise ImageProcessingError("Invalid file type. Only JPEG, PNG, and WEBP allowed.")
+        if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+            raise ImageProcessingError("The image is too large.")
+        # JPEG can decode straight to a smaller scale, much cheaper than decoding the whole image
+        largest = RENDITIONS[0][1]
+        image.draft("RGB", (largest, largest))
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise ImageProcessingError("The file is not a valid image.")
+
+    # Apply the EXIF orientation now, the metadata is not kept
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+
+def encode(image):
+    buffer = io.BytesIO()
+    # No exif, icc_profile or xmp arguments: the WebP has no metadata
+    image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def save_renditions(file, kind):
+    """
+    Decode an uploaded image, store its renditions and return the full rendition's storage name.
+    Raises ImageProcessingError for files that aren't a JPEG, PNG or WebP image.
+    """
+    base = f"{RENDITIONS_DIR}/{kind}/{content_hash(file)}"
+    full_name = f"{base}/full.webp"
+    if default_storage.exists(full_name):
+        return full_name  # Same image uploaded before, written last so every rendition is there
+
+    image = decode(file)
+    encoded = []
+    for name, size in RENDITIONS:
+        if max(image.size) > size:
+            image = image.resize(scaled_size(image.size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        encoded.append((name, encode(image)))
+
+    for name, data in reversed(encoded):
+        path = f"{base}/{name}.webp"
+        if default_storage.exists(path):
+            default_storage.delete(path)  # Left by an interrupted upload; the storage would rename a new copy
+        default_storage.save(path, ContentFile(data))
+    return full_name
+
+
+def scaled_size(size, longest_edge):
+    width, height = size
+    scale = longest_edge / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def rendition_urls(image_field):
+    """{rendition: url} of an ImageField's file, None without one."""
+    if not image_field:
+        return None
+    name = image_field.name if hasattr(image_field, "name") else str(image_field)
+    match = RENDITION_NAME.match(name)
+    if not match:
+        url = default_storage.url(name)
+        return {rendition: url for rendition, _ in RENDITIONS}
+    return {rendition: default_storage.url(f"{match['base']}/{rendition}.webp") for rendition, _ in RENDITIONS}
+
+
+def rendition_url(image_field, rendition):
+    urls = rendition_urls(image_field)
+    return urls[rendition] if urls else None
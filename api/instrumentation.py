@@ -0,0 +1,92 @@
+import time
+import heapq
+import resource
+from collections import Counter
+from django.db import DEFAULT_DB_ALIAS, connections
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def peak_rss_mb():
+    """High-water mark of this process' resident memory, in MB (Linux reports ru_maxrss in KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class QueryCounter:
+    """
+    Counts the queries run on a database connection while active.
+
+        with QueryCounter() as queries:
+            ...
+        print(queries.count, queries.rows_written, queries.time)
+
+    With record_statements, it also counts how often each SQL statement ran (ignoring
+    parameters, so an N+1 loop shows up as one statement run N times) and keeps the
+    `slowest` statements with their durations.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, record_statements=False, slowest=5):
+        self.using = using
+        self.count = 0
+        self.rows_written = 0
+        self.time = 0.0
+        self.record_statements = record_statements
+        self.statements = Counter()
+        self.slowest_size = slowest
+        self._slowest = []  # Min-heap of (duration, sequence, sql)
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.time += duration
+            self.count += 1
+            if sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+                self.rows_written += self.written_rows(sql, params, many, context["cursor"])
+            if self.record_statements:
+                self.statements[sql] += 1
+                entry = (duration, self.count, sql)
+                if len(self._slowest) < self.slowest_size:
+                    heapq.heappush(self._slowest, entry)
+                elif duration > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, entry)
+
+    @property
+    def duplicates(self):
+        """Queries that repeated a statement already run, the usual sign of an N+1 loop."""
+        return sum(n - 1 for n in self.statements.values())
+
+    @property
+    def slowest(self):
+        """[(duration, sql)], slowest first."""
+        return [(duration, sql) for duration, _, sql in sorted(self._slowest, reverse=True)]
+
+    def written_rows(self, sql, params, many, cursor):
+        rowcount = getattr(cursor, "rowcount", -1)
+        if rowcount is not None and rowcount > 1:
+            return rowcount
+        # Some drivers (SQLite with RETURNING) don't report a rowcount for multi row INSERTs
+        head, values, _ = sql.upper().partition(" VALUES ")
+        if head.lstrip().startswith("INSERT") and values:
+            rows = len(params) if many else 1
+            return rows * max(sql[len(head):].count("("), 1)
+        return max(rowcount or 0, 0)
+
+    def __enter__(self):
+        self._wrapper = connections[self.using].execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+        self._wrapper = None
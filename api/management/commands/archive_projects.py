@@ -0,0 +1,75 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.archive import archive_pairs, move_rows, restore_project
+from api.models import ProjectModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the raw observations, impressions and QR codes of closed projects into the compressed archive "
+        "tables, so the hot tables only hold running projects. Session and impression analytics stay in place, and "
+        "so does what the project list shows. The rows are moved back when someone opens one of the project's detail "
+        "views, or with --restore."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=settings.ARCHIVE_PROJECTS_AFTER_DAYS,
+            help="Archive projects that ended at least this many days ago",
+        )
+        parser.add_argument("--project-ids", help="Comma separated projects to archive (or restore), regardless of age")
+        parser.add_argument("--restore", action="store_true", help="Move archived rows back into the hot tables")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows moved per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Only list the projects and row counts")
+
+    def handle(self, *args, **options):
+        # Cold stored projects have no rows left in either table
+        projects = ProjectModel.objects.filter(archived_at__isnull=not options["restore"], cold_stored_at__isnull=True)
+        if options["project_ids"]:
+            projects = projects.filter(id__in=options["project_ids"].split(","))
+        elif options["restore"]:
+            raise CommandError("--restore needs --project-ids.")
+        else:
+            now = timezone.now()
+            projects = projects.filter(end_datetime__lt=now - timedelta(days=options["older_than_days"])).exclude(
+                # Someone looked at these recently, don't send them straight back
+                archive_restored_at__gte=now - timedelta(days=settings.ARCHIVE_KEEP_RESTORED_DAYS)
+            )
+
+        projects = list(projects.order_by("id"))
+        if not projects:
+            self.stdout.write("No projects to " + ("restore." if options["restore"] else "archive."))
+            return
+
+        for project in projects:
+            self.stdout.write(f"Project {project.id} ({project.name}, ended {project.end_datetime:%Y-%m-%d}):")
+            if options["dry_run"]:
+                for hot, archive in archive_pairs():
+                    source = archive if options["restore"] else hot
+                    self.stdout.write(f"  {source.__name__}: {source.objects.filter(project_id=project.id).count()} rows")
+                continue
+
+            if options["restore"]:
+                for table, rows in restore_project(project.id, options["chunk_size"]).items():
+                    self.stdout.write(f"  {table}: {rows} rows")
+                continue
+
+            # The project list reads raw rows for these, keep what it shows now
+            from api.views import project_list_raw_analytics
+            summary = project_list_raw_analytics(project)
+            for hot, archive in archive_pairs():
+                moved = move_rows(hot, archive, project.id, options["chunk_size"])
+                self.stdout.write(f"  {hot.__name__} -> {archive.__name__}: {moved} rows")
+
+            project.archived_at = timezone.now()
+            project.archive_summary = summary
+            project.save(update_fields=["archived_at", "archive_summary"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done! {'Restored' if options['restore'] else 'Archived'} {len(projects)} projects"
+            + (" (dry run)" if options["dry_run"] else "")
+        ))
@@ -4,15 +4,30 @@ import uuid
 import subprocess
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from api.models import SessionModel, SummaryModel, UserModel
+from api.models import SessionModel, SummaryModel, UserModel, TranscriptSentenceModel
 from django.core.files.storage import default_storage
 
 import boto3
-from deepgram import DeepgramClient, PrerecordedOptions
-from openai import OpenAI
+from api.transcription import transcribe_audio, summarize_transcript
 
 from imageio_ffmpeg import get_ffmpeg_exe
 
+BATCH_PROMPT_TEMPLATE = """
+            You are an assistant that outputs only HTML. Use <h2> or <h3> for headings, <p> for paragraphs, <strong> for bold, <em> for italic, and <ul><li> for bullet lists. Do not include any extra text or code blocks. 
+
+            Here's the content to format:
+            - Title: Project Overview
+            - Sections:
+            1. Goals: Describe the goals in 2-3 sentences.
+            2. Features: List key features as bullet points: user auth, data export, notifications or anything else.
+            3. Notes: Emphasize any special considerations in bold or italic.
+
+            Generate the HTML for this content.
+            
+            Here's the transcript to format into HTML:
+            {chunk}
+        """.strip()
+
 
 class Command(BaseCommand):
     help = "Process sessions missing audio/transcripts/sentences"
@@ -26,7 +41,7 @@ class Command(BaseCommand):
             return
 
         for session in sessions:
-            if session.audio_url and session.transcript and session.sentences:
+            if session.audio_url and session.transcript and session.transcript_sentences.exists():
                 continue  # Skip already processed
 
             print(f"Processing session {session.id}")
@@ -70,35 +85,13 @@ class Command(BaseCommand):
                 audio_url = f"https://{bucket_name}.s3.amazonaws.com/{s3_audio_key}"
                 session.audio_url = audio_url
 
-                # Transcribe audio
-                dg_client = DeepgramClient(os.environ["DEEPGRAM_API_KEY"])
-                options = PrerecordedOptions(
-                    model="nova-3",
-                    language="en",
-                    smart_format=True,
-                )
-
-                source = {"url": audio_url}
-                response = dg_client.listen.prerecorded.v("1").transcribe_url(source, options)
-
-                all_sentences = []
-                paragraphs = response['results']['channels'][0]['alternatives'][0]['paragraphs']['paragraphs']
-                index = 0
-                for para in paragraphs:
-                    for sentence in para['sentences']:
-                        all_sentences.append({
-                            "id": index,
-                            "text": sentence['text'],
-                            "start": sentence['start'],
-                            "end": sentence['end']
-                        })
-                        index += 1
-                transcript = response['results']['channels'][0]['alternatives'][0]['transcript']
+                # Transcribe audio (served from the processing cache when this audio was seen before)
+                transcript, all_sentences = transcribe_audio(audio_url, audio_path)
 
                 session.transcript = transcript
-                session.sentences = all_sentences
+                TranscriptSentenceModel.objects.replace_for_session(session, all_sentences)
 
-                summary = self.summarize_transcript(transcript)
+                summary = summarize_transcript(transcript, None, prompt_template=BATCH_PROMPT_TEMPLATE)
 
                 SummaryModel.objects.update_or_create(
                     session=session,
@@ -117,55 +110,3 @@ class Command(BaseCommand):
 
             except Exception as e:
                 print(f"Failed to process session {session.id}: {e}")
-
-    def split_transcript(self, transcript, max_chars=8000):
-        sentences = transcript.split('. ')
-        chunks = []
-        current = ''
-        for sentence in sentences:
-            sentence += '. '
-            if len(current) + len(sentence) <= max_chars:
-                current += sentence
-            else:
-                chunks.append(current.strip())
-                current = sentence
-        if current:
-            chunks.append(current.strip())
-        return chunks
-
-    def summarize_transcript(self, transcript):
-        client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
-        prompt_template = """
-            You are an assistant that outputs only HTML. Use <h2> or <h3> for headings, <p> for paragraphs, <strong> for bold, <em> for italic, and <ul><li> for bullet lists. Do not include any extra text or code blocks. 
-
-            Here's the content to format:
-            - Title: Project Overview
-            - Sections:
-            1. Goals: Describe the goals in 2-3 sentences.
-            2. Features: List key features as bullet points: user auth, data export, notifications or anything else.
-            3. Notes: Emphasize any special considerations in bold or italic.
-
-            Generate the HTML for this content.
-            
-            Here's the transcript to format into HTML:
-            {chunk}
-        """.strip()
-
-        try:
-            chunks = self.split_transcript(transcript)
-            summaries = []
-
-            for i, chunk in enumerate(chunks):
-                print(f"🧠 Summarizing chunk {i + 1}/{len(chunks)}...")
-                prompt = prompt_template.format(chunk=chunk)
-
-                response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                summaries.append(response.choices[0].message.content)
-
-            return "\n\n".join(summaries)
-
-        except Exception as e:
-            raise RuntimeError(f"OpenAI summarization failed: {e}")
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import contextlib
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connection
+from django.test.utils import override_settings
+from api import sync_telemetry as telemetry
+from api import zenus
+from api.fake_zenus import FakeZenusServer, add_scale_arguments, data_from_options
+from api.instrumentation import QueryCounter, peak_rss_mb
+from api.management.commands import sync_zenus_data
+from api.models import ProjectModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the Zenus sync against the local fake Zenus server and report wall time, queries, "
+        "rows written per second, rows actually changed and peak RSS for every sync and calculate step."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="Use an already running (fake) Zenus API instead of starting one")
+        parser.add_argument("--runs", type=int, default=2, help="Sync runs; the first creates rows, later ones re-sync them")
+        parser.add_argument("--keepdb", action="store_true", help="Keep the benchmark database afterwards")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+        parser.add_argument("--show-sync-output", action="store_true", help="Don't silence the sync's own prints")
+        add_scale_arguments(parser)
+
+    def handle(self, *args, **options):
+        server = None
+        url = options["url"]
+        if not url:
+            server = FakeZenusServer(("127.0.0.1", 0), data_from_options(options))
+            server.start_in_thread()
+            url = server.url
+
+        # Never write synthetic projects into the real database
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+
+        # One account, with the first configured key for an --url that checks it (the fake server doesn't)
+        api_key = next(iter(settings.ZENUS_ACCOUNTS.values()), "benchmark")
+        try:
+            with override_settings(ZENUS_API_URL=url, ZENUS_ACCOUNTS={"benchmark": api_key}):
+                results = [self.run_sync(run, options) for run in range(1, options["runs"] + 1)]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+            if server:
+                server.shutdown()
+                server.server_close()
+
+        for run, steps in enumerate(results, start=1):
+            self.report(run, steps)
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump({"url": url, "runs": results}, f, indent=2)
+            self.stdout.write(f"Results written to {options['json_path']}")
+
+        self.stdout.write(self.style.SUCCESS("Done!"))
+
+    def measure(self, steps, name, options, func, *args, **kwargs):
+        with contextlib.ExitStack() as stack:
+            if not options["show_sync_output"]:
+                # The sync prints a summary line per step, which would clutter the table
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            queries = stack.enter_context(QueryCounter())
+            metrics = stack.enter_context(telemetry.step(name))
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            seconds = time.perf_counter() - start
+
+        step = steps[name]
+        step["calls"] += 1
+        step["seconds"] += seconds
+        step["queries"] += queries.count
+        step["query_seconds"] += queries.time
+        step["rows_written"] += queries.rows_written
+        step["changed"] += metrics.counts["created"] + metrics.counts["updated"]
+        step["unchanged"] += metrics.counts["skipped"]
+        step["not_modified"] += metrics.counts["not_modified"]
+        step["peak_rss_mb"] = max(step["peak_rss_mb"], peak_rss_mb())
+        return result
+
+    def run_sync(self, run, options):
+        steps = defaultdict(lambda: {
+            "calls": 0, "seconds": 0.0, "queries": 0, "query_seconds": 0.0, "rows_written": 0, "peak_rss_mb": 0.0,
+            "changed": 0, "unchanged": 0, "not_modified": 0,
+        })
+        self.stdout.write(f"Run {run}: syncing...")
+
+        client = zenus.get_client("benchmark")
+        projects = self.measure(steps, "sync_project_list", options, sync_zenus_data.sync_project_list, client) or []
+        for project_data in projects:
+            project = ProjectModel.objects.get(id=project_data["id"])
+            for name, step, kwargs in sync_zenus_data.SYNC_STEPS:
+                self.measure(steps, name, options, step, project, **kwargs)
+
+        return dict(steps)
+
+    def report(self, run, steps):
+        header = (
+            f"{'step':<42} {'calls':>5} {'seconds':>9} {'queries':>8} {'rows':>8} {'rows/s':>9} "
+            f"{'changed':>8} {'same':>8} {'304':>5} {'peak MB':>8}"
+        )
+        self.stdout.write(f"\nRun {run}")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+
+        totals = {"seconds": 0.0, "queries": 0, "rows_written": 0, "changed": 0, "unchanged": 0, "not_modified": 0}
+        for name, step in steps.items():
+            rows_per_second = step["rows_written"] / step["seconds"] if step["seconds"] else 0
+            self.stdout.write(
+                f"{name:<42} {step['calls']:>5} {step['seconds']:>9.2f} {step['queries']:>8} "
+                f"{step['rows_written']:>8} {rows_per_second:>9.0f} {step['changed']:>8} {step['unchanged']:>8} "
+                f"{step['not_modified']:>5} {step['peak_rss_mb']:>8.1f}"
+            )
+            for key in totals:
+                totals[key] += step[key]
+
+        self.stdout.write("-" * len(header))
+        rows_per_second = totals["rows_written"] / totals["seconds"] if totals["seconds"] else 0
+        self.stdout.write(
+            f"{'total':<42} {'':>5} {totals['seconds']:>9.2f} {totals['queries']:>8} "
+            f"{totals['rows_written']:>8} {rows_per_second:>9.0f} {totals['changed']:>8} {totals['unchanged']:>8} "
+            f"{totals['not_modified']:>5} {peak_rss_mb():>8.1f}"
+        )
@@ -0,0 +1,108 @@
+import time
+import uuid
+import random
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from api import token_blacklist
+from api.instrumentation import QueryCounter, percentile
+from api.models import UserModel
+from api.serializers import ClaimsTokenRefreshSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure refresh token latency and queries against growing outstanding/blacklisted token tables, "
+        "with the blacklist Bloom filter off and on. Runs in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="0,10000,100000", help="Comma separated outstanding token counts")
+        parser.add_argument("--refreshes", type=int, default=200, help="Refreshes timed per size and mode")
+        parser.add_argument(
+            "--modes",
+            default="off,memory",
+            help="Comma separated JWT_BLACKLIST_BLOOM values to compare (redis needs REDIS_URL)",
+        )
+        parser.add_argument("--keepdb", action="store_true", help="Keep the benchmark database afterwards")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options["sizes"].split(","))
+        except ValueError:
+            raise CommandError("--sizes must be comma separated numbers.")
+        modes = options["modes"].split(",")
+
+        # Never fill the real token tables with synthetic rows
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            user = UserModel.objects.create_user("benchmark", "benchmark@example.com", "benchmark-password")
+            results = []
+            for size in sizes:
+                self.grow_tables(size)
+                for mode in modes:
+                    results.append((size, mode, self.run_refreshes(user, mode, options["refreshes"])))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+
+        header = f"{'tokens':>10} {'bloom':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'queries':>8}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for size, mode, result in results:
+            self.stdout.write(
+                f"{size:>10} {mode:>7} {result['p50']:>8.2f} {result['p95']:>8.2f} {result['max']:>8.2f} "
+                f"{result['queries']:>8.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS("Done!"))
+
+    def grow_tables(self, size):
+        """Add synthetic tokens until there are `size`: half of them blacklisted, a third expired."""
+        existing = OutstandingToken.objects.count()
+        if existing >= size:
+            return
+        self.stdout.write(f"Adding {size - existing} tokens...")
+        now = timezone.now()
+        next_id = (OutstandingToken.objects.aggregate(max_id=Max("id"))["max_id"] or 0) + 1
+        for start in range(existing, size, 5000):
+            tokens = []
+            for offset in range(min(5000, size - start)):
+                tokens.append(OutstandingToken(
+                    id=next_id,
+                    jti=uuid.uuid4().hex,
+                    token="",
+                    created_at=now,
+                    expires_at=now + timedelta(hours=random.uniform(-72, 7 * 24)),
+                ))
+                next_id += 1
+            OutstandingToken.objects.bulk_create(tokens)
+            BlacklistedToken.objects.bulk_create([BlacklistedToken(token_id=token.id) for token in tokens[::2]])
+
+    def run_refreshes(self, user, mode, refreshes):
+        token_blacklist._filter = None
+        durations = []
+        query_count = 0
+        with override_settings(JWT_BLACKLIST_BLOOM=mode):
+            refresh = str(token_blacklist.FilteredRefreshToken.for_user(user))
+            # One untimed refresh loads the filter
+            for index in range(refreshes + 1):
+                with QueryCounter() as queries:
+                    start = time.perf_counter()
+                    serializer = ClaimsTokenRefreshSerializer(data={"refresh": refresh})
+                    serializer.is_valid(raise_exception=True)
+                    duration = time.perf_counter() - start
+                if index:
+                    durations.append(duration * 1000)
+                    query_count += queries.count
+                refresh = serializer.validated_data["refresh"]
+        token_blacklist._filter = None
+        return {
+            "p50": percentile(durations, 50),
+            "p95": percentile(durations, 95),
+            "max": max(durations),
+            "queries": query_count / refreshes,
+        }
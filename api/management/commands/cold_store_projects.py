@@ -0,0 +1,84 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.archive import archive_pairs, restore_project
+from api.cold_storage import export_project, rehydrate_project
+from api.models import ProjectModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the raw observations, impressions and QR codes of long closed projects to compressed columnar "
+        "files in cold storage and delete them from the database. Session and impression analytics stay in place. "
+        "The rows are loaded back when someone opens one of the project's detail views, or with --rehydrate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=settings.COLD_STORAGE_AFTER_DAYS,
+            help="Export projects that ended at least this many days ago",
+        )
+        parser.add_argument("--project-ids", help="Comma separated projects to export (or rehydrate), regardless of age")
+        parser.add_argument("--rehydrate", action="store_true", help="Load the rows back into the hot tables")
+        parser.add_argument("--format", choices=["json", "parquet"], help="File format, defaults to COLD_STORAGE['FORMAT']")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per row group and per delete")
+        parser.add_argument("--dry-run", action="store_true", help="Only list the projects and row counts")
+
+    def handle(self, *args, **options):
+        projects = ProjectModel.objects.filter(cold_stored_at__isnull=not options["rehydrate"])
+        if options["project_ids"]:
+            projects = projects.filter(id__in=options["project_ids"].split(","))
+        elif options["rehydrate"]:
+            raise CommandError("--rehydrate needs --project-ids.")
+        else:
+            now = timezone.now()
+            projects = projects.filter(end_datetime__lt=now - timedelta(days=options["older_than_days"])).exclude(
+                # Someone looked at these recently, don't send them straight back
+                cold_storage_files__rehydrated_at__gte=now - timedelta(days=settings.COLD_STORAGE_KEEP_REHYDRATED_DAYS)
+            )
+
+        projects = list(projects.distinct().order_by("id"))
+        if not projects:
+            self.stdout.write("No projects to " + ("rehydrate." if options["rehydrate"] else "export."))
+            return
+
+        for project in projects:
+            self.stdout.write(f"Project {project.id} ({project.name}, ended {project.end_datetime:%Y-%m-%d}):")
+            if options["dry_run"]:
+                for hot, archive in archive_pairs():
+                    if options["rehydrate"]:
+                        manifest = project.cold_storage_files.filter(table=hot._meta.db_table).first()
+                        rows = manifest.rows if manifest else 0
+                    else:
+                        rows = sum(model.objects.filter(project_id=project.id).count() for model in (hot, archive))
+                    self.stdout.write(f"  {hot._meta.db_table}: {rows} rows")
+                continue
+
+            if options["rehydrate"]:
+                counts = rehydrate_project(project.id, options["chunk_size"])
+            else:
+                # The project list reads raw rows for these, keep what it shows now
+                if project.archived_at and project.archive_summary:
+                    # The hot tables are empty, it was computed before archiving
+                    summary = project.archive_summary
+                else:
+                    from api.views import project_list_raw_analytics
+                    # Archived without a summary: compute it from the rows, moved back for that
+                    restore_project(project.id, options["chunk_size"])
+                    summary = project_list_raw_analytics(project)
+                counts = export_project(
+                    project,
+                    chunk_size=options["chunk_size"],
+                    summary=summary,
+                    file_format=options["format"],
+                )
+            for table, rows in counts.items():
+                self.stdout.write(f"  {table}: {rows} rows")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done! {'Rehydrated' if options['rehydrate'] else 'Exported'} {len(projects)} projects"
+            + (" (dry run)" if options["dry_run"] else "")
+        ))
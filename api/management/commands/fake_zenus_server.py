@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from api.fake_zenus import FakeZenusServer, add_scale_arguments, data_from_options
+
+
+class Command(BaseCommand):
+    help = "Serve synthetic Zenus API data locally, for benchmarking and developing the sync without the real API."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        add_scale_arguments(parser)
+
+    def handle(self, *args, **options):
+        data = data_from_options(options)
+        server = FakeZenusServer((options["host"], options["port"]), data)
+
+        self.stdout.write(f"Serving {len(data.project_ids)} synthetic projects ({data.project_ids[0]}-{data.project_ids[-1]})")
+        self.stdout.write(self.style.SUCCESS(f"Point the sync at it with ZENUS_API_URL={server.url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import bisect
+import contextlib
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from api.fake_zenus import add_scale_arguments, data_from_options, iso
+from api.management.commands.sync_zenus_data import (
+    calculate_and_save_analytics,
+    calculate_impression_analytics,
+    calculate_project_qr_codes,
+    calculate_qr_code_dwell_time,
+)
+from api.models import *
+
+
+def to_json(value):
+    # Assignments and operating hours are stored the way the Zenus API returns them, with string dates
+    return json.loads(json.dumps(value, default=iso))
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk insert a large synthetic dataset (projects, sessions, observations, impressions, unique impressions "
+        "and QR codes) with realistic time and device distributions, for profiling the analytics endpoints."
+    )
+
+    def add_arguments(self, parser):
+        add_scale_arguments(parser)
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per INSERT statement and transaction")
+        parser.add_argument("--replace", action="store_true", help="Delete synthetic projects with the same ids first")
+        parser.add_argument(
+            "--with-analytics",
+            action="store_true",
+            help="Also run the sync's calculate_* steps so the analytics tables are populated",
+        )
+
+    def handle(self, *args, **options):
+        data = data_from_options(options)
+
+        existing = ProjectModel.objects.filter(id__in=data.project_ids)
+        if existing.exists():
+            if not options["replace"]:
+                raise CommandError(
+                    f"Projects {data.project_ids[0]}-{data.project_ids[-1]} already exist, "
+                    "use --replace or a different --first-project-id."
+                )
+            self.stdout.write("Deleting existing synthetic projects...")
+            existing.delete()
+
+        self.tz = timezone.get_current_timezone()
+        started = time.perf_counter()
+        for project_id in data.project_ids:
+            self.generate_project(data, project_id, options)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done! Generated {len(data.project_ids)} projects in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def aware(self, value):
+        # Much cheaper than make_aware for millions of rows; the synthetic data has no DST gaps to handle
+        return value.replace(tzinfo=self.tz)
+
+    def bulk_insert(self, model, objects, batch_size):
+        """Insert objects from an iterator in batches, one transaction per batch, without holding them all."""
+        count = 0
+        started = time.perf_counter()
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=batch_size)
+            count += len(batch)
+
+        seconds = time.perf_counter() - started
+        rate = count / seconds if seconds else 0
+        self.stdout.write(f"  {model.__name__}: {count} rows in {seconds:.1f}s ({rate:.0f} rows/s)")
+        return count
+
+    def generate_project(self, data, project_id, options):
+        batch_size = options["batch_size"]
+        project_data = data.project(project_id)
+        self.stdout.write(f"Project {project_id}: {project_data['name']}")
+
+        project = ProjectModel.objects.create(
+            id=project_id,
+            name=project_data["name"],
+            start_datetime=self.aware(project_data["start_datetime"]),
+            end_datetime=self.aware(project_data["end_datetime"]),
+            deployment_timezone=project_data["deployment_timezone"],
+            services=project_data["services"],
+            country=project_data["country"],
+            city=project_data["city"],
+            type=["obs", "imp", "qr"],
+            is_ready=True,
+            is_active=True,
+        )
+
+        # Structure: stages and their sessions, booths and devices
+        stages = data.stage_list(project_id)
+        ProjectStageModel.objects.bulk_create([
+            ProjectStageModel(id=stage["id"], name=stage["name"], project=project, type="obs")
+            for stage in stages
+        ])
+        self.bulk_insert(SessionModel, (
+            SessionModel(
+                name=session["name"],
+                start_datetime=self.aware(session["start_datetime"]),
+                end_datetime=self.aware(session["end_datetime"]),
+                project=project,
+                project_stage_id=stage["id"],
+            )
+            for stage in stages
+            for session in stage["sessions"]
+        ), batch_size)
+
+        self.bulk_insert(ProjectBoothModel, (
+            ProjectBoothModel(
+                booth_id=booth["id"],
+                name=booth["name"],
+                size=booth["size"],
+                project=project,
+                operating_hours=to_json(booth["operating_hours"]),
+            )
+            for booth in data.booth_list(project_id)
+        ), batch_size)
+
+        devices = data.device_list(project_id)
+        self.bulk_insert(ProjectDeviceModel, (
+            ProjectDeviceModel(
+                device_id=device["id"],
+                name=device["name"],
+                service=device["service"],
+                project=project,
+                assignments=to_json(device["assignments"]),
+            )
+            for device in devices
+        ), batch_size)
+
+        # bulk_create doesn't return primary keys on MySQL, so read them back for the lookups below
+        sessions_by_stage = {}
+        for session in SessionModel.objects.filter(project=project).order_by("start_datetime").values(
+            "id", "project_stage_id", "start_datetime", "end_datetime"
+        ):
+            sessions_by_stage.setdefault(session["project_stage_id"], []).append(session)
+        session_starts = {
+            stage_id: [s["start_datetime"] for s in sessions] for stage_id, sessions in sessions_by_stage.items()
+        }
+        booth_pks = dict(ProjectBoothModel.objects.filter(project=project).values_list("booth_id", "id"))
+
+        # Every synthetic device keeps the same area on all show days
+        device_areas = {device["id"]: device["assignments"][0]["areas"][0] for device in devices}
+
+        def session_id(device_id, value):
+            area = device_areas[device_id]
+            if area["type"] != "stages":
+                return None
+            sessions = sessions_by_stage.get(area["id"], [])
+            index = bisect.bisect_right(session_starts.get(area["id"], []), value) - 1
+            if index >= 0 and sessions[index]["end_datetime"] >= value:
+                return sessions[index]["id"]
+            return None
+
+        def booth_id(device_id):
+            area = device_areas[device_id]
+            return booth_pks.get(area["id"]) if area["type"] == "booths" else None
+
+        # Raw data
+        def observations():
+            for obs in data.iter_observations(project_id):
+                value = self.aware(obs.pop("datetime"))
+                yield ObservationModel(
+                    project=project, session_id=session_id(obs["device_id"], value), datetime=value, **obs
+                )
+
+        def impressions():
+            for impression in data.iter_impressions(project_id):
+                yield ImpressionModel(
+                    project=project,
+                    booth_id=booth_id(impression["device_id"]),
+                    latest_datetime=self.aware(impression.pop("latest_datetime")),
+                    **impression,
+                )
+
+        def unique_impressions():
+            for impression in data.iter_unique_impressions(project_id):
+                yield UniqueImpressionModel(
+                    project=project,
+                    booth_id=booth_id(impression["device_id"]),
+                    date=impression.pop("date").date(),
+                    **impression,
+                )
+
+        def qr_codes():
+            for qr in data.iter_qr_codes(project_id):
+                value = self.aware(qr.pop("datetime"))
+                yield QrCodeModel(
+                    project=project, session_id=session_id(qr["device_id"], value), datetime=value, **qr
+                )
+
+        self.bulk_insert(ObservationModel, observations(), batch_size)
+        self.bulk_insert(ImpressionModel, impressions(), batch_size)
+        self.bulk_insert(UniqueImpressionModel, unique_impressions(), batch_size)
+        self.bulk_insert(QrCodeModel, qr_codes(), batch_size)
+
+        if options["with_analytics"]:
+            started = time.perf_counter()
+            # The calculate_* steps print a summary line per project
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                calculate_and_save_analytics(project)
+                calculate_impression_analytics(project, zone="internal")
+                calculate_impression_analytics(project, zone="aisle")
+                calculate_qr_code_dwell_time(project)
+                calculate_project_qr_codes(project)
+            self.stdout.write(f"  Analytics calculated in {time.perf_counter() - started:.1f}s")
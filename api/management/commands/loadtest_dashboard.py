@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from api.instrumentation import QueryCounter, percentile
+from api.models import ProjectBoothModel, ProjectModel, SessionAnalyticsModel, SessionModel, UserModel
+from api.serializers import LoginSerializer
+
+LOADTEST_USER_EMAIL = "loadtest@example.com"
+LOADTEST_REVIEWER_EMAIL = "loadtest-reviewer@example.com"
+DEFAULT_BASELINE_PATH = os.path.join(settings.BASE_DIR, "loadtest_baselines.json")
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the dashboard API endpoints in process against the current (seeded) database. "
+        "Reports p50/p95/p99 latency, throughput and SQL queries per endpoint, for a staff user and for a "
+        "reviewer assigned to the projects, and fails on regressions against stored baselines."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients (threads)")
+        parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint")
+        parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests per endpoint")
+        parser.add_argument("--sessions", type=int, default=10, help="Session ids sent to the multi-session endpoints")
+        parser.add_argument("--project-ids", help="Comma separated projects to use (defaults to all active projects)")
+        parser.add_argument("--endpoint", action="append", help="Only run these endpoints (repeatable)")
+        parser.add_argument(
+            "--as",
+            dest="users",
+            choices=["staff", "reviewer", "both"],
+            default="both",
+            help="Who sends the requests: staff sees every project, the reviewer only its assigned ones",
+        )
+        parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="Baseline JSON file")
+        parser.add_argument("--update-baseline", action="store_true", help="Store this run as the new baseline")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.25,
+            help="Allowed relative p95 latency and throughput change before a run counts as a regression",
+        )
+
+    def handle(self, *args, **options):
+        projects = ProjectModel.objects.filter(is_active=True)
+        if options["project_ids"]:
+            projects = ProjectModel.objects.filter(id__in=options["project_ids"].split(","))
+        project_ids = list(projects.values_list("id", flat=True))
+        if not project_ids:
+            raise CommandError("No projects to test against, seed the database with generate_load_data first.")
+
+        endpoints = self.build_endpoints(project_ids, options)
+        if options["endpoint"]:
+            endpoints = {name: endpoint for name, endpoint in endpoints.items() if name in options["endpoint"]}
+            if not endpoints:
+                raise CommandError(f"Unknown endpoint, choose from: {', '.join(self.build_endpoints(project_ids, options))}")
+
+        tokens = self.user_tokens(project_ids, options["users"])
+
+        results = {}
+        for suffix, token in tokens.items():
+            for name, endpoint in endpoints.items():
+                results[name + suffix] = self.run_endpoint(endpoint, token, options)
+                self.report(name + suffix, results[name + suffix])
+
+        if options["update_baseline"]:
+            with open(options["baseline"], "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+
+        if not os.path.exists(options["baseline"]):
+            self.stdout.write(self.style.WARNING(
+                f"No baseline at {options['baseline']}, run with --update-baseline to store one."
+            ))
+            return
+
+        with open(options["baseline"]) as f:
+            baseline = json.load(f)
+        regressions = self.compare(results, baseline, options["threshold"])
+        if regressions:
+            raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Done! No regressions against the baseline."))
+
+    def user_tokens(self, project_ids, users):
+        """
+        Return {result name suffix: access token}. Tokens are minted like a login's, claims included,
+        so requests take the same authentication and project scoping path as real ones.
+        """
+        tokens = {}
+        if users in ("staff", "both"):
+            staff, _ = UserModel.objects.get_or_create(
+                email=LOADTEST_USER_EMAIL, defaults={"username": "loadtest", "is_staff": True}
+            )
+            tokens[""] = str(LoginSerializer.get_token(staff).access_token)
+        if users in ("reviewer", "both"):
+            reviewer, _ = UserModel.objects.get_or_create(
+                email=LOADTEST_REVIEWER_EMAIL, defaults={"username": "loadtest-reviewer", "is_reviewer": True}
+            )
+            reviewer.assigned_projects.set(project_ids)
+            tokens[" as reviewer"] = str(LoginSerializer.get_token(reviewer).access_token)
+        return tokens
+
+    def build_endpoints(self, project_ids, options):
+        """Return {name: (method, path, body)} for the dashboard endpoints, filled with seeded ids."""
+        session_ids = list(
+            SessionAnalyticsModel.objects.filter(project_id__in=project_ids, session__isnull=False)
+            .order_by("session_id")
+            .values_list("session_id", flat=True)[:options["sessions"]]
+        ) or list(
+            SessionModel.objects.filter(project_id__in=project_ids).order_by("id").values_list("id", flat=True)[:options["sessions"]]
+        )
+        if not session_ids:
+            raise CommandError("The selected projects have no sessions.")
+        booth_ids = list(
+            ProjectBoothModel.objects.filter(project_id=project_ids[0]).order_by("id").values_list("id", flat=True)
+        )
+
+        return {
+            "analytics-projects": ("get", reverse("user-analytics-project-list"), None),
+            "impression-detail-analytics": (
+                "get", f"{reverse('impression-detail-analytics')}?booth_ids={','.join(map(str, booth_ids))}", None,
+            ),
+            "qr-analytics-list": ("post", reverse("qr-analytics-list"), {"session_ids": session_ids}),
+            "observations-by-session": (
+                "get", reverse("observations-by-session", kwargs={"session_id": session_ids[0]}), None,
+            ),
+            "session-analytics-list": ("post", reverse("session-analytics-list"), {"session_ids": session_ids}),
+        }
+
+    def run_endpoint(self, endpoint, token, options):
+        method, path, body = endpoint
+        latencies = []
+        queries = []
+        errors = []
+        lock = threading.Lock()
+        remaining = [options["requests"]]
+
+        def request(client):
+            kwargs = {"data": json.dumps(body), "content_type": "application/json"} if body is not None else {}
+            with QueryCounter() as counter:
+                start = time.perf_counter()
+                response = getattr(client, method)(path, **kwargs)
+                elapsed = time.perf_counter() - start
+            return response.status_code, elapsed, counter.count
+
+        def worker():
+            # ALLOWED_HOSTS doesn't contain the test client's default "testserver"
+            client = Client(HTTP_HOST="localhost", HTTP_AUTHORIZATION=f"Bearer {token}")
+            try:
+                while True:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                    status_code, elapsed, query_count = request(client)
+                    with lock:
+                        latencies.append(elapsed)
+                        queries.append(query_count)
+                        if status_code >= 400:
+                            errors.append(status_code)
+            finally:
+                connection.close()  # Each thread opened its own connection
+
+        warmup_client = Client(HTTP_HOST="localhost", HTTP_AUTHORIZATION=f"Bearer {token}")
+        for _ in range(options["warmup"]):
+            request(warmup_client)
+
+        threads = [threading.Thread(target=worker) for _ in range(options["concurrency"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - started
+
+        return {
+            "requests": len(latencies),
+            "errors": len(errors),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "throughput_rps": len(latencies) / wall_time if wall_time else 0,
+            "queries_per_request": max(queries),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<42} p50 {result['p50_ms']:>8.1f}ms  p95 {result['p95_ms']:>8.1f}ms  "
+            f"p99 {result['p99_ms']:>8.1f}ms  {result['throughput_rps']:>7.1f} req/s  "
+            f"{result['queries_per_request']:>5} queries  {result['errors']} errors"
+        )
+
+    def compare(self, results, baseline, threshold):
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            base = baseline[name]
+            if result["errors"] > base["errors"]:
+                regressions.append(f"{name}: {result['errors']} errors (baseline {base['errors']})")
+            if result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+                regressions.append(f"{name}: p95 {result['p95_ms']:.1f}ms (baseline {base['p95_ms']:.1f}ms)")
+            if result["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+                regressions.append(
+                    f"{name}: {result['throughput_rps']:.1f} req/s (baseline {base['throughput_rps']:.1f} req/s)"
+                )
+            # Query counts don't depend on the machine, so any increase is a regression
+            if result["queries_per_request"] > base["queries_per_request"]:
+                regressions.append(
+                    f"{name}: {result['queries_per_request']} queries per request "
+                    f"(baseline {base['queries_per_request']})"
+                )
+        return regressions
@@ -0,0 +1,172 @@
+import json
+import time
+import uuid
+import asyncio
+import tracemalloc
+from urllib.parse import urlparse
+import websockets
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from api.instrumentation import percentile
+from api.progress import progress_group_name
+from api.routing import websocket_urlpatterns
+
+
+class LocalClient:
+    """Talks to VideoUploadProgressConsumer in this process through the channels test communicator."""
+
+    application = URLRouter(websocket_urlpatterns)
+
+    def __init__(self, path):
+        self.communicator = WebsocketCommunicator(self.application, path)
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise RuntimeError("Connection rejected.")
+
+    async def receive(self, timeout):
+        return await self.communicator.receive_from(timeout)
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class RemoteClient:
+    """Talks to a running ASGI server over a real websocket."""
+
+    def __init__(self, url, origin):
+        self.url = url
+        self.origin = origin
+        self.websocket = None
+
+    async def connect(self):
+        self.websocket = await websockets.connect(self.url, origin=self.origin, open_timeout=30)
+
+    async def receive(self, timeout):
+        return await asyncio.wait_for(self.websocket.recv(), timeout)
+
+    async def close(self):
+        await self.websocket.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many VideoUploadProgressConsumer connections, publish progress events to their job group "
+        "and report fan-out latency and memory per connection."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=1000, help="Number of websocket connections to open")
+        parser.add_argument("--messages", type=int, default=20, help="Number of progress events to publish")
+        parser.add_argument("--interval", type=float, default=0.1, help="Seconds between progress events")
+        parser.add_argument("--concurrency", type=int, default=200, help="Connections opened at the same time")
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for an event to reach a client")
+        parser.add_argument("--job-id", help="Job to subscribe to (defaults to a fresh one)")
+        parser.add_argument(
+            "--url",
+            help="Base websocket URL of a running server, e.g. ws://localhost:8000. "
+                 "Without it the consumers run in this process.",
+        )
+
+    def handle(self, *args, **options):
+        if options["url"] and isinstance(get_channel_layer(), InMemoryChannelLayer):
+            raise CommandError("--url needs a shared channel layer, set REDIS_URL to the one the server uses.")
+        asyncio.run(self.run(options))
+
+    def make_client(self, options, job_id):
+        path = f"ws/progress/{job_id}/"
+        if options["url"]:
+            base = options["url"].rstrip("/")
+            parsed = urlparse(base)
+            scheme = "https" if parsed.scheme == "wss" else "http"
+            # AllowedHostsOriginValidator rejects connections without an Origin header
+            return RemoteClient(f"{base}/{path}", f"{scheme}://{parsed.netloc}")
+        return LocalClient(f"/{path}")
+
+    async def run(self, options):
+        job_id = options["job_id"] or f"loadtest-{uuid.uuid4().hex[:8]}"
+        total = options["connections"]
+        local = not options["url"]
+
+        if local:
+            tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0] if local else 0
+
+        clients = []
+        started = time.perf_counter()
+        for i in range(0, total, options["concurrency"]):
+            batch = [self.make_client(options, job_id) for _ in range(min(options["concurrency"], total - i))]
+            await asyncio.gather(*(client.connect() for client in batch))
+            clients.extend(batch)
+        connect_seconds = time.perf_counter() - started
+
+        memory_after = tracemalloc.get_traced_memory()[0] if local else 0
+        if local:
+            tracemalloc.stop()
+
+        self.stdout.write(f"Opened {len(clients)} connections to job {job_id} in {connect_seconds:.2f}s")
+
+        channel_layer = get_channel_layer()
+        group_name = progress_group_name(job_id)
+        latencies = []
+        fan_out_times = []
+        lost = 0
+
+        async def wait_for(client, sequence, sent_at):
+            # Skip replayed state and anything older than the event being measured
+            while True:
+                try:
+                    data = json.loads(await client.receive(options["timeout"]))
+                except (asyncio.TimeoutError, TimeoutError):
+                    return None
+                if data.get("loadtest_sequence") == sequence:
+                    return time.time() - sent_at
+
+        for sequence in range(options["messages"]):
+            sent_at = time.time()
+            await channel_layer.group_send(group_name, {
+                'type': 'send_progress',
+                'job_id': job_id,
+                'stage': 'loadtest',
+                'progress': int(sequence * 100 / max(options["messages"] - 1, 1)),
+                'loadtest_sequence': sequence,
+                'sent_at': sent_at,
+            })
+            results = await asyncio.gather(*(wait_for(client, sequence, sent_at) for client in clients))
+            delivered = [r for r in results if r is not None]
+            lost += len(results) - len(delivered)
+            latencies.extend(delivered)
+            if delivered:
+                fan_out_times.append(max(delivered))
+            await asyncio.sleep(options["interval"])
+
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+        self.stdout.write(f"Channel layer: {type(channel_layer).__name__}")
+        self.stdout.write(f"Deliveries: {len(latencies)} received, {lost} lost")
+        if latencies:
+            self.stdout.write(
+                "Delivery latency: "
+                f"p50 {percentile(latencies, 50) * 1000:.1f}ms, "
+                f"p95 {percentile(latencies, 95) * 1000:.1f}ms, "
+                f"p99 {percentile(latencies, 99) * 1000:.1f}ms, "
+                f"max {max(latencies) * 1000:.1f}ms"
+            )
+            self.stdout.write(
+                f"Full fan-out (last client) per event: mean {sum(fan_out_times) / len(fan_out_times) * 1000:.1f}ms, "
+                f"max {max(fan_out_times) * 1000:.1f}ms"
+            )
+        if local:
+            per_connection = (memory_after - memory_before) / max(len(clients), 1)
+            # Includes the in-process test client, so this is an upper bound for the consumer alone
+            self.stdout.write(f"Memory per connection: {per_connection / 1024:.1f} KiB")
+        else:
+            self.stdout.write("Memory per connection is only measured in process, run without --url.")
+
+        if lost:
+            self.stdout.write(self.style.WARNING(f"{lost} deliveries timed out after {options['timeout']}s"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Done!"))
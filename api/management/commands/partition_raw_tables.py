@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from api.partitioning import SCHEMES, add_month_partitions, current_scheme, partition_table, raw_tables
+
+
+class Command(BaseCommand):
+    help = (
+        "Partition the raw observation, impression and QR code tables by project or by month (MySQL only). "
+        "With monthly partitioning already in place it adds the partitions for the coming months, run it monthly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--by",
+            choices=SCHEMES,
+            default=settings.RAW_TABLE_PARTITIONING,
+            help="Partitioning scheme (defaults to RAW_TABLE_PARTITIONING)",
+        )
+        parser.add_argument("--partitions", type=int, default=settings.RAW_TABLE_PARTITIONS, help="Partitions per table by project")
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=settings.RAW_TABLE_PARTITION_MONTHS_AHEAD,
+            help="Empty monthly partitions to keep ready",
+        )
+        parser.add_argument("--status", action="store_true", help="Only show how the tables are partitioned")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "mysql":
+            raise CommandError("Table partitioning needs MySQL.")
+
+        with connection.cursor() as cursor:
+            for table, column in raw_tables():
+                scheme = current_scheme(cursor, table)
+                if options["status"]:
+                    self.stdout.write(f"{table}: {scheme}")
+                    continue
+
+                if scheme == options["by"] == "month":
+                    added = add_month_partitions(cursor, table, options["months_ahead"])
+                    self.stdout.write(f"{table}: added partitions {', '.join(added) or 'none'}")
+                elif scheme == options["by"] == "none":
+                    self.stdout.write(f"{table}: not partitioned")
+                else:
+                    # Rebuilds the table, which takes a while on big tables
+                    self.stdout.write(f"{table}: partitioning by {options['by']} (was {scheme})...")
+                    partition_table(cursor, table, column, options["by"], options["partitions"], options["months_ahead"])
+
+        self.stdout.write(self.style.SUCCESS("Done!"))
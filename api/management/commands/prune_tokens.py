@@ -0,0 +1,37 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from api.token_blacklist import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired refresh tokens from the outstanding and blacklisted token tables in chunks. "
+        "Refresh token rotation adds rows on every refresh and nothing else removes them; run this daily (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Tokens deleted per transaction")
+        parser.add_argument(
+            "--grace-hours",
+            type=int,
+            default=0,
+            help="Keep tokens that expired less than this many hours ago",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count the tokens that would be deleted")
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(hours=options["grace_hours"])
+        expired = OutstandingToken.objects.filter(expires_at__lt=before)
+        if options["dry_run"]:
+            self.stdout.write(
+                f"{expired.count()} of {OutstandingToken.objects.count()} outstanding tokens expired, "
+                f"{BlacklistedToken.objects.filter(token__expires_at__lt=before).count()} of them blacklisted."
+            )
+            return
+
+        deleted = prune_expired_tokens(options["chunk_size"], before)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done! Deleted {deleted['outstanding']} outstanding and {deleted['blacklisted']} blacklisted tokens"
+        ))
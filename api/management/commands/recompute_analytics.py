@@ -0,0 +1,121 @@
+import os
+import time
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from api.management.commands.sync_zenus_data import (
+    plan_impression_analytics,
+    plan_project_qr_codes,
+    plan_qr_code_dwell_times,
+    plan_session_analytics,
+)
+from api.models import ProjectModel
+
+# Derived tables in the order the sync calculates them; the unique QR count doesn't depend on dwell times,
+# but keeping the sync's order means a recompute matches a full sync
+DERIVED = [
+    ("session_analytics", plan_session_analytics, {}),
+    ("impression_analytics[internal]", plan_impression_analytics, {"zone": "internal"}),
+    ("impression_analytics[aisle]", plan_impression_analytics, {"zone": "aisle"}),
+    ("qr_dwell_times", plan_qr_code_dwell_times, {}),
+    ("unique_qr_codes", plan_project_qr_codes, {}),
+]
+
+
+def recompute_project(project_id, dry_run, chunk_size):
+    """Recompute every derived table of one project. Runs in a worker process."""
+    project = ProjectModel.objects.get(id=project_id)
+    results = {}
+    started = time.perf_counter()
+    # The plan_* functions print notes about skipped projects
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, plan_derived, kwargs in DERIVED:
+            plan = plan_derived(project, **kwargs)
+            if plan is None:
+                continue
+            results[name] = plan.counts() if dry_run else plan.apply(chunk_size=chunk_size)
+    return {"project_id": project_id, "name": project.name, "seconds": time.perf_counter() - started, "tables": results}
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the derived analytics (session and impression analytics, QR dwell times and unique QR counts) "
+        "from the raw data already in the database, without fetching anything from Zenus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--project-ids", help="Comma separated projects to recompute")
+        parser.add_argument("--active", action="store_true", help="Only active projects")
+        parser.add_argument("--exclude-project-ids", help="Comma separated projects to skip")
+        parser.add_argument("--workers", type=int, default=1, help="Projects recomputed in parallel processes")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Rows written per transaction")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many derived rows would be created, updated or stay unchanged",
+        )
+
+    def handle(self, *args, **options):
+        # Archived and cold stored projects have no raw rows left to recompute from
+        projects = ProjectModel.objects.filter(archived_at__isnull=True, cold_stored_at__isnull=True).order_by("id")
+        if options["project_ids"]:
+            projects = projects.filter(id__in=options["project_ids"].split(","))
+        if options["active"]:
+            projects = projects.filter(is_active=True)
+        if options["exclude_project_ids"]:
+            projects = projects.exclude(id__in=options["exclude_project_ids"].split(","))
+        project_ids = list(projects.values_list("id", flat=True))
+        if not project_ids:
+            raise CommandError("No projects match the filters.")
+
+        self.dry_run = options["dry_run"]
+        if self.dry_run:
+            self.stdout.write("Dry run, nothing will be written.")
+        self.stdout.write(f"Recomputing analytics for {len(project_ids)} projects with {options['workers']} workers...")
+
+        started = time.perf_counter()
+        args = (options["dry_run"], options["chunk_size"])
+        totals = {}
+        failed = []
+
+        if options["workers"] <= 1:
+            for project_id in project_ids:
+                try:
+                    self.report(recompute_project(project_id, *args), totals)
+                except Exception as e:
+                    failed.append(project_id)
+                    self.stderr.write(f"Error while recomputing project {project_id}: {str(e)}")
+        else:
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(max_workers=options["workers"], mp_context=context) as executor:
+                futures = {executor.submit(recompute_project, project_id, *args): project_id for project_id in project_ids}
+                for future in as_completed(futures):
+                    try:
+                        self.report(future.result(), totals)
+                    except Exception as e:
+                        failed.append(futures[future])
+                        self.stderr.write(f"Error while recomputing project {futures[future]}: {str(e)}")
+
+        self.stdout.write("\nTotal" + (" (dry run)" if self.dry_run else ""))
+        for name, counts in totals.items():
+            self.stdout.write(f"  {name:<32} {self.format_counts(counts)}")
+
+        if failed:
+            raise CommandError(f"Failed projects: {', '.join(map(str, sorted(failed)))}")
+        self.stdout.write(self.style.SUCCESS(f"Done! Recomputed in {time.perf_counter() - started:.1f}s"))
+
+    def report(self, result, totals):
+        self.stdout.write(f"Project {result['project_id']} ({result['name']}) in {result['seconds']:.1f}s")
+        for name, counts in result["tables"].items():
+            self.stdout.write(f"  {name:<32} {self.format_counts(counts)}")
+            total = totals.setdefault(name, {"created": 0, "updated": 0, "unchanged": 0})
+            for key in total:
+                total[key] += counts[key]
+
+    def format_counts(self, counts):
+        verb = "would be " if self.dry_run else ""
+        return f"{counts['created']} {verb}created, {counts['updated']} {verb}updated, {counts['unchanged']} unchanged"
@@ -0,0 +1,90 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.cold_storage import rehydrate_requested
+from api.outbox import deliver_pending, get_backend, precompile_templates, prune_finished
+from api.sweeper import sweep_expired_tokens
+from api.token_blacklist import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Background worker: delivers the outbound email outbox in batches, retrying failures with "
+        "exponential backoff, loads back the cold stored or archived projects requests are waiting for, and periodically "
+        "deletes expired tokens and old emails. Run one or more next to the web processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE, help="Emails per send")
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.WORKER_POLL_INTERVAL,
+            help="Seconds to sleep when there is nothing to do",
+        )
+        parser.add_argument(
+            "--sweep-interval",
+            type=float,
+            default=settings.TOKEN_SWEEP_INTERVAL,
+            help="Seconds between expired token sweeps, 0 to not sweep",
+        )
+        parser.add_argument("--once", action="store_true", help="Exit once nothing is due instead of polling")
+
+    def handle(self, *args, **options):
+        templates = precompile_templates()
+        backend = get_backend()
+        self.stdout.write(
+            f"Worker started with the {settings.EMAIL_OUTBOX_BACKEND} email backend, {len(templates)} templates compiled."
+        )
+
+        totals = {"sent": 0, "retried": 0, "failed": 0}
+        next_sweep = time.monotonic()
+        try:
+            while True:
+                # Long running: don't keep using a connection the database may have dropped
+                close_old_connections()
+                if options["sweep_interval"] and time.monotonic() >= next_sweep:
+                    self.sweep()
+                    next_sweep = time.monotonic() + options["sweep_interval"]
+                result = deliver_pending(options["batch_size"], backend)
+                for key, value in result.items():
+                    totals[key] += value
+                if any(result.values()):
+                    self.stdout.write(f"Emails: {result['sent']} sent, {result['retried']} to retry, {result['failed']} failed")
+                    continue
+                # One project at a time, so queued emails aren't held up behind a backlog of them
+                if self.rehydrate():
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done! {totals['sent']} emails sent, {totals['retried']} retries scheduled, {totals['failed']} failed"
+        ))
+
+    def rehydrate(self):
+        try:
+            done = rehydrate_requested(max_projects=1)
+        except Exception as e:
+            print(f"Error rehydrating projects: {str(e)}")
+            return False
+        for project_id, loaded in done.items():
+            self.stdout.write(f"Loaded back the raw rows of project {project_id}: {loaded}")
+        return bool(done)
+
+    def sweep(self):
+        # Bounded, so a large backlog of expired tokens never holds up the emails for long
+        batches = settings.TOKEN_SWEEP_MAX_BATCHES
+        try:
+            deleted = sweep_expired_tokens(max_batches=batches)
+            deleted.update(prune_expired_tokens(max_chunks=batches))
+            deleted["outbox"] = prune_finished(max_batches=batches)
+        except Exception as e:
+            print(f"Error sweeping expired tokens: {str(e)}")
+            return
+        if any(deleted.values()):
+            self.stdout.write("Expired tokens and old emails deleted: " + ", ".join(f"{table} {rows}" for table, rows in deleted.items()))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from api.sweeper import sweep_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired email verification and password reset tokens in bounded batches. "
+        "run_worker also does this every TOKEN_SWEEP_INTERVAL seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Tokens deleted per transaction")
+        parser.add_argument("--max-batches", type=int, help="Stop after this many batches per table")
+
+    def handle(self, *args, **options):
+        deleted = sweep_expired_tokens(options["batch_size"], options["max_batches"])
+        for table, rows in deleted.items():
+            self.stdout.write(f"  {table}: {rows} deleted")
+        self.stdout.write(self.style.SUCCESS(f"Done! Deleted {sum(deleted.values())} expired tokens"))
@@ -1,58 +1,213 @@
-import os
-import requests
-from django.core.management.base import BaseCommand
+import bisect
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
 from django.utils.dateparse import parse_datetime
 from django.utils import timezone
-from django.db import IntegrityError, DatabaseError, transaction
+from django.db import IntegrityError, DatabaseError, connections, transaction
 from api.models import *
 from collections import defaultdict
 from django.db.models import Avg
 from datetime import timedelta, datetime
 from dateutil import parser
+from api import profiling
+from api.bulk import ChangePlan, bulk_upsert, reconcile
+from api import sync_telemetry as telemetry
+from api import zenus
 
-# Load Zenus API URL and API key from environment variables
-ZENUS_API_URL = os.environ.get("ZENUS_API_URL")
-
-def fetch_zenus_data(endpoint, params=None):
-    """Helper function to handle API requests."""
-    ZENUS_API_KEY = os.environ.get("ZENUS_API_KEY")  # Use current API key in the environment variable
-    HEADERS = {
-        "Authorization": f"Bearer {ZENUS_API_KEY}",
-    }
-    response = requests.get(f"{ZENUS_API_URL}/{endpoint}", headers=HEADERS, params=params)
+def parse_zenus_response(response):
     if response.status_code != 200:
         raise Exception(f"Error fetching data from Zenus: {response.text}")
-    return response.json()
+    data = response.json()
+    if isinstance(data, dict):
+        # Rows are the lists of records in the payload, e.g. "observations" or "stages"
+        telemetry.count(rows_fetched=sum(
+            len(value) for value in data.values() if isinstance(value, list) and value and isinstance(value[0], dict)
+        ))
+    return data
+
+def fetch_zenus_data(client, endpoint, params=None):
+    """Helper function to handle API requests, made with the ZenusClient of the account."""
+    return parse_zenus_response(client.get(endpoint, params))
+
+def fetch_if_changed(client, endpoint, project_id=None, force=False):
+    """
+    Fetch a metadata endpoint unless it is unchanged since its payload was last stored. The ETag and
+    Last-Modified Zenus sent then go out as If-None-Match/If-Modified-Since, and for responses without
+    them the body's hash is compared instead.
+
+    Returns (data, state) with data None when nothing changed. Call state.save() once the payload is
+    stored, so a sync that fails halfway fetches it again next time.
+    """
+    state = ZenusFetchStateModel.objects.filter(endpoint=endpoint).first()
+    headers = {}
+    if state and not force:
+        if state.etag:
+            headers["If-None-Match"] = state.etag
+        if state.last_modified:
+            headers["If-Modified-Since"] = state.last_modified
+
+    response = client.get(endpoint, headers=headers)
+    if response.status_code == 304:
+        telemetry.count(not_modified=1)
+        return None, state
+
+    payload_hash = hashlib.sha256(response.content).hexdigest()
+    data = parse_zenus_response(response)
+    if state is None:
+        state = ZenusFetchStateModel(endpoint=endpoint)
+    elif not force and state.payload_hash == payload_hash:
+        telemetry.count(not_modified=1)
+        return None, state
+
+    state.project_id = project_id
+    state.etag = response.headers.get("ETag")
+    state.last_modified = response.headers.get("Last-Modified")
+    state.payload_hash = payload_hash
+    return data, state
 
 class Command(BaseCommand):
-    help = 'Syncs data from Zenus API to ROME database'
+    help = 'Syncs data from Zenus API to ROME database, every account (ZENUS_ACCOUNTS) at the same time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Forget the stored ETags and payload hashes and compare every project, stage, booth and device again",
+        )
+        parser.add_argument("--account", action="append", help="Only sync this account (repeatable)")
 
     def handle(self, *args, **kwargs):
         try:
-            # print(f"start with {489}.")
-            # sync_single_project(489)
-            projects = sync_project_list()
+            clients = zenus.clients(kwargs["account"])
+        except zenus.ZenusAccountError as e:
+            raise CommandError(str(e))
+
+        if kwargs["full"]:
+            ZenusFetchStateModel.objects.all().delete()
+
+        for account, run in sync_accounts(sync_account, clients).items():
+            if isinstance(run, Exception):
+                self.stderr.write(f"An error occurred while syncing account {account}: {str(run)}")
+                continue
+            totals = run.record.totals
+            self.stdout.write(
+                f"Sync run {run.record.id} (account {account}): {run.record.status} in {run.record.duration:.1f}s, "
+                f"{totals.get('created', 0) + totals.get('updated', 0)} rows changed "
+                f"({totals.get('created', 0)} created, {totals.get('updated', 0)} updated), "
+                f"{totals.get('skipped', 0)} unchanged or skipped, {totals.get('not_modified', 0)} endpoints not modified"
+            )
+
+def sync_accounts(func, clients=None):
+    """
+    Call func(client) for every Zenus account (or the given clients) at the same time, each in its own
+    thread with its own client and database connection. Returns {account: result}, with the exception
+    as the result of an account that raised one.
+    """
+    clients = zenus.clients() if clients is None else clients
+
+    def run(client):
+        try:
+            return func(client)
+        finally:
+            connections.close_all()  # Only this thread's connections
+
+    results = {}
+    if len(clients) == 1:
+        # Nothing to overlap with, stay on the caller's connection
+        try:
+            results[clients[0].account] = func(clients[0])
+        except Exception as e:
+            results[clients[0].account] = e
+        return results
+
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        futures = {client.account: executor.submit(run, client) for client in clients}
+    for account, future in futures.items():
+        try:
+            results[account] = future.result()
+        except Exception as e:
+            results[account] = e
+    return results
+
+def sync_account(client):
+    """Sync every project of one Zenus account as one sync run, which is returned."""
+    # Every step's numbers end up in one SyncRunModel row
+    with telemetry.sync_run(f"sync_zenus_data:{client.account}") as run:
+        try:
+            with telemetry.step("sync_project_list"):
+                projects = sync_project_list(client)
             if not projects:
-                self.stdout.write("No projects found to sync.")
-                return
+                print(f"No projects found to sync for account {client.account}.")
+                return run
 
             # Loop through each project and call sync_single_project for each one
             for project in projects:
                 try:
-                    # Sync each individual project
-                    sync_single_project(project['id'])
+                    # Sync each individual project, sync_project_list has already stored its details
+                    sync_single_project(project['id'], refresh=False, client=client)
                 except Exception as e:
-                    self.stderr.write(f"Error while processing project {project['id']}: {str(e)}")
+                    run.errors.append(f"Project {project['id']}: {str(e)}")
+                    print(f"Error while processing project {project['id']}: {str(e)}")
 
         except Exception as e:
             # General error handling for fetching Zenus data or other unexpected errors
-            self.stderr.write(f"An error occurred while syncing data: {str(e)}")
+            run.errors.append(str(e))
+            print(f"An error occurred while syncing account {client.account}: {str(e)}")
+    return run
+
+PROJECT_FIELDS = [
+    'name', 'start_datetime', 'end_datetime', 'deployment_timezone', 'services', 'country', 'city', 'zenus_account',
+]
 
-def sync_project_list():
-    """Sync all projects."""
+def sync_project_detail(client, project_id):
+    """
+    Fetch a project's details from the client's account and store them, with the account, if they
+    changed. Returns the project, None if Zenus has no data for it.
+    """
+    project = ProjectModel.objects.filter(id=project_id).first()
+    # Without the row a stored state would hide the details it needs
+    project_data, state = fetch_if_changed(client, f'projects/{project_id}', project_id, force=project is None)
+    if project_data is None:
+        if project.zenus_account != client.account:
+            # Unchanged since a sync that didn't record the account
+            project.zenus_account = client.account
+            project.save(update_fields=['zenus_account'])
+        return project
+    if not project_data:
+        return None
+
+    values = {
+        'name': project_data['name'],
+        'start_datetime': timezone.make_aware(timezone.datetime.fromisoformat(project_data['start_datetime'])),
+        'end_datetime': timezone.make_aware(timezone.datetime.fromisoformat(project_data['end_datetime'])),
+        'deployment_timezone': project_data['deployment_timezone'],
+        'services': project_data['services'],
+        'country': project_data['country'],
+        'city': project_data['city'],
+        'zenus_account': client.account,
+    }
+    if project is None:
+        # The id comes from Zenus, which ChangePlan would take for an existing row
+        project = ProjectModel.objects.create(id=project_data['id'], **values)
+        result = {"created": 1, "updated": 0, "unchanged": 0}
+    else:
+        plan = ChangePlan(ProjectModel, PROJECT_FIELDS)
+        plan.add(project, values)
+        result = plan.apply()
+    telemetry.count(created=result["created"], updated=result["updated"], skipped=result["unchanged"])
+
+    state.project = project
+    state.save()
+    telemetry.log_row("Project %s: %s.", project.name, result)
+    return project
+
+def sync_project_list(client):
+    """Sync all projects of the client's Zenus account."""
     try:
         # Fetch all projects from Zenus
-        projects_data = fetch_zenus_data('projects')
+        projects_data = fetch_zenus_data(client, 'projects')
         projects = projects_data.get('projects', [])
 
         if not projects:
@@ -62,205 +217,265 @@ def sync_project_list():
         # Process each project
         for project_data in projects:
             try:
-                project_data = fetch_zenus_data(f'projects/{project_data['id']}')
-                if not project_data:
+                if sync_project_detail(client, project_data['id']) is None:
                     print(f"No data found for project {project_data['id']}.")
-                    return None
-                
-                # Update or create the project
-                project, created = ProjectModel.objects.update_or_create(
-                    id=project_data['id'],
-                    defaults={
-                        'name': project_data['name'],
-                        'start_datetime': timezone.make_aware(timezone.datetime.fromisoformat(project_data['start_datetime'])),
-                        'end_datetime': timezone.make_aware(timezone.datetime.fromisoformat(project_data['end_datetime'])),
-                        'deployment_timezone': project_data['deployment_timezone'],
-                        'services': project_data['services'],
-                        'country': project_data['country'],
-                        'city': project_data['city'],
-                    }
-                )
-               
-                if created:
-                    print(f"Project {project.name} created.")
-                else:
-                    print(f"Project {project.name} updated.")
 
             except IntegrityError as e:
+                telemetry.count(errors=1)
                 print(f"Integrity error while processing project {project_data['id']}: {str(e)}")
             except DatabaseError as e:
+                telemetry.count(errors=1)
                 print(f"Database error while processing project {project_data['id']}: {str(e)}")
             except Exception as e:
+                telemetry.count(errors=1)
                 print(f"Error while processing project {project_data['id']}: {str(e)}")
         
         return projects
     except Exception as e:
+        telemetry.count(errors=1)
         print(f"Error syncing project list: {str(e)}")
         return []
 
-def sync_single_project(project_id):
-    """Sync a single project."""
-    try:
-        # Fetch project data
-        project_data = fetch_zenus_data(f'projects/{project_id}')
-        if not project_data:
-            print(f"No data found for project {project_id}.")
-            return None
-        
-        # Update or create the project
-        project, created = ProjectModel.objects.update_or_create(
-            id=project_data['id'],
-            defaults={
-                'name': project_data['name'],
-                'start_datetime': timezone.make_aware(timezone.datetime.fromisoformat(project_data['start_datetime'])),
-                'end_datetime': timezone.make_aware(timezone.datetime.fromisoformat(project_data['end_datetime'])),
-                'deployment_timezone': project_data['deployment_timezone'],
-                'services': project_data['services'],
-                'country': project_data['country'],
-                'city': project_data['city'],
-            }
-        )
+def sync_single_project(project_id, refresh=True, client=None):
+    """
+    Sync a single project, with the client of the account that owns it (see zenus.clients_for_project)
+    unless one is given. With refresh=False the stored project is used as is, for callers that have
+    just synced its details (sync_account, through sync_project_list).
+    """
+    with telemetry.sync_run("sync_single_project") as run:
+        try:
+            with telemetry.step("sync_project", project_id):
+                project = None if refresh else ProjectModel.objects.filter(id=project_id).first()
+                if project is None:
+                    errors = []
+                    # More than one client only for a project no list sync has seen yet
+                    for candidate in [client] if client else zenus.clients_for_project(project_id):
+                        try:
+                            project = sync_project_detail(candidate, project_id)
+                        except Exception as e:
+                            errors.append(f"account {candidate.account}: {str(e)}")
+                            continue
+                        if project is not None:
+                            break
+                    if project is None and errors:
+                        raise Exception("; ".join(errors))
+                if project is None:
+                    print(f"No data found for project {project_id}.")
+                    return None
 
-        sync_project_stage(project)
-        sync_project_booths(project)
-        sync_project_devices(project)
-        sync_project_observations(project)
-        calculate_and_save_analytics(project)
-        sync_project_impressions(project)
-        sync_project_unique_impressions(project)
-        calculate_impression_analytics(project, zone="internal")
-        calculate_impression_analytics(project, zone="aisle")
-        sync_project_qr_codes(project)
-        calculate_qr_code_dwell_time(project)
-        calculate_project_qr_codes(project)
+            if project.archived_at or project.cold_stored_at:
+                # Re-syncing would put the archived raw rows back and reset the analytics
+                print(f"Project {project.name} is archived, skipping its data.")
+                return project
 
-        return project
-    
-    except IntegrityError as e:
-        print(f"Integrity error while processing project {project_id}: {str(e)}")
-    except DatabaseError as e:
-        print(f"Database error while processing project {project_id}: {str(e)}")
-    except Exception as e:
-        print(f"Error while processing project {project_id}: {str(e)}")
+            for name, step, kwargs in SYNC_STEPS:
+                with telemetry.step(name, project.id), profiling.profile_step(name, project.id):
+                    step(project, **kwargs)
+
+            return project
+
+        except IntegrityError as e:
+            run.errors.append(f"Project {project_id}: {str(e)}")
+            print(f"Integrity error while processing project {project_id}: {str(e)}")
+        except DatabaseError as e:
+            run.errors.append(f"Project {project_id}: {str(e)}")
+            print(f"Database error while processing project {project_id}: {str(e)}")
+        except Exception as e:
+            run.errors.append(f"Project {project_id}: {str(e)}")
+            print(f"Error while processing project {project_id}: {str(e)}")
     return None
 
 def sync_project_stage(project):
-    """Store or update a project stage."""
+    """Reconcile the project's stages and their sessions with Zenus, unless Zenus reports no change."""
     try:
         # Fetch project stages data using the new API endpoint
-        stages_data = fetch_zenus_data(f'projects/{project.id}/stages?include=sessions')
+        stages_data, state = fetch_if_changed(zenus.client_for(project), f'projects/{project.id}/stages?include=sessions', project.id)
+        if stages_data is None:
+            return
 
-        if stages_data and 'stages' in stages_data:
-            stages = stages_data['stages']
-            for stage_data in stages:
+        failed = 0
+        if 'stages' in stages_data:
+            stages = []
+            sessions = []
+            for stage_data in stages_data['stages']:
                 try:
-                    # Create or update the stage, ensuring we store the id
-                    stage, created = ProjectStageModel.objects.update_or_create(
-                        id=stage_data['id'],  # Use the stage's id
-                        project=project,
-                        name=stage_data['name'],
-                        defaults={'name': stage_data['name']}
-                    )
-
-                    if created:
-                        print(f"Stage {stage.name} created for project {project.name}.")
-                    else:
-                        print(f"Stage {stage.name} updated for project {project.name}.")
-
-                    # Sync sessions for this stage (you can create a separate function for sessions if needed)
-                    sync_project_sessions(project, stage, stage_data.get("sessions", []))
-
+                    stage = ProjectStageModel(id=stage_data['id'], project=project, name=stage_data['name'])
                 except Exception as e:
-                    print(f"Error while processing stage {stage_data['name']} for project {project.name}: {str(e)}")
+                    failed += 1
+                    telemetry.count(skipped=1)
+                    telemetry.log_row("Error while processing stage %s for project %s: %s", stage_data.get('name'), project.name, e, level=logging.WARNING)
+                    continue
+                stages.append(stage)
+
+                for session_data in stage_data.get("sessions", []):
+                    try:
+                        sessions.append(SessionModel(
+                            zenus_id=str(session_data['id']),
+                            name=session_data['name'],
+                            project=project,
+                            start_datetime=timezone.make_aware(timezone.datetime.fromisoformat(session_data['start_datetime'])),
+                            end_datetime=timezone.make_aware(timezone.datetime.fromisoformat(session_data['end_datetime'])),
+                            project_stage_id=stage.id,
+                        ))
+                    except Exception as e:
+                        failed += 1
+                        telemetry.count(skipped=1)
+                        telemetry.log_row("Error while processing session %s for stage %s: %s", session_data.get('name'), stage.name, e, level=logging.WARNING)
+
+            # Nothing is deleted unless the whole payload was understood
+            with transaction.atomic():
+                result = reconcile(
+                    ProjectStageModel.objects.filter(project=project), stages, "id", ["name"], delete=False,
+                )
+                sessions_result = sync_project_sessions(project, sessions, delete=not failed)
+                if not failed:
+                    # Stages still holding sessions the sync kept (see sessions_with_content) stay too
+                    result["deleted"] = ProjectStageModel.objects.filter(project=project).exclude(
+                        id__in=[stage.id for stage in stages],
+                    ).filter(sessions__isnull=True).delete()[1].get(ProjectStageModel._meta.label, 0)
+
+            telemetry.count(created=result["created"], updated=result["updated"], deleted=result["deleted"], skipped=result["unchanged"])
+            print(f"Stages synced for project {project.name}: {result}, sessions: {sessions_result}")
+
+        if not failed:
+            state.save()
     except Exception as e:
+        telemetry.count(errors=1)
         print(f"Error while syncing stages for project {project.name}: {str(e)}")
 
-def sync_project_sessions(project, stage, sessions_data):
-    """Sync sessions for each stage."""
-    for session_data in sessions_data:
-        try:
-            # Update or create the session in the database
-            session, created = SessionModel.objects.update_or_create(
-                # Include fields that uniquely identify the session
-                name=session_data['name'],
-                project=project,
-                start_datetime=timezone.make_aware(timezone.datetime.fromisoformat(session_data['start_datetime'])),
-                end_datetime=timezone.make_aware(timezone.datetime.fromisoformat(session_data['end_datetime'])),
-                project_stage=stage
-                # defaults={
-                #     'project_stage': stage
-                # }
-            )
-            if created:
-                print(f"Session {session.id} created for stage {stage.name}.")
-            else:
-                print(f"Session {session.id} updated for stage {stage.name}.")
+def sessions_with_content(sessions):
+    """
+    The ids of the sessions that hold more than Zenus sends: media, a transcript, comments, a summary
+    or synced raw data. Deleting one would take all of that with it, so the sync keeps them.
+    """
+    ids = [session.pk for session in sessions]
+    protected = {session.pk for session in sessions if session.video_url or session.audio_url or session.transcript}
+    for model in (CommentModel, SummaryModel, TranscriptSentenceModel, ObservationModel, QrCodeModel):
+        protected.update(model.objects.filter(session_id__in=ids).values_list("session_id", flat=True).distinct())
+    return protected
 
-        except Exception as e:
-            print(f"Error while processing session {session_data['name']} for stage {stage.name}: {str(e)}")
+def sync_project_sessions(project, sessions, delete=True):
+    """
+    Reconcile the project's sessions with `sessions` (unsaved, from the stages payload) by their Zenus
+    id, so a rescheduled or renamed session is updated in place. Returns the reconcile() counts.
+    """
+    # Sessions synced before zenus_id existed are matched once by what used to identify them
+    by_natural_key = {
+        (session.name, session.start_datetime, session.end_datetime, session.project_stage_id): session.zenus_id
+        for session in sessions
+    }
+    adopted = []
+    for session in SessionModel.objects.filter(project=project, zenus_id__isnull=True):
+        zenus_id = by_natural_key.pop(
+            (session.name, session.start_datetime, session.end_datetime, session.project_stage_id), None,
+        )
+        if zenus_id is not None:
+            session.zenus_id = zenus_id
+            adopted.append(session)
+    if adopted:
+        SessionModel.objects.bulk_update(adopted, ["zenus_id"])
+
+    result = reconcile(
+        SessionModel.objects.filter(project=project),
+        sessions,
+        "zenus_id",
+        ["name", "start_datetime", "end_datetime", "project_stage"],
+        protect=sessions_with_content,
+        delete=delete,
+    )
+    telemetry.count(created=result["created"], updated=result["updated"], deleted=result["deleted"], skipped=result["unchanged"])
+    return result
+
+def booths_with_impressions(booths):
+    """The ids of the booths impressions point at, deleting them would delete the impressions."""
+    ids = [booth.pk for booth in booths]
+    protected = set()
+    for model in (ImpressionModel, UniqueImpressionModel):
+        protected.update(model.objects.filter(booth_id__in=ids).values_list("booth_id", flat=True).distinct())
+    return protected
 
 def sync_project_booths(project):
-    """Sync booths for a given project."""
+    """Reconcile the project's booths with Zenus, unless Zenus reports no change."""
     try:
         # Fetch booths data using the new API endpoint
-        booths_data = fetch_zenus_data(f'projects/{project.id}/booths?include=operatingHours')
+        booths_data, state = fetch_if_changed(zenus.client_for(project), f'projects/{project.id}/booths?include=operatingHours', project.id)
+        if booths_data is None:
+            return
 
-        if booths_data and 'booths' in booths_data:
-            booths = booths_data['booths']
-            for booth_data in booths:
+        failed = 0
+        if 'booths' in booths_data:
+            booths = []
+            for booth_data in booths_data['booths']:
                 try:
-                    # Create or update the booth
-                    booth, created = ProjectBoothModel.objects.update_or_create(
-                        booth_id=booth_data['id'],  # Use the booth ID as unique
+                    booths.append(ProjectBoothModel(
+                        booth_id=booth_data['id'],
                         project=project,
-                        defaults={
-                            'name': booth_data['name'],
-                            'size': booth_data['size'],
-                            'operating_hours': booth_data.get('operating_hours', []),  # Store operating hours directly
-                        }
-                    )
-
-                    if created:
-                        print(f"Booth {booth.name} created for project {project.name}.")
-                    else:
-                        print(f"Booth {booth.name} updated for project {project.name}.")
-
+                        name=booth_data['name'],
+                        size=booth_data['size'],
+                        operating_hours=booth_data.get('operating_hours', []),  # Store operating hours directly
+                    ))
                 except Exception as e:
-                    print(f"Error while processing booth {booth_data['name']} for project {project.name}: {str(e)}")
+                    failed += 1
+                    telemetry.count(skipped=1)
+                    telemetry.log_row("Error while processing booth %s for project %s: %s", booth_data.get('name'), project.name, e, level=logging.WARNING)
+
+            result = reconcile(
+                ProjectBoothModel.objects.filter(project=project),
+                booths,
+                "booth_id",
+                ["name", "size", "operating_hours"],
+                protect=booths_with_impressions,
+                delete=not failed,
+            )
+            telemetry.count(created=result["created"], updated=result["updated"], deleted=result["deleted"], skipped=result["unchanged"])
+            print(f"Booths synced for project {project.name}: {result}")
 
+        if not failed:
+            state.save()
     except Exception as e:
+        telemetry.count(errors=1)
         print(f"Error while syncing booths for project {project.name}: {str(e)}")
 
 def sync_project_devices(project):
-    """Sync devices for a given project."""
+    """Reconcile the project's devices with Zenus, unless Zenus reports no change."""
     try:
         # Fetch devices data using the new API endpoint
-        devices_data = fetch_zenus_data(f'projects/{project.id}/devices?include=assignments')
+        devices_data, state = fetch_if_changed(zenus.client_for(project), f'projects/{project.id}/devices?include=assignments', project.id)
+        if devices_data is None:
+            return
 
-        if devices_data and 'devices' in devices_data:
-            devices = devices_data['devices']
-            for device_data in devices:
+        failed = 0
+        if 'devices' in devices_data:
+            devices = []
+            for device_data in devices_data['devices']:
                 try:
-                    # Create or update the device
-                    device, created = ProjectDeviceModel.objects.update_or_create(
+                    devices.append(ProjectDeviceModel(
                         device_id=device_data['id'],
                         project=project,
-                        defaults={
-                            'name': device_data['name'],
-                            'service' : device_data['service'],
-                            'assignments': device_data.get('assignments', []),  # Store assignments directly
-                        }
-                    )
-
-                    if created:
-                        print(f"Device {device.name} created for project {project.name}.")
-                    else:
-                        print(f"Device {device.name} updated for project {project.name}.")
-
+                        name=device_data['name'],
+                        service=device_data['service'],
+                        assignments=device_data.get('assignments', []),  # Store assignments directly
+                    ))
                 except Exception as e:
-                    print(f"Error while processing device {device_data['name']} for project {project.name}: {str(e)}")
+                    failed += 1
+                    telemetry.count(skipped=1)
+                    telemetry.log_row("Error while processing device %s for project %s: %s", device_data.get('name'), project.name, e, level=logging.WARNING)
+
+            # Impressions, observations and QR codes refer to devices by their Zenus id, not a foreign key
+            result = reconcile(
+                ProjectDeviceModel.objects.filter(project=project),
+                devices,
+                "device_id",
+                ["name", "service", "assignments"],
+                delete=not failed,
+            )
+            telemetry.count(created=result["created"], updated=result["updated"], deleted=result["deleted"], skipped=result["unchanged"])
+            print(f"Devices synced for project {project.name}: {result}")
 
+        if not failed:
+            state.save()
     except Exception as e:
+        telemetry.count(errors=1)
         print(f"Error while syncing devices for project {project.name}: {str(e)}")
 
 # def sync_project_observations(project, batch_size=1000):
@@ -364,9 +579,9 @@ def sync_project_devices(project):
 #         print(f"Error while syncing observations for project {project.name}: {str(e)}")
 
 def sync_project_observations(project, batch_size=1000):
-    """Sync observations for the project by always creating new records."""
+    """Sync observations for the project, upserting them on datetime and device."""
     try:
-        observations_data = fetch_zenus_data(f"projects/{project.id}/observations")
+        observations_data = fetch_zenus_data(zenus.client_for(project), f"projects/{project.id}/observations")
         if not observations_data.get("observations"):
             print(f"No observations for project {project.name}")
             return
@@ -376,116 +591,121 @@ def sync_project_observations(project, batch_size=1000):
             project.type.append("obs")
             project.save()
 
-        observations_to_create = []
-
-        for obs_data in observations_data["observations"]:
-            try:
-                dt = parser.isoparse(obs_data["datetime"])
-                dt = timezone.make_aware(dt)
-                session = get_session(dt, obs_data["device_id"], project, "obs") or None
-
-                # build new model instance
-                obs = ObservationModel(
-                    session=session,
-                    datetime=dt,
-                    project=project,
-                    device_id=obs_data["device_id"],
-                    device_name=obs_data["device_name"],
-                    count_total=obs_data["count_total"],
-                    count_male=obs_data["count_male"],
-                    count_female=obs_data["count_female"],
-                    count_under_40=obs_data["count_under_40"],
-                    count_over_40=obs_data["count_over_40"],
-                    energy=obs_data["energy"],
-                    energy_male=obs_data["energy_male"],
-                    energy_female=obs_data["energy_female"],
-                    energy_under_40=obs_data["energy_under_40"],
-                    energy_over_40=obs_data["energy_over_40"],
-                )
-
-                observations_to_create.append(obs)
-                print(f"lfg Created obs for session={session} at {dt}")
-
-            except Exception as e:
-                print(f"Error processing obs {obs_data['device_id']} @ {obs_data['datetime']}: {e}")
-
-            # flush in batches
-            if len(observations_to_create) >= batch_size:
-                with transaction.atomic():
-                    ObservationModel.objects.bulk_create(observations_to_create)
-                observations_to_create = []
+        def observations():
+            for obs_data in observations_data["observations"]:
+                try:
+                    dt = parser.isoparse(obs_data["datetime"])
+                    dt = timezone.make_aware(dt)
+                    session = get_session(dt, obs_data["device_id"], project, "obs") or None
 
-        # flush any remaining
-        if observations_to_create:
-            with transaction.atomic():
-                ObservationModel.objects.bulk_create(observations_to_create)
+                    # build new model instance
+                    obs = ObservationModel(
+                        session=session,
+                        datetime=dt,
+                        project=project,
+                        device_id=obs_data["device_id"],
+                        device_name=obs_data["device_name"],
+                        count_total=obs_data["count_total"],
+                        count_male=obs_data["count_male"],
+                        count_female=obs_data["count_female"],
+                        count_under_40=obs_data["count_under_40"],
+                        count_over_40=obs_data["count_over_40"],
+                        energy=obs_data["energy"],
+                        energy_male=obs_data["energy_male"],
+                        energy_female=obs_data["energy_female"],
+                        energy_under_40=obs_data["energy_under_40"],
+                        energy_over_40=obs_data["energy_over_40"],
+                    )
+                except Exception as e:
+                    telemetry.count(skipped=1)
+                    telemetry.log_row("Error processing obs %s @ %s: %s", obs_data['device_id'], obs_data['datetime'], e, level=logging.WARNING)
+                    continue
+
+                telemetry.log_row("Synced obs for session=%s at %s", session, dt)
+                yield obs
+
+        result = bulk_upsert(
+            ObservationModel,
+            observations(),
+            key_fields=["datetime", "device_id"],
+            update_fields=[
+                "session", "device_name", "count_total", "count_male", "count_female", "count_under_40",
+                "count_over_40", "energy", "energy_male", "energy_female", "energy_under_40", "energy_over_40",
+            ],
+            scope={"project": project},
+            batch_size=batch_size,
+        )
+        telemetry.count(created=result["created"], updated=result["updated"], skipped=result["unchanged"])
 
-        print(f"All observations created for project {project.name}")
+        print(f"Observations synced for project {project.name}: {result}")
 
     except Exception as e:
+        telemetry.count(errors=1)
         print(f"Error syncing observations for project {project.name}: {e}")
 
 
+SESSION_ANALYTICS_FIELDS = [
+    "male_ratio", "female_ratio", "under_40_ratio", "over_40_ratio",
+    "energy_avg", "male_energy_avg", "female_energy_avg", "under_40_energy_avg", "over_40_energy_avg",
+]
 
-def calculate_and_save_analytics(project):
-    """Aggregate observation data and save demographic ratios & energies at the session level, grouped by device_id."""
-    sessions = project.sessions.all()  # Get all sessions related to the project
-
-    if not sessions.exists():
-        return  # No sessions found, skip processing
-
-    for session in sessions:
-        qs = ObservationModel.objects.filter(project=project, session=session)
-
-        if not qs.exists():
-            continue  # No observation data for this session; skip
-
-        # Group data by device_id
-        device_data = defaultdict(lambda: {
-            "sum_total": 0.0,
-            "sum_male": 0.0,
-            "sum_female": 0.0,
-            "sum_under_40": 0.0,
-            "sum_over_40": 0.0,
-            "weighted_energy": 0.0,
-            "weighted_male_energy": 0.0,
-            "weighted_female_energy": 0.0,
-            "weighted_under_40_energy": 0.0,
-            "weighted_over_40_energy": 0.0
-        })
-
-        for obs in qs:
-            device_id = obs.device_id or "unknown"
-
-            count_total = obs.count_total or 0
-            count_male = obs.count_male or 0
-            count_female = obs.count_female or 0
-            count_under_40 = obs.count_under_40 or 0
-            count_over_40 = obs.count_over_40 or 0
-
-            device_data[device_id]["sum_total"] += count_total
-            device_data[device_id]["sum_male"] += count_male
-            device_data[device_id]["sum_female"] += count_female
-            device_data[device_id]["sum_under_40"] += count_under_40
-            device_data[device_id]["sum_over_40"] += count_over_40
-
-            # Weighted energy sums
-            if count_total and obs.energy is not None:
-                device_data[device_id]["weighted_energy"] += count_total * obs.energy
-            if count_male and obs.energy_male is not None:
-                device_data[device_id]["weighted_male_energy"] += count_male * obs.energy_male
-            if count_female and obs.energy_female is not None:
-                device_data[device_id]["weighted_female_energy"] += count_female * obs.energy_female
-            if count_under_40 and obs.energy_under_40 is not None:
-                device_data[device_id]["weighted_under_40_energy"] += count_under_40 * obs.energy_under_40
-            if count_over_40 and obs.energy_over_40 is not None:
-                device_data[device_id]["weighted_over_40_energy"] += count_over_40 * obs.energy_over_40
-
+def compute_session_analytics(project):
+    """
+    Aggregate observation data into demographic ratios & energies at the session level, grouped by device_id.
+    Returns {session_id: {field: value}} for the sessions of the project that have observations.
+    """
+    # Group data by session and device_id
+    device_data = defaultdict(lambda: defaultdict(lambda: {
+        "sum_total": 0.0,
+        "sum_male": 0.0,
+        "sum_female": 0.0,
+        "sum_under_40": 0.0,
+        "sum_over_40": 0.0,
+        "weighted_energy": 0.0,
+        "weighted_male_energy": 0.0,
+        "weighted_female_energy": 0.0,
+        "weighted_under_40_energy": 0.0,
+        "weighted_over_40_energy": 0.0
+    }))
+
+    observations = ObservationModel.objects.filter(project=project, session__project=project).values(
+        "session_id", "device_id", "count_total", "count_male", "count_female", "count_under_40", "count_over_40",
+        "energy", "energy_male", "energy_female", "energy_under_40", "energy_over_40",
+    )
+    for obs in observations.iterator(chunk_size=5000):
+        data = device_data[obs["session_id"]][obs["device_id"] or "unknown"]
+
+        count_total = obs["count_total"] or 0
+        count_male = obs["count_male"] or 0
+        count_female = obs["count_female"] or 0
+        count_under_40 = obs["count_under_40"] or 0
+        count_over_40 = obs["count_over_40"] or 0
+
+        data["sum_total"] += count_total
+        data["sum_male"] += count_male
+        data["sum_female"] += count_female
+        data["sum_under_40"] += count_under_40
+        data["sum_over_40"] += count_over_40
+
+        # Weighted energy sums
+        if count_total and obs["energy"] is not None:
+            data["weighted_energy"] += count_total * obs["energy"]
+        if count_male and obs["energy_male"] is not None:
+            data["weighted_male_energy"] += count_male * obs["energy_male"]
+        if count_female and obs["energy_female"] is not None:
+            data["weighted_female_energy"] += count_female * obs["energy_female"]
+        if count_under_40 and obs["energy_under_40"] is not None:
+            data["weighted_under_40_energy"] += count_under_40 * obs["energy_under_40"]
+        if count_over_40 and obs["energy_over_40"] is not None:
+            data["weighted_over_40_energy"] += count_over_40 * obs["energy_over_40"]
+
+    analytics = {}
+    for session_id, devices in device_data.items():
         # Aggregate all device-level data to compute final averages per session
-        total_devices = len(device_data)
+        total_devices = len(devices)
         final_aggregates = defaultdict(float)
 
-        for device_id, data in device_data.items():
+        for device_id, data in devices.items():
             sum_total = data["sum_total"]
 
             if sum_total > 0:
@@ -500,168 +720,146 @@ def calculate_and_save_analytics(project):
                 final_aggregates["under_40_energy_avg"] += (data["weighted_under_40_energy"] / data["sum_under_40"]) / total_devices if data["sum_under_40"] > 0 else 0
                 final_aggregates["over_40_energy_avg"] += (data["weighted_over_40_energy"] / data["sum_over_40"]) / total_devices if data["sum_over_40"] > 0 else 0
 
-        # Save the final aggregated session analytics
-        analytics, created = SessionAnalyticsModel.objects.get_or_create(
-            project=project, session=session
-        )
+        analytics[session_id] = {field: final_aggregates[field] for field in SESSION_ANALYTICS_FIELDS}
+    return analytics
 
-        analytics.male_ratio = final_aggregates["male_ratio"]
-        analytics.female_ratio = final_aggregates["female_ratio"]
-        analytics.under_40_ratio = final_aggregates["under_40_ratio"]
-        analytics.over_40_ratio = final_aggregates["over_40_ratio"]
+def plan_session_analytics(project):
+    """The SessionAnalyticsModel writes that bring the project's session analytics up to date."""
+    computed = compute_session_analytics(project)
+    existing = {
+        analytics.session_id: analytics
+        for analytics in SessionAnalyticsModel.objects.filter(project=project, session_id__in=list(computed))
+    }
+    plan = ChangePlan(SessionAnalyticsModel, SESSION_ANALYTICS_FIELDS)
+    for session_id, values in computed.items():
+        plan.add(existing.get(session_id) or SessionAnalyticsModel(project=project, session_id=session_id), values)
+    return plan
 
-        analytics.energy_avg = final_aggregates["energy_avg"]
-        analytics.male_energy_avg = final_aggregates["male_energy_avg"]
-        analytics.female_energy_avg = final_aggregates["female_energy_avg"]
-        analytics.under_40_energy_avg = final_aggregates["under_40_energy_avg"]
-        analytics.over_40_energy_avg = final_aggregates["over_40_energy_avg"]
+def calculate_and_save_analytics(project):
+    """Aggregate observation data and save demographic ratios & energies at the session level, grouped by device_id."""
+    result = plan_session_analytics(project).apply()
+    telemetry.count(created=result["created"], updated=result["updated"], skipped=result["unchanged"])
+    print(f"Session analytics saved for project {project.name}: {result}")
 
-        analytics.save()
+def compute_impression_analytics(project, zone):
+    """
+    Impression counts of the project's zone per date, each day split into 15 time slots.
+    Returns the ImpressionAnalyticsModel values, or None if the project has no impressions service.
+    """
+    # Check if 'imp' is included in the project's type
+    if 'imp' not in project.type:
+        print(f"Project {project.name} does not have 'imp' in its type. Skipping analytics calculation.")
+        return None
+    # Get all impressions for the project
+    impressions = ImpressionModel.objects.filter(project=project, zone=zone)
 
-        print(f"Session analytics updated for {session.name} in project {project.name}")
+    if not impressions.exists():
+        # No impressions found, store default values in the database
+        print(f"No impressions found for project {project.name}. Storing default analytics.")
+        return {
+            "date": [],
+            "impression_count": [],
+            "total_impressions": 0,
+        }
 
-def calculate_impression_analytics(project, zone):
-    """Calculate and save impression analytics for the given project."""
-    try:
-        # Check if 'imp' is included in the project's type
-        if 'imp' not in project.type:
-            print(f"Project {project.name} does not have 'imp' in its type. Skipping analytics calculation.")
-            return None
-        # Get all impressions for the project
-        impressions = ImpressionModel.objects.filter(project=project, zone=zone)
+    # Initialize variables for calculations
+    total_impressions = impressions.count()
 
-        if not impressions.exists():
-            # No impressions found, store default values in the database
-            print(f"No impressions found for project {project.name}. Storing default analytics.")
-            
-            # Create default values for ImpressionAnalyticsModel
-            default_analytics_data = {
-                "date": [],
-                "impression_count": [],
-                "total_impressions": 0,
-            }
-
-            # Save default record in ImpressionAnalyticsModel
-            impression_analytics, created = ImpressionAnalyticsModel.objects.update_or_create(
-                project=project,
-                zone=zone,
-                defaults=default_analytics_data
-            )
+    # Initialize data structures for the split impression counts
+    date_impression_count = defaultdict(list)
+    date_list = []
 
-            action = "created" if created else "updated"
-            print(f"Impression analytics {action} for project {project.name} with default values.")
-            return impression_analytics  # Return the default analytics object
+    # In time order, so the dates list doesn't depend on which index the database happens to use
+    for latest_datetime in impressions.order_by("latest_datetime").values_list("latest_datetime", flat=True).iterator(chunk_size=5000):
+        date_str = latest_datetime.date().strftime('%Y-%m-%d')
 
-        # Initialize variables for calculations
-        total_impressions = impressions.count()
+        if date_str not in date_impression_count:
+            date_list.append(date_str)
 
-        # Initialize data structures for the split impression counts
-        date_impression_count = defaultdict(list)
-        date_list = []
+        # Collect impressions by date to calculate the time splits later
+        date_impression_count[date_str].append(latest_datetime)
 
-        for impression in impressions:
-            latest_datetime = impression.latest_datetime
-            date_str = latest_datetime.date().strftime('%Y-%m-%d')
+    # Prepare the impression count split by time (dividing the day into 15 parts)
+    time_intervals = 15
+    split_impression_count = []
 
-            if date_str not in date_list:
-                date_list.append(date_str)
+    for date_str, impressions_on_date in date_impression_count.items():
+        # Sort the impressions to get the first and last impression times for the day
+        impressions_on_date.sort()
+        first_impression_time = impressions_on_date[0]
+        last_impression_time = impressions_on_date[-1]
 
-            # Collect impressions by date to calculate the time splits later
-            date_impression_count[date_str].append(latest_datetime)
+        # Calculate the total duration in minutes between first and last impression time
+        total_duration = (last_impression_time - first_impression_time).total_seconds() / 60  # in minutes
 
-        # Prepare the impression count split by time (dividing the day into 15 parts)
-        time_intervals = 15
-        split_impression_count = []
+        # Calculate the interval duration
+        interval_duration = total_duration / time_intervals  # duration of each interval in minutes
 
-        for date_str, impressions_on_date in date_impression_count.items():
-            # Sort the impressions to get the first and last impression times for the day
-            impressions_on_date.sort()
-            first_impression_time = impressions_on_date[0]
-            last_impression_time = impressions_on_date[-1]
+        # Prepare time intervals
+        time_split = []
+        for i in range(time_intervals):
+            start_time = first_impression_time + timedelta(minutes=i * interval_duration)
+            end_time = first_impression_time + timedelta(minutes=(i + 1) * interval_duration)
 
-            # Calculate the total duration in minutes between first and last impression time
-            total_duration = (last_impression_time - first_impression_time).total_seconds() / 60  # in minutes
+            # Count impressions in the current time slot (the list is sorted, so bisect instead of scanning it)
+            count = bisect.bisect_right(impressions_on_date, end_time) - bisect.bisect_left(impressions_on_date, start_time)
 
-            # Calculate the interval duration
-            interval_duration = total_duration / time_intervals  # duration of each interval in minutes
+            time_split.append({"time": f"{start_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')}", "count": count})
 
-            # Prepare time intervals
-            time_split = []
-            for i in range(time_intervals):
-                start_time = first_impression_time + timedelta(minutes=i * interval_duration)
-                end_time = first_impression_time + timedelta(minutes=(i + 1) * interval_duration)
-                
-                # Count impressions in the current time slot
-                count = sum(1 for imp_time in impressions_on_date if start_time <= imp_time <= end_time)
-                
-                time_split.append({"time": f"{start_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')}", "count": count})
+        split_impression_count.append({"date": date_str, "impression_count": time_split})
 
-            split_impression_count.append({"date": date_str, "impression_count": time_split})
+    return {
+        "date": date_list,
+        "impression_count": split_impression_count,
+        "total_impressions": total_impressions,
+    }
 
-        # Create and save ImpressionAnalyticsModel
-        impression_analytics, created = ImpressionAnalyticsModel.objects.update_or_create(
-            project=project,
-            zone=zone,
-            defaults={
-                "date":date_list,
-                "impression_count":split_impression_count,
-                "total_impressions":total_impressions,
-            }
-        )
-        action = "created" if created else "updated"
-        print(f"Impression analytics {action} for project {project.name}.")
-        return impression_analytics
+def plan_impression_analytics(project, zone):
+    """The ImpressionAnalyticsModel write for the project's zone, or None if it has no impressions service."""
+    values = compute_impression_analytics(project, zone)
+    if values is None:
+        return None
+    plan = ChangePlan(ImpressionAnalyticsModel, list(values))
+    existing = ImpressionAnalyticsModel.objects.filter(project=project, zone=zone).first()
+    plan.add(existing or ImpressionAnalyticsModel(project=project, zone=zone), values)
+    return plan
+
+def calculate_impression_analytics(project, zone):
+    """Calculate and save impression analytics for the given project."""
+    try:
+        plan = plan_impression_analytics(project, zone)
+        if plan is None:
+            return None
+        result = plan.apply()
+        telemetry.count(created=result["created"], updated=result["updated"], skipped=result["unchanged"])
+        print(f"Impression analytics saved for project {project.name}: {result}")
+        return result
 
     except Exception as e:
+        telemetry.count(errors=1)
         print(f"Error while processing impression analytics for project {project.name}: {str(e)}")   
 
-# FOR THIS IMPRESSION DATA update_or_create function does not work properly so just used create functino
 def sync_project_impressions(project, batch_size=1000):
-    """Sync impressions for the project using optimized grouping with batch processing."""
+    """Sync impressions for the project, upserting them on latest datetime and device."""
     try:
-        impressions_data = fetch_zenus_data(f"projects/{project.id}/impressions")
+        impressions_data = fetch_zenus_data(zenus.client_for(project), f"projects/{project.id}/impressions")
 
         if impressions_data["impressions"]:
             if "imp" not in project.type:
                 project.type.append("imp")
                 project.save()
 
-        impressions_to_create = []
-        impressions_to_update = []
+        def impressions():
+            for impression_data in impressions_data["impressions"]:
+                try:
+                    parsed_datetime = parser.isoparse(impression_data['latest_datetime'])
 
-        for impression_data in impressions_data["impressions"]:
-            try:
-                parsed_datetime = parser.isoparse(impression_data['latest_datetime'])
-            except ValueError:
-                raise ValueError(f"Invalid datetime format for qr_code_data: {impression_data['latest_datetime']}")
-
-            # Convert to timezone-aware datetime if necessary
-            parsed_datetime = timezone.make_aware(parsed_datetime)
-
-            booth = get_booth(parsed_datetime, impression_data["device_id"], project)
-
-            # Try to find the existing impression based on `project`, `device_id`, and `latest_datetime`
-            existing_impression = ImpressionModel.objects.filter(
-                project=project,
-                device_id=impression_data["device_id"],
-                latest_datetime=parsed_datetime
-            ).first()
-
-            if existing_impression:
-                # If the impression exists, update it
-                existing_impression.device_name = impression_data["device_name"]
-                existing_impression.dwell_time = impression_data["dwell_time"]
-                existing_impression.energy_median = impression_data["energy_median"]
-                existing_impression.face_height_median = impression_data["face_height_median"]
-                existing_impression.biological_sex = impression_data["biological_sex"]
-                existing_impression.biological_age = impression_data["biological_age"]
-                existing_impression.zone = impression_data["zone"]
-                existing_impression.booth = booth
-                impressions_to_update.append(existing_impression)
-            else:
-                # If the impression does not exist, create a new one
-                impressions_to_create.append(
-                    ImpressionModel(
+                    # Convert to timezone-aware datetime if necessary
+                    parsed_datetime = timezone.make_aware(parsed_datetime)
+
+                    booth = get_booth(parsed_datetime, impression_data["device_id"], project)
+
+                    impression = ImpressionModel(
                         project=project,
                         device_id=impression_data["device_id"],
                         latest_datetime=parsed_datetime,
@@ -674,264 +872,211 @@ def sync_project_impressions(project, batch_size=1000):
                         zone=impression_data["zone"],
                         booth=booth
                     )
-                )
-
-            # When we reach the batch size limit, bulk insert or update and reset the lists
-            if len(impressions_to_create) >= batch_size or len(impressions_to_update) >= batch_size:
-                with transaction.atomic():
-                    if impressions_to_create:
-                        ImpressionModel.objects.bulk_create(impressions_to_create)
-                    if impressions_to_update:
-                        ImpressionModel.objects.bulk_update(impressions_to_update, [
-                            'device_name', 'dwell_time', 'energy_median', 'face_height_median', 
-                            'biological_sex', 'biological_age', 'zone', 'booth'])
-                
-                # Reset the lists for the next batch
-                impressions_to_create = []
-                impressions_to_update = []
-
-        # Handle any remaining impressions after the loop
-        if impressions_to_create or impressions_to_update:
-            with transaction.atomic():
-                if impressions_to_create:
-                    ImpressionModel.objects.bulk_create(impressions_to_create)
-                if impressions_to_update:
-                    ImpressionModel.objects.bulk_update(impressions_to_update, [
-                        'device_name', 'dwell_time', 'energy_median', 'face_height_median', 
-                        'biological_sex', 'biological_age', 'zone', 'booth'])
+                except Exception as e:
+                    telemetry.count(skipped=1)
+                    telemetry.log_row(
+                        "Error processing impression for device %s at %s for project %s: %s",
+                        impression_data['device_id'], impression_data['latest_datetime'], project.name, e, level=logging.WARNING,
+                    )
+                    continue
+
+                yield impression
+
+        result = bulk_upsert(
+            ImpressionModel,
+            impressions(),
+            key_fields=["latest_datetime", "device_id"],
+            update_fields=[
+                "device_name", "dwell_time", "energy_median", "face_height_median",
+                "biological_sex", "biological_age", "zone", "booth",
+            ],
+            scope={"project": project},
+            batch_size=batch_size,
+        )
+        telemetry.count(created=result["created"], updated=result["updated"], skipped=result["unchanged"])
 
-        print(f"Impressions synced for project {project.name}")
+        print(f"Impressions synced for project {project.name}: {result}")
 
     except Exception as e:
+        telemetry.count(errors=1)
         print(f"Error syncing impressions for project {project.name}: {str(e)}")
 
 def sync_project_unique_impressions(project, batch_size=1000):
-    """Sync unique impressions for a given project using optimized batching."""
+    """Sync unique impressions for a given project, upserting them on their natural key."""
     try:
-        impressions_data = fetch_zenus_data(f'projects/{project.id}/unique-impressions')
+        impressions_data = fetch_zenus_data(zenus.client_for(project), f'projects/{project.id}/unique-impressions')
         
         if impressions_data and 'uniqueImpressions' in impressions_data:
-            unique_impressions = impressions_data['uniqueImpressions']
-            unique_impressions_to_create = []
-            unique_impressions_to_update = []
-
-            for impression_data in unique_impressions:
-                try:
+            def unique_impressions():
+                for impression_data in impressions_data['uniqueImpressions']:
                     try:
                         parsed_datetime = parser.isoparse(impression_data['date'])
-                    except ValueError:
-                        raise ValueError(f"Invalid datetime format for qr_code_data: {impression_data['date']}")
 
-                    # Convert to timezone-aware datetime if necessary
-                    parsed_datetime = timezone.make_aware(parsed_datetime)
-
-                    booth = get_booth(parsed_datetime, impression_data['device_id'], project)
-
-                    # Try to find the existing unique impression based on `device_id` and `date`
-                    existing_impression = UniqueImpressionModel.objects.filter(
-                        project=project,
-                        device_id=impression_data['device_id'],
-                        date=parsed_datetime,
-                        zone=impression_data['zone'],
-                        is_staff=impression_data['is_staff'],
-                        impressions_total=impression_data['impressions_total'],
-                        visit_duration=impression_data['visit_duration'],
-                        dwell_time=impression_data['dwell_time'],
-                        energy_median=impression_data['energy_median'],
-                        face_height_median=impression_data['face_height_median'],
-                        biological_sex=impression_data['biological_sex'],
-                        biological_age=impression_data['biological_age'],
-                        booth=booth
-                    ).first()
-
-                    if existing_impression:
-                        # If the unique impression exists, update it
-                        existing_impression.is_staff = impression_data['is_staff']
-                        existing_impression.impressions_total = impression_data['impressions_total']
-                        existing_impression.visit_duration = impression_data['visit_duration']
-                        existing_impression.dwell_time = impression_data['dwell_time']
-                        existing_impression.energy_median = impression_data['energy_median']
-                        existing_impression.face_height_median = impression_data['face_height_median']
-                        existing_impression.biological_sex = impression_data['biological_sex']
-                        existing_impression.biological_age = impression_data['biological_age']
-                        existing_impression.booth = booth
-                        unique_impressions_to_update.append(existing_impression)
-                    else:
-                        # If the unique impression does not exist, create a new one
-                        unique_impressions_to_create.append(
-                            UniqueImpressionModel(
-                                project=project,
-                                device_id=impression_data['device_id'],
-                                date=parsed_datetime,
-                                zone=impression_data['zone'],
-                                is_staff=impression_data['is_staff'],
-                                impressions_total=impression_data['impressions_total'],
-                                visit_duration=impression_data['visit_duration'],
-                                dwell_time=impression_data['dwell_time'],
-                                energy_median=impression_data['energy_median'],
-                                face_height_median=impression_data['face_height_median'],
-                                biological_sex=impression_data['biological_sex'],
-                                biological_age=impression_data['biological_age'],
-                                booth=booth
-                            )
+                        # Convert to timezone-aware datetime if necessary
+                        parsed_datetime = timezone.make_aware(parsed_datetime)
+
+                        booth = get_booth(parsed_datetime, impression_data['device_id'], project)
+
+                        impression = UniqueImpressionModel(
+                            project=project,
+                            device_id=impression_data['device_id'],
+                            date=parsed_datetime.date(),
+                            zone=impression_data['zone'],
+                            is_staff=impression_data['is_staff'],
+                            impressions_total=impression_data['impressions_total'],
+                            visit_duration=impression_data['visit_duration'],
+                            dwell_time=impression_data['dwell_time'],
+                            energy_median=impression_data['energy_median'],
+                            face_height_median=impression_data['face_height_median'],
+                            biological_sex=impression_data['biological_sex'],
+                            biological_age=impression_data['biological_age'],
+                            booth=booth
                         )
+                    except Exception as e:
+                        telemetry.count(skipped=1)
+                        telemetry.log_row(
+                            "Error while processing unique impression for device %s on %s for project %s: %s",
+                            impression_data['device_id'], impression_data['date'], project.name, e, level=logging.WARNING,
+                        )
+                        continue
+
+                    yield impression
+
+            # Zenus sends no id for unique impressions, so the key is the visit itself: device, day, zone,
+            # staff flag, impression count and durations (floats are compared rounded, see api/bulk.py)
+            result = bulk_upsert(
+                UniqueImpressionModel,
+                unique_impressions(),
+                key_fields=[
+                    "date", "device_id", "zone", "is_staff", "impressions_total", "visit_duration", "dwell_time",
+                ],
+                update_fields=[
+                    "energy_median", "face_height_median", "biological_sex", "biological_age", "booth",
+                ],
+                scope={"project": project},
+                batch_size=batch_size,
+            )
+            telemetry.count(created=result["created"], updated=result["updated"], skipped=result["unchanged"])
 
-                except Exception as e:
-                    print(f"Error while processing unique impression for device {impression_data['device_id']} on {impression_data['date']} for project {project.name}: {str(e)}")
-
-                # When we reach the batch size limit, bulk insert or update and reset the lists
-                if len(unique_impressions_to_create) >= batch_size or len(unique_impressions_to_update) >= batch_size:
-                    with transaction.atomic():
-                        if unique_impressions_to_create:
-                            UniqueImpressionModel.objects.bulk_create(unique_impressions_to_create)
-                        if unique_impressions_to_update:
-                            UniqueImpressionModel.objects.bulk_update(unique_impressions_to_update, [
-                                'is_staff', 'impressions_total', 'visit_duration', 'dwell_time', 'energy_median', 
-                                'face_height_median', 'biological_sex', 'biological_age', 'booth'])
-
-                    # Reset the lists for the next batch
-                    unique_impressions_to_create = []
-                    unique_impressions_to_update = []
-
-            # Handle any remaining unique impressions after the loop
-            if unique_impressions_to_create or unique_impressions_to_update:
-                with transaction.atomic():
-                    if unique_impressions_to_create:
-                        UniqueImpressionModel.objects.bulk_create(unique_impressions_to_create)
-                    if unique_impressions_to_update:
-                        UniqueImpressionModel.objects.bulk_update(unique_impressions_to_update, [
-                            'is_staff', 'impressions_total', 'visit_duration', 'dwell_time', 'energy_median', 
-                            'face_height_median', 'biological_sex', 'biological_age', 'booth'])
-
-        print(f"Unique Impressions synced for project {project.name}")
+            print(f"Unique Impressions synced for project {project.name}: {result}")
 
     except Exception as e:
+        telemetry.count(errors=1)
         print(f"Error syncing unique impressions for project {project.name}: {str(e)}")
 
         
 def sync_project_qr_codes(project, batch_size=1000):
-    """Sync QR codes for the project using optimized grouping."""
+    """Sync QR codes for the project, upserting them on datetime, QR code and device."""
     try:
-        qr_codes_data = fetch_zenus_data(f"projects/{project.id}/qr-sessions")
+        qr_codes_data = fetch_zenus_data(zenus.client_for(project), f"projects/{project.id}/qr-sessions")
 
         if qr_codes_data["qr_codes"]:
             if "qr" not in project.type:
                 project.type.append("qr")
                 project.save()
 
-            qr_codes_to_create = []
-            qr_codes_to_update = []
-
-            for qr_code_data in qr_codes_data["qr_codes"]:
-                try:
-                    parsed_datetime = parser.isoparse(qr_code_data['datetime'])
-                    parsed_datetime = timezone.make_aware(parsed_datetime)
-
-                    session = get_session(parsed_datetime, qr_code_data['device_id'], project, "qr")
-                    if not session:
-                        session = None  # If no session, set to None
-
-                    # Try to find if the QR code already exists
-                    existing_qr_code = QrCodeModel.objects.filter(
-                        device_id=qr_code_data['device_id'],
-                        session=session,
-                        datetime=parsed_datetime,
-                        qr_code = qr_code_data['qr_code'],
-                        project=project
-                    ).first()
-
-                    if existing_qr_code:
-                        # If the QR code exists, update it
-                        existing_qr_code.device_name = qr_code_data['device_name']
-                        qr_codes_to_update.append(existing_qr_code)
-                    else:
-                        # If the QR code does not exist, create a new one
-                        qr_codes_to_create.append(
-                            QrCodeModel(
-                                session=session,
-                                project=project,
-                                datetime=parsed_datetime,
-                                qr_code=qr_code_data['qr_code'],
-                                device_id=qr_code_data['device_id'],
-                                device_name=qr_code_data['device_name'],
-                            )
+            def qr_codes():
+                for qr_code_data in qr_codes_data["qr_codes"]:
+                    try:
+                        parsed_datetime = parser.isoparse(qr_code_data['datetime'])
+                        parsed_datetime = timezone.make_aware(parsed_datetime)
+
+                        session = get_session(parsed_datetime, qr_code_data['device_id'], project, "qr")
+                        if not session:
+                            session = None  # If no session, set to None
+
+                        qr_code = QrCodeModel(
+                            session=session,
+                            project=project,
+                            datetime=parsed_datetime,
+                            qr_code=qr_code_data['qr_code'],
+                            device_id=qr_code_data['device_id'],
+                            device_name=qr_code_data['device_name'],
                         )
-                except Exception as e:
-                    print(f"Error processing QR code for device {qr_code_data['device_id']} at {qr_code_data['datetime']} for project {project.name}: {str(e)}")
-                
-                # When we reach the batch size limit, bulk insert or update and reset the lists
-                if len(qr_codes_to_create) >= batch_size or len(qr_codes_to_update) >= batch_size:
-                    with transaction.atomic():
-                        if qr_codes_to_create:
-                            QrCodeModel.objects.bulk_create(qr_codes_to_create)
-                        if qr_codes_to_update:
-                            QrCodeModel.objects.bulk_update(qr_codes_to_update, ['device_id', 'device_name', 'qr_code'])
-
-                    # Reset the lists for the next batch
-                    qr_codes_to_create = []
-                    qr_codes_to_update = []
-            
-            # Handle any remaining QR codes after the loop
-            if qr_codes_to_create or qr_codes_to_update:
-                with transaction.atomic():
-                    if qr_codes_to_create:
-                        QrCodeModel.objects.bulk_create(qr_codes_to_create)
-                    if qr_codes_to_update:
-                        QrCodeModel.objects.bulk_update(qr_codes_to_update, ['device_id', 'device_name', 'qr_code'])
+                    except Exception as e:
+                        telemetry.count(skipped=1)
+                        telemetry.log_row(
+                            "Error processing QR code for device %s at %s for project %s: %s",
+                            qr_code_data['device_id'], qr_code_data['datetime'], project.name, e, level=logging.WARNING,
+                        )
+                        continue
+
+                    yield qr_code
+
+            # dwell_time isn't synced, calculate_qr_code_dwell_time fills it in afterwards
+            result = bulk_upsert(
+                QrCodeModel,
+                qr_codes(),
+                key_fields=["datetime", "qr_code", "device_id"],
+                update_fields=["device_name", "session"],
+                scope={"project": project},
+                batch_size=batch_size,
+            )
+            telemetry.count(created=result["created"], updated=result["updated"], skipped=result["unchanged"])
 
         print(f"QR Codes synced for project {project.name}")
 
     except Exception as e:
+        telemetry.count(errors=1)
         print(f"Error while syncing QR codes for project {project.name}: {str(e)}")
 
 
+def plan_qr_code_dwell_times(project):
+    """
+    The QrCodeModel dwell time writes for the project: minutes from each scan to the last scan of the
+    same QR code on the same date.
+    """
+    plan = ChangePlan(QrCodeModel, ["dwell_time"])
+
+    # Group QR codes by qr_code and date
+    qr_groups = defaultdict(list)
+    for qr in QrCodeModel.objects.filter(project=project).only("id", "qr_code", "datetime", "dwell_time"):
+        qr_groups[(qr.qr_code, qr.datetime.date())].append(qr)
+
+    # Calculate dwell time for each QR code group
+    for qr_list in qr_groups.values():
+        # Ensure the list is sorted by datetime
+        qr_list.sort(key=lambda x: x.datetime)
+        last_qr = qr_list[-1]  # Last occurrence for this qr_code on the date
+
+        for current_qr in qr_list:
+            if current_qr == last_qr:
+                dwell_time_minutes = 0  # If it's already the last scan, no dwell time
+            else:
+                dwell_time_minutes = int((last_qr.datetime - current_qr.datetime).total_seconds() // 60)
+            plan.add(current_qr, {"dwell_time": dwell_time_minutes})
+    return plan
+
 def calculate_qr_code_dwell_time(project):
     """Calculate and save dwell time for QR codes grouped by project, date, and qr_code."""
     try:
-        # Fetch all QR codes for the project
-        qr_codes = QrCodeModel.objects.filter(project=project).order_by("qr_code", "datetime")
-
-        if not qr_codes.exists():
+        if not QrCodeModel.objects.filter(project=project).exists():
             print(f"No QR codes found for project {project.name}. Skipping dwell time calculation.")
             return
 
-        # Group QR codes by qr_code and date
-        qr_groups = defaultdict(list)
-        for qr in qr_codes:
-            date_str = qr.datetime.date()
-            qr_groups[(qr.qr_code, date_str)].append(qr)
-
-        # Calculate dwell time for each QR code group
-        for (qr_identifier, date_str), qr_list in qr_groups.items():
-            # Ensure the list is sorted by datetime
-            qr_list.sort(key=lambda x: x.datetime)
-            
-            for i, current_qr in enumerate(qr_list):
-                # Find the last scan of the day for this qr_code
-                last_qr = qr_list[-1]  # Last occurrence for this qr_code on the date
-
-                if current_qr == last_qr:
-                    dwell_time_minutes = 0  # If it's already the last scan, no dwell time
-                else:
-                    dwell_time_minutes = int((last_qr.datetime - current_qr.datetime).total_seconds() // 60)
-
-                # Update the dwell time in the database
-                current_qr.dwell_time = dwell_time_minutes
-                current_qr.save()
-
-                print(f"Updated dwell time for QR {qr_identifier} on {date_str}: {dwell_time_minutes} minutes.")
+        result = plan_qr_code_dwell_times(project).apply()
+        telemetry.count(updated=result["updated"], skipped=result["unchanged"])
+        print(f"QR dwell times saved for project {project.name}: {result}")
     
     except Exception as e:
+        telemetry.count(errors=1)
         print(f"Error calculating QR dwell time for project {project.name}: {str(e)}")
 
+def plan_project_qr_codes(project):
+    """The ProjectModel write for the project's number of unique QR codes."""
+    plan = ChangePlan(ProjectModel, ["unique_qr_codes"])
+    unique_qr_count = QrCodeModel.objects.filter(project=project).values("qr_code").distinct().count()
+    plan.add(project, {"unique_qr_codes": unique_qr_count})
+    return plan
+
 def calculate_project_qr_codes(project):
     """Calculate the number of unique QR codes for a given project and store it."""
     try:
-        unique_qr_count = QrCodeModel.objects.filter(project=project).values("qr_code").distinct().count()
-        project.unique_qr_codes = unique_qr_count
-        project.save()
-        print(f"Updated unique QR code count for project {project.name}: {unique_qr_count}")
+        result = plan_project_qr_codes(project).apply()
+        telemetry.count(updated=result["updated"], skipped=result["unchanged"])
+        print(f"Updated unique QR code count for project {project.name}: {project.unique_qr_codes}")
     except Exception as e:
+        telemetry.count(errors=1)
         print(f"Error calculating unique QR codes for project {project.name}: {str(e)}")
 
 def get_qr_session(time_slot, project):
@@ -1010,7 +1155,6 @@ def get_booth(datetime, device_id, project):
     :param project: The project to which the device belongs.
     :return: The associated ProjectBoothModel or None if no booth is found.
     """
-    global count
     try:
         device = ProjectDeviceModel.objects.get(device_id=device_id, project=project)
     except ProjectDeviceModel.DoesNotExist:
@@ -1061,6 +1205,21 @@ def get_booth(datetime, device_id, project):
 
     #     if correct_booth:
     #         break
-    print("correct_booth")
     # return correct_booth  # Return the booth or None if not found
-    return booths[0]
\ No newline at end of file
+    return booths[0]
+
+# Steps run by sync_single_project, in order. benchmark_sync times them one by one.
+SYNC_STEPS = [
+    ("sync_project_stage", sync_project_stage, {}),
+    ("sync_project_booths", sync_project_booths, {}),
+    ("sync_project_devices", sync_project_devices, {}),
+    ("sync_project_observations", sync_project_observations, {}),
+    ("calculate_and_save_analytics", calculate_and_save_analytics, {}),
+    ("sync_project_impressions", sync_project_impressions, {}),
+    ("sync_project_unique_impressions", sync_project_unique_impressions, {}),
+    ("calculate_impression_analytics[internal]", calculate_impression_analytics, {"zone": "internal"}),
+    ("calculate_impression_analytics[aisle]", calculate_impression_analytics, {"zone": "aisle"}),
+    ("sync_project_qr_codes", sync_project_qr_codes, {}),
+    ("calculate_qr_code_dwell_time", calculate_qr_code_dwell_time, {}),
+    ("calculate_project_qr_codes", calculate_project_qr_codes, {}),
+]
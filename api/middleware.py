@@ -0,0 +1,146 @@
+import time
+import threading
+from collections import deque
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from api.images import RENDITIONS_DIR
+from api.instrumentation import QueryCounter, percentile
+from api.profiling import get_config, profiled, request_matches
+
+
+class RequestStats:
+    """
+    Rolling, in-process request statistics per URL name.
+    Keeps the last REQUEST_STATS_WINDOW requests of every URL name and the slowest
+    statements seen for it. Each server process has its own numbers.
+    """
+
+    def __init__(self, window=500, slowest=5):
+        self.window = window
+        self.slowest_size = slowest
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+            self.slowest = {}
+            self.started_at = time.time()
+
+    def record(self, url_name, wall_time, queries):
+        with self.lock:
+            samples = self.samples.setdefault(url_name, deque(maxlen=self.window))
+            samples.append((wall_time, queries.time, queries.count, queries.duplicates))
+
+            slowest = self.slowest.setdefault(url_name, {})
+            for duration, sql in queries.slowest:
+                slowest[sql] = max(duration, slowest.get(sql, 0))
+            if len(slowest) > self.slowest_size:
+                keep = sorted(slowest.items(), key=lambda item: item[1], reverse=True)[:self.slowest_size]
+                self.slowest[url_name] = dict(keep)
+
+    def summary(self):
+        with self.lock:
+            endpoints = []
+            for url_name, samples in self.samples.items():
+                wall = [s[0] for s in samples]
+                endpoints.append({
+                    "url_name": url_name,
+                    "requests": len(samples),
+                    "p50_ms": round(percentile(wall, 50) * 1000, 1),
+                    "p95_ms": round(percentile(wall, 95) * 1000, 1),
+                    "max_ms": round(max(wall) * 1000, 1),
+                    "avg_db_ms": round(sum(s[1] for s in samples) / len(samples) * 1000, 1),
+                    "avg_queries": round(sum(s[2] for s in samples) / len(samples), 1),
+                    "max_duplicate_queries": max(s[3] for s in samples),
+                    "slowest_queries": [
+                        {"sql": sql[:2000], "ms": round(duration * 1000, 1)}
+                        for sql, duration in sorted(
+                            self.slowest.get(url_name, {}).items(), key=lambda item: item[1], reverse=True
+                        )
+                    ],
+                })
+            endpoints.sort(key=lambda e: e["p95_ms"], reverse=True)
+            return {"since": self.started_at, "window": self.window, "endpoints": endpoints}
+
+
+request_stats = RequestStats(
+    window=getattr(settings, "REQUEST_STATS_WINDOW", 500),
+    slowest=getattr(settings, "REQUEST_STATS_SLOWEST_QUERIES", 5),
+)
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Times every request and the SQL it runs, and records the numbers in request_stats
+    under the URL name. In DEBUG the numbers are also sent back in a Server-Timing header,
+    so they show up in the browser's network panel.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, "REQUEST_INSTRUMENTATION", True)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        with QueryCounter(record_statements=True, slowest=request_stats.slowest_size) as queries:
+            start = time.perf_counter()
+            response = self.get_response(request)
+            wall_time = time.perf_counter() - start
+
+        match = request.resolver_match
+        url_name = (match.view_name if match else None) or "<unresolved>"
+        request_stats.record(url_name, wall_time, queries)
+
+        if settings.DEBUG:
+            response["Server-Timing"] = ", ".join([
+                f"total;dur={wall_time * 1000:.1f}",
+                f'db;dur={queries.time * 1000:.1f};desc="{queries.count} queries"',
+                f'dup;desc="{queries.duplicates} duplicate queries"',
+            ])
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Runs requests whose path or URL name matches a profiling URL pattern under cProfile and
+    keeps the profiles of the ones slower than the threshold (see api/profiling.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        if not config["enabled"] or not config["url_patterns"]:
+            return self.get_response(request)
+
+        try:
+            url_name = resolve(request.path_info).view_name
+        except Resolver404:
+            url_name = None
+        if not request_matches(config, request.path, url_name):
+            return self.get_response(request)
+
+        with profiled("request", url_name or request.path, path=request.get_full_path()[:500]):
+            return self.get_response(request)
+
+
+class ImageCacheMiddleware:
+    """
+    Image renditions are stored under content-hashed names and never change (see api/images.py),
+    so when Django serves them they get IMAGE_CACHE_CONTROL. A web server or CDN in front of
+    MEDIA_URL should send the same header for the renditions/ prefix.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = f"{settings.MEDIA_URL.rstrip('/')}/{RENDITIONS_DIR}/"
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.status_code == 200 and request.path.startswith(self.prefix):
+            response["Cache-Control"] = settings.IMAGE_CACHE_CONTROL
+        return response
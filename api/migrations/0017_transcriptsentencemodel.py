@@ -0,0 +1,82 @@
+# Generated by Django 5.1.4 on 2026-10-19 15:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_sentences_to_table(apps, schema_editor):
+    SessionModel = apps.get_model('api', 'SessionModel')
+    TranscriptSentenceModel = apps.get_model('api', 'TranscriptSentenceModel')
+
+    for session in SessionModel.objects.exclude(sentences__isnull=True).iterator():
+        TranscriptSentenceModel.objects.bulk_create(
+            [
+                TranscriptSentenceModel(
+                    session=session,
+                    index=sentence['id'],
+                    text=sentence['text'],
+                    start=sentence['start'],
+                    end=sentence['end'],
+                )
+                for sentence in session.sentences or []
+            ],
+            batch_size=1000,
+        )
+
+
+def copy_sentences_to_session(apps, schema_editor):
+    SessionModel = apps.get_model('api', 'SessionModel')
+    TranscriptSentenceModel = apps.get_model('api', 'TranscriptSentenceModel')
+
+    for session in SessionModel.objects.all().iterator():
+        sentences = TranscriptSentenceModel.objects.filter(session=session).order_by('index')
+        if sentences.exists():
+            session.sentences = [
+                {"id": s.index, "text": s.text, "start": s.start, "end": s.end}
+                for s in sentences
+            ]
+            session.save(update_fields=['sentences'])
+
+
+def add_fulltext_index(apps, schema_editor):
+    # Full-text search across a project's transcripts; only MySQL has FULLTEXT indexes
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'CREATE FULLTEXT INDEX api_transcr_text_ft ON api_transcriptsentencemodel (text)'
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX api_transcr_text_ft ON api_transcriptsentencemodel')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_aitemplatemodel_remove_sessionmodel_video_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscriptSentenceModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('start', models.FloatField()),
+                ('end', models.FloatField()),
+                ('text', models.TextField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transcript_sentences', to='api.sessionmodel')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['session', 'start'], name='api_transcr_session_639b78_idx')],
+                'unique_together': {('session', 'index')},
+            },
+        ),
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(copy_sentences_to_table, copy_sentences_to_session),
+        migrations.RemoveField(
+            model_name='sessionmodel',
+            name='sentences',
+        ),
+    ]
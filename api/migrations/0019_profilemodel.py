@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-19 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_syncrunmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('request', 'Request'), ('sync_step', 'Sync step')], max_length=10)),
+                ('name', models.CharField(max_length=255)),
+                ('path', models.CharField(blank=True, max_length=500, null=True)),
+                ('duration', models.FloatField()),
+                ('stats', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
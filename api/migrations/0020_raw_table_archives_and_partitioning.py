@@ -0,0 +1,126 @@
+# Generated by Django 5.1.4 on 2026-10-19 16:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from api.archive import compress_archive_tables
+from api.partitioning import apply_configured_partitioning, remove_partitioning
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_profilemodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImpressionArchiveModel',
+            fields=[
+                ('latest_datetime', models.DateTimeField()),
+                ('device_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('device_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('zone', models.CharField(blank=True, max_length=255, null=True)),
+                ('dwell_time', models.FloatField()),
+                ('energy_median', models.FloatField()),
+                ('face_height_median', models.IntegerField()),
+                ('biological_sex', models.CharField(choices=[('male', 'Male'), ('female', 'Female'), ('unknown', 'Unknown')], max_length=10)),
+                ('biological_age', models.CharField(max_length=100)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('project_id', models.IntegerField(db_index=True)),
+                ('booth_id', models.BigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ObservationArchiveModel',
+            fields=[
+                ('datetime', models.DateTimeField()),
+                ('device_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('device_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('count_total', models.FloatField(blank=True, null=True)),
+                ('count_male', models.FloatField(blank=True, null=True)),
+                ('count_female', models.FloatField(blank=True, null=True)),
+                ('count_under_40', models.FloatField(blank=True, null=True)),
+                ('count_over_40', models.FloatField(blank=True, null=True)),
+                ('energy', models.FloatField(blank=True, null=True)),
+                ('energy_male', models.FloatField(blank=True, null=True)),
+                ('energy_female', models.FloatField(blank=True, null=True)),
+                ('energy_under_40', models.FloatField(blank=True, null=True)),
+                ('energy_over_40', models.FloatField(blank=True, null=True)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('project_id', models.IntegerField(db_index=True)),
+                ('session_id', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='QrCodeArchiveModel',
+            fields=[
+                ('datetime', models.DateTimeField()),
+                ('device_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('device_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('qr_code', models.CharField(max_length=255)),
+                ('dwell_time', models.IntegerField(default=0, help_text='Dwell time in minutes')),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('project_id', models.IntegerField(db_index=True)),
+                ('session_id', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='projectmodel',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='impressionmodel',
+            name='booth',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='impressions', to='api.projectboothmodel'),
+        ),
+        migrations.AlterField(
+            model_name='impressionmodel',
+            name='project',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='impressions', to='api.projectmodel'),
+        ),
+        migrations.AlterField(
+            model_name='observationmodel',
+            name='project',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='observations', to='api.projectmodel'),
+        ),
+        migrations.AlterField(
+            model_name='observationmodel',
+            name='session',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='observations', to='api.sessionmodel'),
+        ),
+        migrations.AlterField(
+            model_name='qrcodemodel',
+            name='project',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='qr_codes', to='api.projectmodel'),
+        ),
+        migrations.AlterField(
+            model_name='qrcodemodel',
+            name='session',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='qr_codes', to='api.sessionmodel'),
+        ),
+        migrations.AddIndex(
+            model_name='impressionmodel',
+            index=models.Index(fields=['project', 'latest_datetime'], name='api_impress_project_59af45_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='observationmodel',
+            index=models.Index(fields=['project', 'datetime'], name='api_observa_project_4f6709_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='qrcodemodel',
+            index=models.Index(fields=['project', 'datetime'], name='api_qrcodem_project_1ae79f_idx'),
+        ),
+        migrations.RunPython(compress_archive_tables, migrations.RunPython.noop),
+        # Opt-in, see RAW_TABLE_PARTITIONING. Needs the foreign key constraints above dropped first.
+        migrations.RunPython(apply_configured_partitioning, remove_partitioning),
+    ]
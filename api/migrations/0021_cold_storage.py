@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-19 16:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_raw_table_archives_and_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectmodel',
+            name='cold_storage_summary',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectmodel',
+            name='cold_stored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ColdStorageFileModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=100)),
+                ('key', models.CharField(max_length=500)),
+                ('format', models.CharField(choices=[('json', 'Gzipped columnar JSON'), ('parquet', 'Parquet')], max_length=10)),
+                ('rows', models.BigIntegerField()),
+                ('size', models.BigIntegerField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('exported_at', models.DateTimeField()),
+                ('rehydrated_at', models.DateTimeField(blank=True, null=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cold_storage_files', to='api.projectmodel')),
+            ],
+            options={
+                'unique_together': {('project', 'table')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-19 16:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_outbound_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimsUserModel',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('api.usermodel',),
+        ),
+    ]
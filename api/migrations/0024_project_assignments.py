@@ -0,0 +1,64 @@
+# Generated by Django 5.1.4 on 2026-10-19 16:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_assignments_to_table(apps, schema_editor):
+    UserModel = apps.get_model('api', 'UserModel')
+    ProjectModel = apps.get_model('api', 'ProjectModel')
+    ProjectAssignmentModel = apps.get_model('api', 'ProjectAssignmentModel')
+
+    project_ids = set(ProjectModel.objects.values_list('id', flat=True))
+    for user in UserModel.objects.exclude(assigned_project_ids__isnull=True).iterator():
+        # Ids of deleted projects are dropped
+        assigned = {int(project_id) for project_id in user.assigned_project_ids or []} & project_ids
+        ProjectAssignmentModel.objects.bulk_create(
+            [ProjectAssignmentModel(user_id=user.id, project_id=project_id) for project_id in sorted(assigned)],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+def copy_assignments_to_user(apps, schema_editor):
+    UserModel = apps.get_model('api', 'UserModel')
+    ProjectAssignmentModel = apps.get_model('api', 'ProjectAssignmentModel')
+
+    assigned = {}
+    for user_id, project_id in ProjectAssignmentModel.objects.order_by('id').values_list('user_id', 'project_id'):
+        assigned.setdefault(user_id, []).append(project_id)
+    for user_id, project_ids in assigned.items():
+        UserModel.objects.filter(id=user_id).update(assigned_project_ids=project_ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_claims_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectAssignmentModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to='api.projectmodel')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='project_assignments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'project')},
+            },
+        ),
+        migrations.AddField(
+            model_name='usermodel',
+            name='assigned_projects',
+            field=models.ManyToManyField(blank=True, related_name='assigned_users', through='api.ProjectAssignmentModel', to='api.projectmodel'),
+        ),
+        migrations.RunPython(copy_assignments_to_table, copy_assignments_to_user),
+        migrations.RemoveField(
+            model_name='usermodel',
+            name='assigned_project_ids',
+        ),
+    ]
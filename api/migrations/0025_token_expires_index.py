@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-19 16:32
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_project_assignments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='resetpasswordtokenmodel',
+            name='expires',
+            field=models.DateTimeField(db_index=True, default=api.models.get_default_expiration),
+        ),
+        migrations.AlterField(
+            model_name='verificationtokenmodel',
+            name='expires',
+            field=models.DateTimeField(db_index=True, default=api.models.get_default_expiration),
+        ),
+    ]
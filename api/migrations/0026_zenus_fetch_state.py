@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-19 16:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_token_expires_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZenusFetchStateModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=500, unique=True)),
+                ('etag', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_modified', models.CharField(blank=True, max_length=255, null=True)),
+                ('payload_hash', models.CharField(max_length=64)),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='fetch_states', to='api.projectmodel')),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-19 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_zenus_fetch_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessionmodel',
+            name='zenus_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='sessionmodel',
+            unique_together={('project', 'zenus_id')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_session_zenus_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectmodel',
+            name='zenus_account',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_project_zenus_account'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectmodel',
+            name='rehydrate_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_project_rehydrate_requested_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectmodel',
+            name='archive_restored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectmodel',
+            name='archive_summary',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -34,7 +34,10 @@ class UserModel(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False)
     is_reviewer = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
-    assigned_project_ids = models.JSONField(default=list, blank=True)
+    # Projects a non-staff user can see, through ProjectAssignmentModel (see api/permissions.py)
+    assigned_projects = models.ManyToManyField(
+        "ProjectModel", through="ProjectAssignmentModel", related_name="assigned_users", blank=True
+    )
     email_verified = models.BooleanField(default=False)
     created = models.DateField(default=datetime.date.today)
     updated = models.DateField(default=datetime.date.today)
@@ -50,6 +53,21 @@ class UserModel(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return f"{self.email}"
 
+class ClaimsUserModel(UserModel):
+    """
+    The user as ClaimsJWTAuthentication builds it from access token claims, without a query.
+    Fields that aren't claims are deferred; touching any of them loads all of them at once.
+    """
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
 def get_default_expiration():
     return now() + timedelta(hours=1)
 
@@ -57,7 +75,7 @@ def get_default_expiration():
 class VerificationTokenModel(models.Model):
     email = models.EmailField(unique=True)
     token = models.CharField(max_length=255, unique=True)
-    expires = models.DateTimeField(default=get_default_expiration)
+    expires = models.DateTimeField(default=get_default_expiration, db_index=True)  # Swept by api/sweeper.py
 
     class Meta:
         unique_together = ('email', 'token')
@@ -68,7 +86,7 @@ class VerificationTokenModel(models.Model):
 class ResetPasswordTokenModel(models.Model):
     email = models.EmailField(unique=True)
     token = models.CharField(max_length=255, unique=True)
-    expires = models.DateTimeField(default=get_default_expiration)
+    expires = models.DateTimeField(default=get_default_expiration, db_index=True)  # Swept by api/sweeper.py
 
     class Meta:
         unique_together = ('email', 'token')
@@ -106,14 +124,34 @@ class ProjectModel(models.Model):
     client = models.ForeignKey(ClientModel, on_delete=models.SET_NULL, null=True, blank=True, related_name="projects")
     type = models.JSONField(default=list, blank=True)
     unique_qr_codes = models.IntegerField(default=0)
+    archived_at = models.DateTimeField(null=True, blank=True)  # Raw data moved to the archive tables
+    archive_summary = models.JSONField(null=True, blank=True)  # List analytics computed before archiving
+    archive_restored_at = models.DateTimeField(null=True, blank=True)  # Raw data last moved back from the archive tables
+    cold_stored_at = models.DateTimeField(null=True, blank=True)  # Raw data exported to cold storage
+    cold_storage_summary = models.JSONField(null=True, blank=True)  # List analytics computed before the export
+    rehydrate_requested_at = models.DateTimeField(null=True, blank=True)  # Queued for run_worker to load back from cold storage
 
     services = models.JSONField(default=list, blank=True)
     country = models.CharField(max_length=100, blank=True, null=True)
     city = models.CharField(max_length=100, blank=True, null=True)
+    zenus_account = models.CharField(max_length=50, null=True, blank=True)  # ZENUS_ACCOUNTS label of the API key that owns it
 
     def __str__(self):
         return self.name
     
+class ProjectAssignmentModel(models.Model):
+    """A user's access to a project. Staff and superusers see every project without one."""
+    user = models.ForeignKey(UserModel, related_name="project_assignments", on_delete=models.CASCADE)
+    project = models.ForeignKey(ProjectModel, related_name="assignments", on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Also the index scope_to_assigned_projects() looks projects up by
+        unique_together = ('user', 'project')
+
+    def __str__(self):
+        return f"User {self.user_id} assigned to project {self.project_id}"
+
 class ProjectBoothModel(models.Model):
     id = models.AutoField(primary_key=True)
     booth_id = models.CharField(max_length=255, unique=True)  # Use booth ID as unique
@@ -155,6 +193,7 @@ class ProjectDeviceModel(models.Model):
 
 class SessionModel(models.Model):
     id = models.AutoField(primary_key=True)
+    zenus_id = models.CharField(max_length=255, null=True, blank=True)  # The session's id upstream, what the sync matches on
     name = models.CharField(max_length=255)
     start_datetime = models.DateTimeField()
     end_datetime = models.DateTimeField()
@@ -163,14 +202,60 @@ class SessionModel(models.Model):
     video_url = models.TextField(null=True, blank=True)
     audio_url = models.TextField(null=True, blank=True)
     transcript = models.TextField(null=True, blank=True)
-    sentences = models.JSONField(null=True, blank=True)
     project = models.ForeignKey(ProjectModel, related_name="sessions", on_delete=models.CASCADE)
     project_stage = models.ForeignKey(ProjectStageModel, related_name="sessions", on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('project', 'zenus_id')
     
     def __str__(self):
         return f"Session {self.id}"
 
-class ImpressionModel(models.Model):
+class TranscriptSentenceManager(models.Manager):
+    def replace_for_session(self, session, sentences):
+        """Replace the stored transcript of a session with the given sentence dicts."""
+        self.filter(session=session).delete()
+        return self.append_for_session(session, sentences)
+
+    def append_for_session(self, session, sentences):
+        """Append sentence dicts ({"id", "text", "start", "end"}) to a session's transcript."""
+        return self.bulk_create(
+            [
+                self.model(
+                    session=session,
+                    index=sentence["id"],
+                    text=sentence["text"],
+                    start=sentence["start"],
+                    end=sentence["end"],
+                )
+                for sentence in sentences
+            ],
+            batch_size=1000,
+        )
+
+class TranscriptSentenceModel(models.Model):
+    session = models.ForeignKey(SessionModel, related_name="transcript_sentences", on_delete=models.CASCADE)
+    index = models.IntegerField()  # Position of the sentence in the transcript
+    start = models.FloatField()  # Seconds from the start of the video
+    end = models.FloatField()
+    text = models.TextField()
+
+    objects = TranscriptSentenceManager()
+
+    class Meta:
+        unique_together = ('session', 'index')
+        indexes = [
+            models.Index(fields=['session', 'start']),
+        ]
+
+    def __str__(self):
+        return f"Sentence {self.index} of session {self.session_id}"
+
+# Raw data tables. Their columns live in abstract bases so the archive tables below stay identical.
+# The foreign keys have no database constraint because MySQL can't partition tables with foreign keys
+# (see api/partitioning.py); Django still cascades deletes.
+
+class ImpressionFields(models.Model):
     latest_datetime = models.DateTimeField()
     device_id = models.CharField(max_length=255, null=True, blank=True)
     device_name = models.CharField(max_length=255, null=True, blank=True)
@@ -180,9 +265,16 @@ class ImpressionModel(models.Model):
     face_height_median = models.IntegerField()
     biological_sex = models.CharField(max_length=10, choices=[('male', 'Male'), ('female', 'Female'), ('unknown', 'Unknown')])
     biological_age = models.CharField(max_length=100)
-    
-    project = models.ForeignKey(ProjectModel, related_name="impressions", on_delete=models.CASCADE)
-    booth = models.ForeignKey(ProjectBoothModel, related_name="impressions", on_delete=models.CASCADE, null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+class ImpressionModel(ImpressionFields):
+    project = models.ForeignKey(ProjectModel, related_name="impressions", on_delete=models.CASCADE, db_constraint=False)
+    booth = models.ForeignKey(ProjectBoothModel, related_name="impressions", on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["project", "latest_datetime"])]
     
     def __str__(self):
         return f"Impression for project {self.project.name} at {self.latest_datetime}"
@@ -218,7 +310,7 @@ class ImpressionAnalyticsModel(models.Model):
     def __str__(self):
         return f"Impression Analytics for project {self.project.name} on {', '.join(self.date)}"
 
-class ObservationModel(models.Model):
+class ObservationFields(models.Model):
     datetime = models.DateTimeField()
     device_id = models.CharField(max_length=255, null=True, blank=True)
     device_name = models.CharField(max_length=255, null=True, blank=True)
@@ -233,22 +325,36 @@ class ObservationModel(models.Model):
     energy_under_40 = models.FloatField(null=True, blank=True)
     energy_over_40 = models.FloatField(null=True, blank=True)
 
-    project = models.ForeignKey(ProjectModel, related_name="observations", on_delete=models.CASCADE)
-    session = models.ForeignKey(SessionModel, related_name="observations", on_delete=models.CASCADE, null=True, blank=True)
+    class Meta:
+        abstract = True
+
+class ObservationModel(ObservationFields):
+    project = models.ForeignKey(ProjectModel, related_name="observations", on_delete=models.CASCADE, db_constraint=False)
+    session = models.ForeignKey(SessionModel, related_name="observations", on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["project", "datetime"])]
 
     def __str__(self):
         return f"Observation for project {self.project.name} at {self.datetime}"
 
 
-class QrCodeModel(models.Model):
+class QrCodeFields(models.Model):
     datetime = models.DateTimeField()
     device_id = models.CharField(max_length=255, null=True, blank=True)
     device_name = models.CharField(max_length=255, null=True, blank=True)
     qr_code = models.CharField(max_length=255)
     dwell_time = models.IntegerField(default=0, help_text="Dwell time in minutes")
 
-    project = models.ForeignKey(ProjectModel, related_name="qr_codes", on_delete=models.CASCADE)
-    session = models.ForeignKey(SessionModel, related_name="qr_codes", on_delete=models.CASCADE, null=True, blank=True)
+    class Meta:
+        abstract = True
+
+class QrCodeModel(QrCodeFields):
+    project = models.ForeignKey(ProjectModel, related_name="qr_codes", on_delete=models.CASCADE, db_constraint=False)
+    session = models.ForeignKey(SessionModel, related_name="qr_codes", on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["project", "datetime"])]
 
     def __str__(self):
         return f"Qr code for project {self.project.name} at {self.datetime}"
@@ -337,3 +443,145 @@ class CommentModel(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.content[:30]}"  # Show username & preview
+
+class SyncRunModel(models.Model):
+    """
+    Summary of one Zenus sync run, for trend analysis. `steps` has one entry per project and step
+    with its duration, HTTP bytes, rows fetched/created/updated/skipped and queries.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('success', 'Success'),
+        ('failed', 'Failed'),
+    ]
+
+    trigger = models.CharField(max_length=50)  # Entry point, e.g. the sync_zenus_data command
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    started_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)  # Seconds
+    project_ids = models.JSONField(default=list)
+    totals = models.JSONField(default=dict)
+    steps = models.JSONField(default=list)
+    error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Sync run {self.id} ({self.status}) at {self.started_at}"
+
+class ZenusFetchStateModel(models.Model):
+    """
+    What a Zenus metadata endpoint returned the last time its payload was stored: the validators
+    sent back as If-None-Match/If-Modified-Since and a hash of the body, for servers that send
+    neither. Lets the sync skip projects, stages, booths and devices that haven't changed.
+    """
+    endpoint = models.CharField(max_length=500, unique=True)  # e.g. projects/12/booths?include=operatingHours
+    project = models.ForeignKey(ProjectModel, related_name="fetch_states", on_delete=models.CASCADE, null=True, blank=True)
+    etag = models.CharField(max_length=255, null=True, blank=True)
+    last_modified = models.CharField(max_length=255, null=True, blank=True)  # The header as sent
+    payload_hash = models.CharField(max_length=64)  # sha256 of the body
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.endpoint} ({self.etag or self.payload_hash[:12]})"
+
+class ProfileModel(models.Model):
+    """A cProfile capture of a slow request or sync step, stored in pstats (marshal) format."""
+    KIND_CHOICES = [
+        ('request', 'Request'),
+        ('sync_step', 'Sync step'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    name = models.CharField(max_length=255)  # URL name or sync step
+    path = models.CharField(max_length=500, null=True, blank=True)  # Request path, for requests
+    duration = models.FloatField()  # Seconds
+    stats = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} profile of {self.name} ({self.duration:.2f}s) at {self.created_at}"
+
+# Archive tables for the raw data of closed projects (see the archive_projects command). Rows keep
+# their ids and plain project/session/booth ids, so they can be moved back unchanged.
+
+class ObservationArchiveModel(ObservationFields):
+    id = models.BigIntegerField(primary_key=True)
+    project_id = models.IntegerField(db_index=True)
+    session_id = models.IntegerField(null=True, blank=True)
+
+class ImpressionArchiveModel(ImpressionFields):
+    id = models.BigIntegerField(primary_key=True)
+    project_id = models.IntegerField(db_index=True)
+    booth_id = models.BigIntegerField(null=True, blank=True)
+
+class QrCodeArchiveModel(QrCodeFields):
+    id = models.BigIntegerField(primary_key=True)
+    project_id = models.IntegerField(db_index=True)
+    session_id = models.IntegerField(null=True, blank=True)
+
+class ColdStorageFileModel(models.Model):
+    """
+    Manifest entry for one raw table of a project exported to cold storage (see api/cold_storage.py).
+    The file stays after a rehydration, until the project is exported again.
+    """
+    FORMAT_CHOICES = [
+        ('json', 'Gzipped columnar JSON'),
+        ('parquet', 'Parquet'),
+    ]
+
+    project = models.ForeignKey(ProjectModel, related_name="cold_storage_files", on_delete=models.CASCADE)
+    table = models.CharField(max_length=100)  # db_table of the hot model
+    key = models.CharField(max_length=500)  # Path under COLD_STORAGE["LOCATION"]
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    rows = models.BigIntegerField()
+    size = models.BigIntegerField()  # Bytes
+    sha256 = models.CharField(max_length=64)
+    exported_at = models.DateTimeField()
+    rehydrated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('project', 'table')
+
+    def __str__(self):
+        return f"{self.table} of project {self.project_id} ({self.rows} rows, {self.format})"
+
+class OutboundEmailModel(models.Model):
+    """
+    An email waiting for (or done with) delivery by the run_worker command, see api/outbox.py.
+    Requests only insert rows, so a slow email provider never holds up a login or registration.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    to = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    template_name = models.CharField(max_length=255, null=True, blank=True)
+    context = models.JSONField(null=True, blank=True)  # Cleared once sent or failed, it can hold tokens
+    text = models.TextField(null=True, blank=True)  # Plain text body, for emails without a template
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now)
+    last_error = models.TextField(null=True, blank=True)
+    provider_id = models.CharField(max_length=255, null=True, blank=True)  # Id the email backend gave the message
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"Email to {self.to} ({self.status}): {self.subject}"
@@ -0,0 +1,268 @@
+import os
+import random
+import resend
+from email.utils import make_msgid
+from functools import lru_cache
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.text import slugify
+
+resend.api_key = os.environ.get("RESEND_API_KEY")
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "email_templates")
+
+
+@lru_cache(maxsize=None)
+def compiled_template(template_name):
+    """Each email template is loaded and compiled once per process."""
+    return get_template(template_name)
+
+
+def precompile_templates():
+    """Compile every email template up front, so a broken one fails the worker at start. Returns their names."""
+    names = sorted(name for name in os.listdir(TEMPLATE_DIR) if name.endswith(".html"))
+    for name in names:
+        compiled_template(name)
+    return names
+
+
+def render(email):
+    """(html, text) body of an outbox row."""
+    if email.template_name:
+        return compiled_template(email.template_name).render(email.context or {}), email.text
+    return None, email.text
+
+
+class ResendBackend:
+    """Delivers through the Resend batch API, up to 100 emails per HTTP call."""
+
+    max_batch_size = 100
+
+    def send_batch(self, messages):
+        params = []
+        for message in messages:
+            param = {"from": message["from"], "to": [message["to"]], "subject": message["subject"]}
+            if message["html"]:
+                param["html"] = message["html"]
+            if message["text"]:
+                param["text"] = message["text"]
+            params.append(param)
+        response = resend.Batch.send(params)
+        return [item["id"] for item in response["data"]]
+
+
+class FileBackend:
+    """Writes every email to EMAIL_OUTBOX_FILE_PATH as an .eml file, for offline testing."""
+
+    max_batch_size = 100
+
+    def send_batch(self, messages):
+        os.makedirs(settings.EMAIL_OUTBOX_FILE_PATH, exist_ok=True)
+        ids = []
+        for message in messages:
+            name = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{slugify(message['to'])}.eml"
+            with open(os.path.join(settings.EMAIL_OUTBOX_FILE_PATH, name), "wb") as f:
+                f.write(build_message(message).message().as_bytes())
+            ids.append(name)
+        return ids
+
+
+class SmtpBackend:
+    """
+    Delivers over SMTP on one connection per batch, e.g. to a local capture server
+    (MailHog, Mailpit, `python -m aiosmtpd -n`) at EMAIL_OUTBOX_SMTP_HOST:EMAIL_OUTBOX_SMTP_PORT.
+    """
+
+    max_batch_size = 100
+
+    def send_batch(self, messages):
+        connection = get_connection(
+            "django.core.mail.backends.smtp.EmailBackend",
+            host=settings.EMAIL_OUTBOX_SMTP_HOST,
+            port=settings.EMAIL_OUTBOX_SMTP_PORT,
+            fail_silently=False,
+        )
+        emails = [build_message(message, connection) for message in messages]
+        connection.send_messages(emails)
+        return [email.extra_headers.get("Message-ID") for email in emails]
+
+
+def build_message(message, connection=None):
+    email = EmailMultiAlternatives(
+        subject=message["subject"],
+        body=message["text"] or "",
+        from_email=message["from"],
+        to=[message["to"]],
+        connection=connection,
+        headers={"Message-ID": make_msgid()},
+    )
+    if message["html"]:
+        email.attach_alternative(message["html"], "text/html")
+    return email
+
+
+EMAIL_BACKENDS = {
+    "resend": ResendBackend,
+    "file": FileBackend,
+    "smtp": SmtpBackend,
+}
+
+
+def get_backend():
+    return EMAIL_BACKENDS[settings.EMAIL_OUTBOX_BACKEND]()
+
+
+def enqueue(to, subject, template_name=None, context=None, text=None, from_email=None):
+    """
+    Add an email to the outbox. The row is part of the caller's transaction, so an email for a
+    request that rolls back is never sent.
+    """
+    from api.models import OutboundEmailModel
+
+    return OutboundEmailModel.objects.create(
+        to=to,
+        from_email=from_email or settings.EMAIL_OUTBOX_FROM,
+        subject=subject,
+        template_name=template_name,
+        context=context,
+        text=text,
+    )
+
+
+def enqueue_many(emails):
+    """
+    Add several emails to the outbox with one insert. `emails` are dicts of enqueue()'s arguments.
+    """
+    from api.models import OutboundEmailModel
+
+    return OutboundEmailModel.objects.bulk_create([
+        OutboundEmailModel(
+            to=email["to"],
+            from_email=email.get("from_email") or settings.EMAIL_OUTBOX_FROM,
+            subject=email["subject"],
+            template_name=email.get("template_name"),
+            context=email.get("context"),
+            text=email.get("text"),
+        )
+        for email in emails
+    ])
+
+
+def backoff(attempts):
+    """Seconds before the next attempt: doubling from EMAIL_OUTBOX_RETRY_DELAY, with jitter, capped."""
+    delay = min(settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), settings.EMAIL_OUTBOX_MAX_RETRY_DELAY)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(batch_size):
+    """
+    Mark up to batch_size due emails as sending. Several workers can run: locked rows are skipped.
+    A claim lasts EMAIL_OUTBOX_SEND_TIMEOUT seconds, after that a crashed worker's emails are due again.
+    """
+    from api.models import OutboundEmailModel
+
+    now = timezone.now()
+    with transaction.atomic():
+        due = OutboundEmailModel.objects.select_for_update(skip_locked=True).filter(
+            status__in=["pending", "sending"], next_attempt_at__lte=now
+        ).order_by("next_attempt_at")
+        emails = list(due[:batch_size])
+        OutboundEmailModel.objects.filter(id__in=[email.id for email in emails]).update(
+            status="sending", next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_SEND_TIMEOUT)
+        )
+    return emails
+
+
+def deliver_pending(batch_size=None, backend=None):
+    """
+    Send one batch of due emails. Returns {"sent": n, "retried": n, "failed": n}, all zero when
+    nothing was due.
+    """
+    from api.models import OutboundEmailModel
+
+    backend = backend or get_backend()
+    batch_size = min(batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE, backend.max_batch_size)
+    result = {"sent": 0, "retried": 0, "failed": 0}
+    emails = claim_batch(batch_size)
+    if not emails:
+        return result
+
+    # A template that can't render only fails its own email
+    messages = []
+    ready = []
+    errors = {}
+    for email in emails:
+        try:
+            html, text = render(email)
+        except Exception as e:
+            errors[email.id] = f"Rendering {email.template_name} failed: {str(e)}"
+            continue
+        messages.append({"from": email.from_email, "to": email.to, "subject": email.subject, "html": html, "text": text})
+        ready.append(email)
+
+    provider_ids = []
+    if messages:
+        try:
+            provider_ids = backend.send_batch(messages)
+        except Exception as e:
+            for email in ready:
+                errors[email.id] = str(e)
+
+    now = timezone.now()
+    for email, provider_id in zip(ready, provider_ids):
+        email.status = "sent"
+        email.sent_at = now
+        email.provider_id = provider_id
+        email.context = None
+        email.attempts += 1
+        email.last_error = None
+        result["sent"] += 1
+
+    for email in emails:
+        if email.id not in errors:
+            continue
+        email.attempts += 1
+        email.last_error = errors[email.id]
+        if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            email.status = "failed"
+            email.context = None  # Never sent, but it can hold tokens all the same
+            result["failed"] += 1
+        else:
+            email.status = "pending"
+            email.next_attempt_at = now + timedelta(seconds=backoff(email.attempts))
+            result["retried"] += 1
+        print(f"Failed to send email to {email.to} (attempt {email.attempts}): {email.last_error}")
+
+    OutboundEmailModel.objects.bulk_update(
+        emails, ["status", "sent_at", "provider_id", "context", "attempts", "last_error", "next_attempt_at"]
+    )
+    return result
+
+
+def prune_finished(batch_size=1000, max_batches=None, before=None):
+    """
+    Delete sent and failed emails last attempted before `before` (default EMAIL_OUTBOX_RETENTION_DAYS
+    ago), batch_size rows per transaction, stopping after max_batches. Returns the number deleted.
+    """
+    from api.models import OutboundEmailModel
+
+    before = before or timezone.now() - timedelta(days=settings.EMAIL_OUTBOX_RETENTION_DAYS)
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        # Found through the status, next_attempt_at index
+        ids = list(
+            OutboundEmailModel.objects.filter(status__in=["sent", "failed"], next_attempt_at__lt=before)
+            .order_by("next_attempt_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            deleted += OutboundEmailModel.objects.filter(id__in=ids).delete()[0]
+        batches += 1
+    return deleted
@@ -0,0 +1,137 @@
+from datetime import date
+from django.conf import settings
+from django.utils import timezone
+
+# Raw data tables that can be partitioned, with the column their analytics queries filter on by time
+RAW_TABLES = [
+    ("api.ObservationModel", "datetime"),
+    ("api.ImpressionModel", "latest_datetime"),
+    ("api.QrCodeModel", "datetime"),
+]
+
+SCHEMES = ("none", "project", "month")
+FUTURE_PARTITION = "p_future"
+
+
+def raw_tables(apps=None):
+    """[(db_table, time_column)], from the historical models when called from a migration."""
+    if apps is None:
+        from django.apps import apps
+    return [(apps.get_model(label)._meta.db_table, column) for label, column in RAW_TABLES]
+
+
+def month_start(value, months=0):
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_partition(start):
+    return f"p{start:%Y%m}", f"VALUES LESS THAN (TO_DAYS('{month_start(start, 1):%Y-%m-%d}'))"
+
+
+def current_scheme(cursor, table):
+    """The scheme a table is partitioned with now, from MySQL's information_schema."""
+    cursor.execute(
+        "SELECT PARTITION_METHOD, PARTITION_EXPRESSION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL LIMIT 1",
+        [table],
+    )
+    row = cursor.fetchone()
+    if not row:
+        return "none"
+    return "month" if row[0] == "RANGE" else "project"
+
+
+def month_partitions(cursor, table):
+    cursor.execute(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL",
+        [table],
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def partition_table(cursor, table, column, scheme, partitions=None, months_ahead=None):
+    """
+    (Re)partition one raw table. MySQL requires the partitioning column in every unique key, so the
+    primary key becomes (id, project_id) or (id, <time column>); Django keeps using id alone.
+    """
+    partitions = partitions or settings.RAW_TABLE_PARTITIONS
+    months_ahead = settings.RAW_TABLE_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+
+    if current_scheme(cursor, table) != "none":
+        cursor.execute(f"ALTER TABLE `{table}` REMOVE PARTITIONING")
+
+    if scheme == "none":
+        cursor.execute(f"ALTER TABLE `{table}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`)")
+    elif scheme == "project":
+        cursor.execute(
+            f"ALTER TABLE `{table}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `project_id`) "
+            f"PARTITION BY KEY (`project_id`) PARTITIONS {int(partitions)}"
+        )
+    elif scheme == "month":
+        # One partition per month from the oldest row, plus empty ones for the coming months
+        cursor.execute(f"SELECT MIN(`{column}`) FROM `{table}`")
+        oldest = cursor.fetchone()[0] or timezone.now()
+        first = month_start(oldest)
+        last = month_start(timezone.now(), months_ahead)
+        definitions = [f"PARTITION p_old VALUES LESS THAN (TO_DAYS('{first:%Y-%m-%d}'))"]
+        start = first
+        while start <= last:
+            name, bound = month_partition(start)
+            definitions.append(f"PARTITION {name} {bound}")
+            start = month_start(start, 1)
+        definitions.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+        cursor.execute(
+            f"ALTER TABLE `{table}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `{column}`) "
+            f"PARTITION BY RANGE (TO_DAYS(`{column}`)) ({', '.join(definitions)})"
+        )
+    else:
+        raise ValueError(f"Unknown partitioning scheme {scheme}, use one of {', '.join(SCHEMES)}")
+
+
+def add_month_partitions(cursor, table, months_ahead=None):
+    """
+    Split the catch-all partition so there is one for every month up to months_ahead from now.
+    Run it monthly (partition_raw_tables does) or rows of new months all land in p_future.
+    Returns the names of the partitions added.
+    """
+    months_ahead = settings.RAW_TABLE_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    existing = month_partitions(cursor, table)
+    last = month_start(timezone.now(), months_ahead)
+
+    # New partitions can only be split off the end, so start after the newest existing month
+    months = sorted(name for name in existing if name[1:].isdigit())
+    start = month_start(date(int(months[-1][1:5]), int(months[-1][5:7]), 1), 1) if months else month_start(timezone.now())
+    definitions = []
+    while start <= last:
+        name, bound = month_partition(start)
+        definitions.append((name, f"PARTITION {name} {bound}"))
+        start = month_start(start, 1)
+    if not definitions:
+        return []
+
+    cursor.execute(
+        f"ALTER TABLE `{table}` REORGANIZE PARTITION {FUTURE_PARTITION} INTO "
+        f"({', '.join(d for _, d in definitions)}, PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE)"
+    )
+    return [name for name, _ in definitions]
+
+
+def apply_configured_partitioning(apps, schema_editor):
+    """Migration step: partition the raw tables as RAW_TABLE_PARTITIONING says, on MySQL only."""
+    scheme = settings.RAW_TABLE_PARTITIONING
+    if schema_editor.connection.vendor != "mysql" or scheme == "none":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, column in raw_tables(apps):
+            partition_table(cursor, table, column, scheme)
+
+
+def remove_partitioning(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, column in raw_tables(apps):
+            if current_scheme(cursor, table) != "none":
+                partition_table(cursor, table, column, "none")
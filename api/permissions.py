@@ -39,4 +39,27 @@ class IsStaffOrSuperAdmin(permissions.BasePermission):
             user and
             user.is_authenticated and
             (user.is_staff or getattr(user, "is_super_admin", False))
-        )
\ No newline at end of file
+        )
+
+def scope_to_assigned_projects(queryset, user, project_field="project"):
+    """
+    Restrict queryset to rows of projects assigned to user; staff and superusers see everything.
+    The check is a single `project_id IN (SELECT project_id ... WHERE user_id = ...)` inside the
+    query, answered from the assignment table's (user, project) index.
+    project_field is the path from the queryset's model to its project, "" for ProjectModel itself.
+    """
+    if user.is_staff or user.is_superuser:
+        return queryset
+
+    from api.models import ProjectAssignmentModel
+    assigned = ProjectAssignmentModel.objects.filter(user_id=user.id).values("project_id")
+    return queryset.filter(**{f"{project_field}__in" if project_field else "pk__in": assigned})
+
+
+class ProjectScopeMixin:
+    """
+    For views over project data: scope_to_user(queryset) limits it to the requesting user's projects.
+    """
+
+    def scope_to_user(self, queryset, project_field="project"):
+        return scope_to_assigned_projects(queryset, self.request.user, project_field)
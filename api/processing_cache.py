@@ -0,0 +1,245 @@
+import os
+import json
+import hashlib
+import boto3
+from django.conf import settings
+
+
+def hash_file(path, block_size=1024 * 1024):
+    """Return the sha256 hex digest of a file without loading it into memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_text(*parts):
+    """Return the sha256 hex digest of one or more strings."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")  # Keep ("ab", "c") and ("a", "bc") apart
+    return digest.hexdigest()
+
+
+# Writes between full size scans. In between, the size is estimated from the last scan plus what this
+# process wrote, so a write only scans the cache when that passes max_size. The periodic scan picks up
+# what other processes wrote.
+EVICT_SCAN_EVERY = 100
+# Eviction goes down to this share of max_size, leaving room for the next writes before another scan
+EVICT_LOW_WATER = 0.9
+
+
+class SizeLimitedBackend:
+    """Calls evict(), which returns the size left, when the cache may have grown past max_size."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = None  # Unknown until the first scan
+        self.writes = 0
+
+    def written(self, nbytes):
+        self.writes += 1
+        if self.size is not None:
+            self.size += nbytes  # Overwrites are counted twice, which only brings the next scan forward
+        if self.size is None or self.size > self.max_size or self.writes % EVICT_SCAN_EVERY == 0:
+            self.size = self.evict()
+
+
+class LocalCacheBackend(SizeLimitedBackend):
+    """
+    Stores cache entries as files on local disk.
+    Reads refresh the file mtime so eviction drops the least recently used entries first.
+    """
+
+    def __init__(self, location, max_size):
+        super().__init__(max_size)
+        self.location = location
+
+    def _path(self, key):
+        # Fan out into sub directories so no single directory gets huge
+        return os.path.join(self.location, key[:2], key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return data
+
+    def set(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # Atomic, readers never see half written entries
+        self.written(len(data))
+
+    def evict(self):
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.location):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_size:
+            return total
+
+        entries.sort()  # Oldest access first
+        for _, size, path in entries:
+            if total <= self.max_size * EVICT_LOW_WATER:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        return total
+
+
+class S3CacheBackend(SizeLimitedBackend):
+    """
+    Stores cache entries as objects under a prefix in the S3 bucket.
+    S3 has no access time, so eviction drops the oldest written entries first.
+    """
+
+    def __init__(self, location, max_size):
+        super().__init__(max_size)
+        self.prefix = location.strip("/")
+        self.bucket_name = os.environ.get("AWS_S3_BUCKET_NAME")
+        self.s3 = boto3.client(
+            's3',
+            aws_access_key_id=os.environ.get("ACCESS_KEY"),
+            aws_secret_access_key=os.environ.get("SECRET_ACCESS_KEY"),
+            region_name=os.environ.get("AWS_REGION"))
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}"
+
+    def get(self, key):
+        try:
+            obj = self.s3.get_object(Bucket=self.bucket_name, Key=self._key(key))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        return obj["Body"].read()
+
+    def set(self, key, data):
+        self.s3.put_object(Bucket=self.bucket_name, Key=self._key(key), Body=data)
+        self.written(len(data))
+
+    def evict(self):
+        entries = []
+        total = 0
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=f"{self.prefix}/"):
+            for obj in page.get("Contents", []):
+                entries.append((obj["LastModified"], obj["Size"], obj["Key"]))
+                total += obj["Size"]
+
+        if total <= self.max_size:
+            return total
+
+        entries.sort()
+        to_delete = []
+        for _, size, key in entries:
+            if total <= self.max_size * EVICT_LOW_WATER:
+                break
+            to_delete.append({"Key": key})
+            total -= size
+
+        # delete_objects accepts at most 1000 keys per call
+        for i in range(0, len(to_delete), 1000):
+            self.s3.delete_objects(Bucket=self.bucket_name, Delete={"Objects": to_delete[i:i + 1000]})
+        return total
+
+
+class ProcessingCache:
+    """
+    Content-addressed cache for transcription and summarization results.
+
+    - transcripts: audio hash + transcription options -> transcript and sentences
+    - summaries: transcript chunk hash + template hash + model -> summary fragment
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _get_json(self, key):
+        if self.backend is None:
+            return None
+        try:
+            data = self.backend.get(key)
+        except Exception as e:
+            # The cache must never break processing, an unreadable entry is a miss
+            print(f"Failed to read processing cache entry {key}: {e}")
+            return None
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None  # Corrupt entry, treat as a miss
+
+    def _set_json(self, key, value):
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, json.dumps(value).encode("utf-8"))
+        except Exception as e:
+            # The cache must never break processing
+            print(f"Failed to write processing cache entry {key}: {e}")
+
+    def transcript_key(self, audio_hash, options):
+        return hash_text("transcript", audio_hash, json.dumps(options, sort_keys=True))
+
+    def get_transcript(self, audio_hash, options):
+        return self._get_json(self.transcript_key(audio_hash, options))
+
+    def set_transcript(self, audio_hash, options, transcript, sentences):
+        self._set_json(
+            self.transcript_key(audio_hash, options),
+            {"transcript": transcript, "sentences": sentences},
+        )
+
+    def summary_key(self, chunk, template, model):
+        return hash_text("summary", hash_text(chunk), hash_text(template), model)
+
+    def get_summary(self, chunk, template, model):
+        entry = self._get_json(self.summary_key(chunk, template, model))
+        return entry["summary"] if entry else None
+
+    def set_summary(self, chunk, template, model, summary):
+        self._set_json(self.summary_key(chunk, template, model), {"summary": summary})
+
+
+CACHE_BACKENDS = {
+    "local": LocalCacheBackend,
+    "s3": S3CacheBackend,
+}
+
+_processing_cache = None
+
+
+def get_processing_cache():
+    """Return the process wide ProcessingCache configured by settings.PROCESSING_CACHE."""
+    global _processing_cache
+    if _processing_cache is None:
+        config = getattr(settings, "PROCESSING_CACHE", {})
+        backend_name = config.get("BACKEND", "local")
+        backend_cls = CACHE_BACKENDS.get(backend_name)
+        backend = None
+        if backend_cls:
+            backend = backend_cls(config["LOCATION"], config["MAX_SIZE"])
+        _processing_cache = ProcessingCache(backend)
+    return _processing_cache
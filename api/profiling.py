@@ -0,0 +1,128 @@
+import io
+import re
+import time
+import pstats
+import marshal
+import cProfile
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+
+PROFILING_CONFIG_KEY = "profiling:config"
+CONFIG_FIELDS = ("enabled", "url_patterns", "sync_steps", "threshold_ms")
+# What pstats sorts by: the pstats.SortKey values and their aliases (tottime, cumtime, ncalls, ...)
+SORT_KEYS = sorted(pstats.Stats.sort_arg_dict_default)
+
+# Only one profiler can be active at a time (on Python 3.12 cProfile is process wide),
+# so anything that would start a second one just runs unprofiled.
+_profiler_lock = threading.Lock()
+
+_config = {"value": None, "loaded_at": 0.0}
+
+
+def default_config():
+    return {
+        "enabled": settings.PROFILING_ENABLED,
+        "url_patterns": list(settings.PROFILING_URL_PATTERNS),
+        "sync_steps": list(settings.PROFILING_SYNC_STEPS),
+        "threshold_ms": settings.PROFILING_THRESHOLD_MS,
+    }
+
+
+def get_config():
+    """
+    The PROFILING_* settings, overridden by whatever an admin set through admin/profiling/.
+    Re-read from the cache at most every PROFILING_CONFIG_TTL seconds, so every process
+    picks up a toggle without a cache round trip per request.
+    """
+    if _config["value"] is None or time.monotonic() - _config["loaded_at"] > settings.PROFILING_CONFIG_TTL:
+        _config["value"] = {**default_config(), **(cache.get(PROFILING_CONFIG_KEY) or {})}
+        _config["loaded_at"] = time.monotonic()
+    return _config["value"]
+
+
+def set_config(overrides):
+    """Store an admin override (None clears it) and apply it to this process right away."""
+    if overrides is None:
+        cache.delete(PROFILING_CONFIG_KEY)
+    else:
+        cache.set(PROFILING_CONFIG_KEY, {k: v for k, v in overrides.items() if k in CONFIG_FIELDS}, None)
+    _config["value"] = None
+    return get_config()
+
+
+def request_matches(config, path, url_name):
+    """URL patterns are regular expressions matched against the request path or the URL name."""
+    return any(
+        re.search(pattern, path) or (url_name and re.search(pattern, url_name))
+        for pattern in config["url_patterns"]
+    )
+
+
+def step_matches(config, name):
+    return "*" in config["sync_steps"] or name in config["sync_steps"]
+
+
+@contextmanager
+def profiled(kind, name, path=None):
+    """
+    Run the block under cProfile and store the profile if it took longer than the threshold.
+    Does nothing (and costs nothing) while profiling is disabled or another profile is running.
+    """
+    config = get_config()
+    if not config["enabled"] or not _profiler_lock.acquire(blocking=False):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+    finally:
+        _profiler_lock.release()
+        duration = time.perf_counter() - start
+        if duration * 1000 >= config["threshold_ms"]:
+            save_profile(profiler, kind, name, path, duration)
+
+
+@contextmanager
+def profile_step(name, project_id=None):
+    """profiled() for a sync step, if it is one of the configured sync steps."""
+    if not step_matches(get_config(), name):
+        yield
+        return
+    label = f"{name} (project {project_id})" if project_id is not None else name
+    with profiled("sync_step", label):
+        yield
+
+
+def save_profile(profiler, kind, name, path, duration):
+    from api.models import ProfileModel
+
+    profiler.create_stats()
+    try:
+        ProfileModel.objects.create(
+            kind=kind, name=name[:255], path=path, duration=duration, stats=marshal.dumps(profiler.stats)
+        )
+        # Retention: only the newest PROFILING_RETENTION profiles are kept
+        stale = list(ProfileModel.objects.values_list("id", flat=True)[settings.PROFILING_RETENTION:])
+        if stale:
+            ProfileModel.objects.filter(id__in=stale).delete()
+    except Exception as e:
+        # A profile is never worth failing the request or sync step over
+        print(f"Error storing {kind} profile for {name}: {str(e)}")
+
+
+def profile_as_text(profile, sort="cumulative", limit=60):
+    """Render a stored profile the way pstats prints it. `sort` is one of SORT_KEYS."""
+    stream = io.StringIO()
+    stats = pstats.Stats(stream=stream)
+    stats.stats = marshal.loads(bytes(profile.stats))
+    stats.get_top_level_stats()
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
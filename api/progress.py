@@ -0,0 +1,121 @@
+import re
+import time
+import threading
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+# Uploads started without a job_id still report to the old shared group
+LEGACY_PROGRESS_GROUP = "video_upload_progress"
+PROGRESS_STATE_TIMEOUT = 60 * 60
+
+
+# Channels group names only allow ASCII letters, digits, "-", "_" and "." and must be shorter than 100
+# characters; with the prefix above, a job_id of up to 64 of these always makes a valid one
+JOB_ID_PATTERN = r"[A-Za-z0-9_-]{1,64}"
+
+
+def is_valid_job_id(job_id):
+    return bool(re.fullmatch(JOB_ID_PATTERN, job_id))
+
+
+def progress_group_name(job_id):
+    return f"{LEGACY_PROGRESS_GROUP}_{job_id}" if job_id else LEGACY_PROGRESS_GROUP
+
+
+def progress_state_key(job_id):
+    return f"upload_progress:{job_id}"
+
+
+def get_progress_state(job_id):
+    """Return the last progress event sent for a job, or None."""
+    if not job_id:
+        return None
+    return cache.get(progress_state_key(job_id))
+
+
+class ProgressReporter:
+    """
+    Sends upload progress events to the job's channel group.
+
+    Updates are coalesced: within a stage, an event is only sent when at least
+    PROGRESS_MIN_INTERVAL seconds passed and progress moved by PROGRESS_MIN_DELTA
+    points since the last one. Stage start (0) and completion (100) are always sent.
+    The last sent event is kept in the cache so reconnecting clients can catch up.
+    """
+
+    def __init__(self, job_id=None, session_id=None):
+        self.job_id = job_id
+        self.session_id = session_id
+        self.group_name = progress_group_name(job_id)
+        self.min_interval = getattr(settings, "PROGRESS_MIN_INTERVAL", 0.5)
+        self.min_delta = getattr(settings, "PROGRESS_MIN_DELTA", 1)
+        self.channel_layer = get_channel_layer()
+        self.stages = {}  # stage -> (last sent progress, monotonic time it was sent)
+        self.progress = 0
+        # ffmpeg parsing, boto3 transfer threads and the streaming transcriber all report here
+        self.lock = threading.Lock()
+
+    def _send(self, event):
+        async_to_sync(self.channel_layer.group_send)(self.group_name, event)
+
+    def update(self, stage, progress, force=False):
+        progress = max(0, min(int(progress), 100))
+        with self.lock:
+            now = time.monotonic()
+            last_progress, sent_at = self.stages.get(stage, (None, 0))
+            if progress == last_progress:
+                return
+            if not force and last_progress is not None and progress not in (0, 100):
+                if progress - last_progress < self.min_delta or now - sent_at < self.min_interval:
+                    return
+            self.stages[stage] = (progress, now)
+            self.progress = progress
+
+            # Sent under the lock so the stored state is never older than what clients saw
+            self._publish({
+                'type': 'send_progress',
+                'job_id': self.job_id,
+                'session_id': self.session_id,
+                'stage': stage,
+                'progress': progress,
+            })
+
+    def _publish(self, event):
+        if self.job_id:
+            cache.set(progress_state_key(self.job_id), event, PROGRESS_STATE_TIMEOUT)
+        self._send(event)
+
+    def start(self, stage):
+        self.update(stage, 0)
+
+    def finish(self, stage):
+        self.update(stage, 100)
+
+    def counter(self, stage):
+        """Return an on_chunk(done, total) callback reporting chunk completion for a stage."""
+        def on_chunk(done, total):
+            if total:
+                self.update(stage, done * 100 / total)
+        return on_chunk
+
+    def fail(self, message):
+        event = {
+            'type': 'send_progress',
+            'job_id': self.job_id,
+            'session_id': self.session_id,
+            'stage': 'failed',
+            'progress': self.progress,
+            'message': message,
+        }
+        with self.lock:
+            self._publish(event)
+
+    def send_sentences(self, sentences):
+        self._send({
+            'type': 'send_transcript',
+            'job_id': self.job_id,
+            'session_id': self.session_id,
+            'sentences': sentences,
+        })
@@ -1,6 +1,8 @@
 from django.urls import re_path
 from . import consumers
+from .progress import JOB_ID_PATTERN
 
 websocket_urlpatterns = [
     re_path(r'ws/progress/$', consumers.VideoUploadProgressConsumer.as_asgi()),
+    re_path(rf'ws/progress/(?P<job_id>{JOB_ID_PATTERN})/$', consumers.VideoUploadProgressConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -1,6 +1,12 @@
+import re
 from .models import *
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+from api.authentication import stamp_claims
+from api.token_blacklist import FilteredRefreshToken
+from api.images import rendition_url, rendition_urls
 from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth.models import update_last_login
 from django.core.exceptions import ObjectDoesNotExist
@@ -13,6 +19,10 @@ class UserSerializer(serializers.ModelSerializer):
     old_password = serializers.CharField(
         max_length=128, min_length=8, write_only=True, required=False
     )
+    assigned_project_ids = serializers.PrimaryKeyRelatedField(
+        source="assigned_projects", many=True, queryset=ProjectModel.objects.all(), required=False
+    )
+    avatar_renditions = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = UserModel
@@ -21,6 +31,7 @@ class UserSerializer(serializers.ModelSerializer):
             "username",
             "email",
             "avatar",
+            "avatar_renditions",
             "password",
             "old_password",
             "is_superuser",
@@ -36,6 +47,10 @@ class UserSerializer(serializers.ModelSerializer):
         
     
 
+    def get_avatar_renditions(self, obj):
+        """{"full", "card", "thumbnail"} URLs of the avatar, None without one"""
+        return rendition_urls(obj.avatar)
+
     def create(self, validated_data):
         # Pop off raw password (if provided)
         raw_pwd = validated_data.pop("password", None)
@@ -102,6 +117,13 @@ class RegisterSerializer(UserSerializer):
         return user
 
 class LoginSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        # Access tokens copy these from the refresh token, see ClaimsJWTAuthentication
+        token = super().get_token(user)
+        stamp_claims(token, user)
+        return token
+
     def validate(self, attrs):
         data = super().validate(attrs)
 
@@ -117,6 +139,26 @@ class LoginSerializer(TokenObtainPairSerializer):
 
         return data
 
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refreshed access tokens get the user's current claims, not the ones copied from the refresh token."""
+
+    token_class = FilteredRefreshToken
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data["access"])
+        try:
+            user = UserModel.objects.get(id=access[api_settings.USER_ID_CLAIM])
+        except UserModel.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        stamp_claims(access, user)
+        access.set_iat()  # The claims are current, not as old as the refresh token
+        data["access"] = str(access)
+        return data
+
 class SessionAnalyticsSerializer(serializers.ModelSerializer):
     class Meta:
         model = SessionAnalyticsModel
@@ -239,6 +281,7 @@ class ProjectSerializer(serializers.ModelSerializer):
         source="client", queryset=ClientModel.objects.all(), allow_null=True, required=False
     )
     client_name = serializers.CharField(source="client.name", read_only=True)
+    cover_image_renditions = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = ProjectModel
@@ -249,6 +292,7 @@ class ProjectSerializer(serializers.ModelSerializer):
             'end_datetime',
             'deployment_timezone',
             'cover_image_url',
+            'cover_image_renditions',
             'city',
             'country',
             'is_ready',
@@ -260,12 +304,17 @@ class ProjectSerializer(serializers.ModelSerializer):
             'stages',         # nested list of stages & sessions
         ]
 
+    def get_cover_image_renditions(self, obj):
+        """{"full", "card", "thumbnail"} URLs of the cover image, None without one"""
+        return rendition_urls(obj.cover_image_url)
+
 class ProjectAnalyticsSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     name = serializers.CharField()
     start_datetime = serializers.DateTimeField()
     end_datetime = serializers.DateTimeField()
     cover_image_url = serializers.CharField()
+    cover_image_renditions = serializers.DictField(allow_null=True)
     deployment_timezone = serializers.CharField()
     is_ready = serializers.BooleanField()
     client = serializers.CharField()
@@ -304,9 +353,9 @@ class SummarySerializer(serializers.ModelSerializer):
         ]
 
     def get_user_avatar(self, obj):
-        """Returns the user's avatar URL if it exists, otherwise None"""
+        """Returns the user's avatar thumbnail URL if it exists, otherwise None"""
         if obj.user and obj.user.avatar:
-            return obj.user.avatar.url
+            return rendition_url(obj.user.avatar, "thumbnail")
         return None
         
 class CommentSerializer(serializers.ModelSerializer):
@@ -321,10 +370,48 @@ class CommentSerializer(serializers.ModelSerializer):
         return {
             "id": obj.user.id,
             "username": obj.user.username,
-            "avatar_url": obj.user.avatar.url if obj.user.avatar else "",
+            "avatar_url": rendition_url(obj.user.avatar, "thumbnail") or "",
         }
 
 
+class TranscriptSentenceSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source="index")  # Position in the transcript, as the frontend expects
+
+    class Meta:
+        model = TranscriptSentenceModel
+        fields = ["id", "text", "start", "end"]
+
+class TranscriptSentenceSearchSerializer(TranscriptSentenceSerializer):
+    session_id = serializers.IntegerField(source="session.id")
+    session_name = serializers.CharField(source="session.name")
+
+    class Meta(TranscriptSentenceSerializer.Meta):
+        fields = TranscriptSentenceSerializer.Meta.fields + ["session_id", "session_name"]
+
+class SyncRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SyncRunModel
+        fields = ['id', 'trigger', 'status', 'started_at', 'finished_at', 'duration', 'project_ids', 'totals', 'steps', 'error']
+
+class ProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProfileModel
+        fields = ['id', 'kind', 'name', 'path', 'duration', 'created_at']
+
+class ProfilingConfigSerializer(serializers.Serializer):
+    enabled = serializers.BooleanField(required=False)
+    url_patterns = serializers.ListField(child=serializers.CharField(), required=False)
+    sync_steps = serializers.ListField(child=serializers.CharField(), required=False)
+    threshold_ms = serializers.IntegerField(min_value=0, required=False)
+
+    def validate_url_patterns(self, value):
+        for pattern in value:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise serializers.ValidationError(f"Invalid pattern {pattern}: {e}")
+        return value
+
 class ClientSerializer(serializers.ModelSerializer):
     class Meta:
         model = ClientModel
@@ -0,0 +1,237 @@
+import os
+import re
+import queue
+import threading
+from django.conf import settings
+from django.db import connection
+from deepgram import DeepgramClient, LiveOptions, LiveTranscriptionEvents
+from api.transcription import DEEPGRAM_OPTIONS
+
+# Streaming mode asks ffmpeg for constant bitrate MP3 so byte offsets map to audio seconds
+STREAMING_AUDIO_BITRATE = 128000
+SENTENCE_END = re.compile(r'[.!?]["\')\]]*$')
+
+
+class SentenceAssembler:
+    """Groups timestamped words into sentences, splitting on terminal punctuation."""
+
+    def __init__(self):
+        self.words = []
+
+    def feed(self, words):
+        """Add (text, start, end) words and return the sentences they complete."""
+        sentences = []
+        for word in words:
+            self.words.append(word)
+            if SENTENCE_END.search(word[0]):
+                sentences.append(self._build())
+        return sentences
+
+    def flush(self):
+        return [self._build()] if self.words else []
+
+    def _build(self):
+        sentence = {
+            "text": " ".join(w[0] for w in self.words),
+            "start": self.words[0][1],
+            "end": self.words[-1][2],
+        }
+        self.words = []
+        return sentence
+
+
+class DeepgramStreamingBackend:
+    """Feeds audio chunks to Deepgram's live websocket API as they are produced."""
+
+    def __init__(self, on_sentence):
+        self.on_sentence = on_sentence
+        self.assembler = SentenceAssembler()
+        self.finalized = threading.Event()
+        self.connection = None
+
+    def start(self):
+        dg_client = DeepgramClient(os.environ.get("DEEPGRAM_API_KEY"))
+        self.connection = dg_client.listen.websocket.v("1")
+        self.connection.on(LiveTranscriptionEvents.Transcript, self._on_transcript)
+        if not self.connection.start(LiveOptions(**DEEPGRAM_OPTIONS)):
+            raise RuntimeError("Could not open Deepgram streaming connection.")
+
+    def _on_transcript(self, connection, result, **kwargs):
+        if result.is_final:
+            words = [
+                (w.punctuated_word or w.word, w.start, w.end)
+                for w in result.channel.alternatives[0].words
+            ]
+            for sentence in self.assembler.feed(words):
+                self.on_sentence(sentence)
+        if result.from_finalize:
+            self.finalized.set()
+
+    def send(self, chunk):
+        self.connection.send(chunk)
+
+    def finish(self):
+        # Ask Deepgram to flush pending audio and wait for the last results before closing
+        self.connection.finalize()
+        finalized = self.finalized.wait(timeout=30)
+        self.connection.finish()
+        if not finalized:
+            # The sentences so far would pass for the whole transcript
+            raise RuntimeError("Deepgram did not return the final results within 30 seconds.")
+        for sentence in self.assembler.flush():
+            self.on_sentence(sentence)
+
+    def close(self):
+        # Give up on the results, but don't leave the connection open until Deepgram times it out
+        self.connection.finish()
+
+
+class LocalStreamingBackend:
+    """
+    Offline stand-in for the streaming backend.
+    Emits one sentence per SENTENCE_SECONDS of received audio, with text taken in turn
+    from the fixture file (one sentence per line) or a placeholder when there is none.
+    """
+
+    SENTENCE_SECONDS = 5
+
+    def __init__(self, on_sentence):
+        self.on_sentence = on_sentence
+        self.bytes_received = 0
+        self.emitted_until = 0
+        self.lines = []
+
+    def start(self):
+        fixture = getattr(settings, "TRANSCRIPTION_LOCAL_FIXTURE", None)
+        if fixture and os.path.exists(fixture):
+            with open(fixture, "r", encoding="utf-8") as f:
+                self.lines = [line.strip() for line in f if line.strip()]
+
+    def _text(self, index, start, end):
+        if self.lines:
+            return self.lines[index % len(self.lines)]
+        return f"Audio from {start:.0f}s to {end:.0f}s."
+
+    def _emit_until(self, seconds):
+        while self.emitted_until + self.SENTENCE_SECONDS <= seconds:
+            start = self.emitted_until
+            end = start + self.SENTENCE_SECONDS
+            index = int(start // self.SENTENCE_SECONDS)
+            self.on_sentence({"text": self._text(index, start, end), "start": start, "end": end})
+            self.emitted_until = end
+
+    def send(self, chunk):
+        self.bytes_received += len(chunk)
+        self._emit_until(self.bytes_received * 8 / STREAMING_AUDIO_BITRATE)
+
+    def finish(self):
+        seconds = self.bytes_received * 8 / STREAMING_AUDIO_BITRATE
+        self._emit_until(seconds)
+        if seconds > self.emitted_until:
+            start = self.emitted_until
+            index = int(start // self.SENTENCE_SECONDS)
+            self.on_sentence({"text": self._text(index, start, seconds), "start": start, "end": seconds})
+            self.emitted_until = seconds
+
+    def close(self):
+        pass
+
+
+STREAMING_BACKENDS = {
+    "deepgram": DeepgramStreamingBackend,
+    "local": LocalStreamingBackend,
+}
+
+
+def get_streaming_backend(on_sentence):
+    """Instantiate the backend selected by settings.TRANSCRIPTION_STREAMING_BACKEND."""
+    name = getattr(settings, "TRANSCRIPTION_STREAMING_BACKEND", "deepgram")
+    try:
+        backend_cls = STREAMING_BACKENDS[name]
+    except KeyError:
+        raise RuntimeError(f"Unknown transcription streaming backend: {name}")
+    return backend_cls(on_sentence)
+
+
+class StreamingTranscriber:
+    """
+    Pumps audio from a pipe into the streaming backend and collects the resulting sentences.
+
+    Sentences arrive on the backend's own thread. They are handed over through a queue and
+    passed to on_sentences from the pumping thread, so callers can safely touch the database
+    without depending on the backend's threading model.
+    """
+
+    def __init__(self, on_sentences, chunk_size=64 * 1024):
+        self.on_sentences = on_sentences
+        self.chunk_size = chunk_size
+        self.pending = queue.Queue()
+        self.sentences = []
+        self.bytes_streamed = 0
+        self.error = None
+        self.backend = get_streaming_backend(self.pending.put)
+        self.started = False
+        self._thread = None
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                sentence = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            sentence = {"id": len(self.sentences) + len(batch), **sentence}
+            batch.append(sentence)
+        if batch:
+            self.sentences.extend(batch)
+            self.on_sentences(batch)
+
+    def _pump(self, source, sink):
+        try:
+            while True:
+                chunk = source.read(self.chunk_size)
+                if not chunk:
+                    break
+                # Keep copying to the sink after a backend failure so ffmpeg never blocks on a full pipe
+                sink.write(chunk)
+                if self.error is None:
+                    try:
+                        self.backend.send(chunk)
+                        self.bytes_streamed += len(chunk)
+                        self._drain()
+                    except Exception as e:
+                        self.error = e
+            if self.error is None:
+                self.backend.finish()
+                self.started = False  # Finished, nothing left to close
+                self._drain()
+        except Exception as e:
+            self.error = e
+        finally:
+            if self.started:
+                try:
+                    self.backend.close()
+                except Exception:
+                    pass  # Already failed, the error that matters is in self.error
+            connection.close()  # This thread opened its own connection
+
+    def start(self, source, sink):
+        """
+        Start streaming `source` (ffmpeg stdout) to the backend, copying every chunk to `sink`.
+        If the backend can't be started the pipe is still copied to `sink` and wait() raises.
+        """
+        try:
+            self.backend.start()
+            self.started = True
+        except Exception as e:
+            self.error = e
+        self._thread = threading.Thread(target=self._pump, args=(source, sink), daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        """Block until the pipe is exhausted and return (transcript, sentences)."""
+        self._thread.join()
+        if self.error:
+            raise RuntimeError(f"Streaming transcription failed: {self.error}")
+        transcript = " ".join(s["text"] for s in self.sentences)
+        return transcript, self.sentences
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.utils import timezone
+
+
+def delete_expired(model, batch_size=1000, max_batches=None, before=None):
+    """
+    Delete `model` rows whose `expires` is before `before` (default now), batch_size rows per
+    transaction, stopping after max_batches. Returns the number of rows deleted.
+    """
+    before = before or timezone.now()
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        # Found through the expires index
+        ids = list(model.objects.filter(expires__lte=before).order_by("expires").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            deleted += model.objects.filter(id__in=ids).delete()[0]
+        batches += 1
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+def sweep_expired_tokens(batch_size=1000, max_batches=None):
+    """
+    Delete expired email verification and password reset tokens, left behind by abandoned
+    registrations and reset attempts. Returns {table: rows deleted}.
+    """
+    from api.models import ResetPasswordTokenModel, VerificationTokenModel
+
+    now = timezone.now()
+    return {
+        model._meta.db_table: delete_expired(model, batch_size, max_batches, now)
+        for model in (VerificationTokenModel, ResetPasswordTokenModel)
+    }
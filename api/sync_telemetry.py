@@ -0,0 +1,161 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.utils import timezone
+from api.instrumentation import QueryCounter
+
+logger = logging.getLogger("api.sync")
+
+# not_modified: metadata endpoints skipped because Zenus reported (or the payload hash showed) no change
+COUNTERS = (
+    "http_requests", "http_bytes", "rows_fetched", "not_modified", "created", "updated", "deleted", "skipped", "errors",
+)
+
+_local = threading.local()
+
+
+class StepMetrics:
+    """Numbers for one sync step of one project."""
+
+    def __init__(self, name, project_id=None):
+        self.name = name
+        self.project_id = project_id
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows_logged = 0
+
+    def as_dict(self):
+        return {
+            "project_id": self.project_id,
+            "step": self.name,
+            "seconds": round(self.seconds, 3),
+            "queries": self.queries,
+            "query_seconds": round(self.query_seconds, 3),
+            **self.counts,
+        }
+
+
+class SyncRun:
+    """
+    One sync run. Collects the StepMetrics of every step run while it is active and
+    stores them, with totals, in a SyncRunModel row when it ends.
+    """
+
+    def __init__(self, trigger):
+        from api.models import SyncRunModel
+
+        self.record = SyncRunModel.objects.create(trigger=trigger)
+        self.steps = []
+        self.errors = []  # Errors the sync caught and carried on after
+        self.started = time.perf_counter()
+
+    def totals(self):
+        totals = dict.fromkeys(COUNTERS, 0)
+        totals["queries"] = 0
+        for step in self.steps:
+            for key in COUNTERS:
+                totals[key] += step.counts[key]
+            totals["queries"] += step.queries
+        return totals
+
+    def finish(self, error=None):
+        errors = self.errors + ([error] if error else [])
+        self.record.status = "failed" if errors else "success"
+        self.record.error = "\n".join(errors) or None
+        self.record.finished_at = timezone.now()
+        self.record.duration = time.perf_counter() - self.started
+        self.record.project_ids = sorted({s.project_id for s in self.steps if s.project_id is not None})
+        self.record.steps = [step.as_dict() for step in self.steps]
+        self.record.totals = self.totals()
+        self.record.save()
+        logger.info("Sync run %s %s in %.1fs: %s", self.record.id, self.record.status, self.record.duration, self.record.totals)
+
+
+def current_run():
+    return getattr(_local, "run", None)
+
+
+def current_step():
+    return getattr(_local, "step", None)
+
+
+@contextmanager
+def sync_run(trigger):
+    """
+    Record everything synced inside the block as one run. Nested calls (sync_single_project
+    inside the sync_zenus_data command) join the outer run.
+    """
+    run = current_run()
+    if run is not None:
+        yield run
+        return
+
+    run = SyncRun(trigger)
+    _local.run = run
+    try:
+        yield run
+    except Exception as e:
+        run.finish(error=str(e))
+        raise
+    else:
+        run.finish()
+    finally:
+        _local.run = None
+
+
+@contextmanager
+def step(name, project_id=None):
+    """
+    Measure one sync step: wall time and queries here, HTTP and row counts through count().
+    Outside a sync run the step is still logged, just not stored.
+    """
+    metrics = StepMetrics(name, project_id)
+    previous = current_step()
+    _local.step = metrics
+    start = time.perf_counter()
+    queries = QueryCounter()
+    try:
+        with queries:
+            yield metrics
+    finally:
+        metrics.seconds = time.perf_counter() - start
+        metrics.queries = queries.count
+        metrics.query_seconds = queries.time
+        _local.step = previous
+        run = current_run()
+        if run is not None:
+            run.steps.append(metrics)
+        logger.info(
+            "project=%s step=%s %.2fs queries=%d %s",
+            project_id, name, metrics.seconds, metrics.queries,
+            " ".join(f"{key}={value}" for key, value in metrics.counts.items() if value),
+        )
+
+
+def count(**counts):
+    """Add to the counters (see COUNTERS) of the step running in this thread, if any."""
+    metrics = current_step()
+    if metrics is None:
+        return
+    for key, value in counts.items():
+        metrics.counts[key] += value
+
+
+def log_row(message, *args, level=logging.DEBUG):
+    """
+    Log a per-row event, but only the first and then every SYNC_LOG_SAMPLE_RATE-th one of a step,
+    so big projects don't spend their time writing log lines.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    metrics = current_step()
+    if metrics is not None:
+        metrics.rows_logged += 1
+        if (metrics.rows_logged - 1) % settings.SYNC_LOG_SAMPLE_RATE:
+            return
+        message = f"[{metrics.name} row {metrics.rows_logged}] {message}"
+    logger.log(level, message, *args)
@@ -1,3 +1,191 @@
-from django.test import TestCase
+import time
+import datetime
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from api import authentication, token_blacklist
+from api.authentication import ClaimsJWTAuthentication, invalidate_user
+from api.bulk import reconcile
+from api.management.commands import sync_zenus_data
+from api.models import ImpressionModel, ProjectBoothModel, ProjectModel, UserModel
+from api.serializers import LoginSerializer
+from api.token_blacklist import BlacklistFilter, FilteredRefreshToken
 
-# Create your tests here.
+
+@override_settings(JWT_CLAIMS_AUTH=True)
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication._users.clear()
+        self.user = UserModel.objects.create_user(email="reviewer@example.com", username="reviewer", password="secretpass1")
+        self.user.is_staff = True
+        self.user.save()
+        self.auth = ClaimsJWTAuthentication()
+
+    def access_token(self):
+        return self.auth.get_validated_token(str(LoginSerializer.get_token(self.user).access_token))
+
+    def test_fresh_token_is_served_from_claims(self):
+        token = self.access_token()
+        with self.assertNumQueries(0):
+            user = self.auth.get_user(token)
+        self.assertTrue(user.is_staff)
+
+    def test_stale_token_falls_back_to_the_database(self):
+        token = self.access_token()
+        UserModel.objects.filter(id=self.user.id).update(is_staff=False)
+        invalidate_user(self.user.id)
+
+        with self.assertNumQueries(1):
+            user = self.auth.get_user(token)
+        self.assertFalse(user.is_staff)
+        # The current values are remembered, the token's claims are never trusted again
+        with self.assertNumQueries(0):
+            self.assertFalse(self.auth.get_user(token).is_staff)
+
+    def test_stale_token_of_deactivated_user_is_rejected(self):
+        token = self.access_token()
+        UserModel.objects.filter(id=self.user.id).update(is_active=False)
+        invalidate_user(self.user.id)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.get_user(token)
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.get_user(token)
+
+    def test_token_issued_after_invalidation_is_trusted(self):
+        invalidate_user(self.user.id)
+        cache.set(authentication.changed_key(self.user.id), time.time() - 10)  # Changed a while ago
+        token = self.access_token()
+        with self.assertNumQueries(0):
+            self.assertTrue(self.auth.get_user(token).is_staff)
+
+    def test_token_without_claims_loads_the_user(self):
+        token = self.access_token()
+        del token.payload["is_staff"]
+        with self.assertNumQueries(1):
+            self.auth.get_user(token)
+
+
+@override_settings(JWT_BLACKLIST_BLOOM="memory", JWT_BLACKLIST_BLOOM_CAPACITY=1000)
+class BlacklistFilterTests(TestCase):
+    def setUp(self):
+        token_blacklist._filter = None
+        self.user = UserModel.objects.create_user(email="user@example.com", username="user", password="secretpass1")
+
+    def tearDown(self):
+        token_blacklist._filter = None
+
+    def refresh_token(self):
+        return FilteredRefreshToken.for_user(self.user)
+
+    def expires_at(self, token):
+        return datetime.datetime.fromtimestamp(token["exp"], tz=datetime.timezone.utc)
+
+    def test_token_blacklisted_before_the_filter_loads(self):
+        token = self.refresh_token()
+        token.blacklist()
+        self.assertTrue(token_blacklist.get_filter().might_contain(token["jti"], self.expires_at(token)))
+        with self.assertRaises(TokenError):
+            FilteredRefreshToken(str(token))
+
+    def test_token_blacklisted_after_the_filter_loads(self):
+        token = self.refresh_token()
+        self.assertFalse(token_blacklist.get_filter().might_contain(token["jti"], self.expires_at(token)))
+
+        token.blacklist()
+        self.assertTrue(token_blacklist.get_filter().might_contain(token["jti"], self.expires_at(token)))
+        with self.assertRaises(TokenError):
+            FilteredRefreshToken(str(token))
+
+    def test_failed_add_reloads_the_day(self):
+        token = self.refresh_token()
+        blacklist_filter = token_blacklist.get_filter()
+        self.assertFalse(blacklist_filter.might_contain(token["jti"], self.expires_at(token)))
+
+        with mock.patch.object(blacklist_filter.store, "add", side_effect=MemoryError):
+            token.blacklist()  # The signal logs the error, the row is still written
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=token["jti"]).exists())
+        self.assertTrue(blacklist_filter.might_contain(token["jti"], self.expires_at(token)))
+
+    def test_every_blacklisted_jti_is_found(self):
+        blacklist_filter = BlacklistFilter("memory", capacity=1000, error_rate=0.01)
+        tokens = [self.refresh_token() for _ in range(50)]
+        for token in tokens[:25]:
+            token.blacklist()
+        for token in tokens[25:]:
+            BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token["jti"]))
+            blacklist_filter.add(token["jti"], self.expires_at(token))
+        for token in tokens:
+            self.assertTrue(blacklist_filter.might_contain(token["jti"], self.expires_at(token)))
+
+    def test_token_not_blacklisted_skips_the_query(self):
+        token = self.refresh_token()
+        token_blacklist.get_filter().might_contain(token["jti"], self.expires_at(token))  # Loads the day
+        with self.assertNumQueries(0):
+            token.check_blacklist()
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.project = ProjectModel.objects.create(
+            name="Expo", start_datetime=now, end_datetime=now, deployment_timezone="UTC",
+        )
+        for booth_id in ("a", "b", "c"):
+            ProjectBoothModel.objects.create(booth_id=booth_id, name=f"Booth {booth_id}", size=10, project=self.project)
+
+    def booths(self, *booth_ids):
+        return [ProjectBoothModel(booth_id=booth_id, name=f"New {booth_id}", size=20, project=self.project) for booth_id in booth_ids]
+
+    def remaining(self):
+        return sorted(ProjectBoothModel.objects.filter(project=self.project).values_list("booth_id", flat=True))
+
+    def test_creates_updates_and_deletes(self):
+        result = reconcile(ProjectBoothModel.objects.filter(project=self.project), self.booths("a", "d"), "booth_id", ["name", "size"])
+        self.assertEqual(result, {"created": 1, "updated": 1, "unchanged": 0, "deleted": 2, "kept": 0})
+        self.assertEqual(self.remaining(), ["a", "d"])
+
+    def test_protected_rows_are_kept(self):
+        booth_b = ProjectBoothModel.objects.get(booth_id="b")
+        result = reconcile(
+            ProjectBoothModel.objects.filter(project=self.project),
+            self.booths("a"),
+            "booth_id",
+            ["name", "size"],
+            protect=lambda stale: {booth_b.pk},
+        )
+        self.assertEqual(result["deleted"], 1)
+        self.assertEqual(result["kept"], 1)
+        self.assertEqual(self.remaining(), ["a", "b"])
+
+    def test_nothing_deleted_without_delete(self):
+        result = reconcile(ProjectBoothModel.objects.filter(project=self.project), self.booths("a"), "booth_id", ["name", "size"], delete=False)
+        self.assertEqual(result["deleted"], 0)
+        self.assertEqual(self.remaining(), ["a", "b", "c"])
+
+    def sync_booths(self, payload):
+        state = mock.Mock()
+        with mock.patch.object(sync_zenus_data, "fetch_if_changed", return_value=(payload, state)), \
+                mock.patch.object(sync_zenus_data.zenus, "client_for"):
+            sync_zenus_data.sync_project_booths(self.project)
+        return state
+
+    def test_partly_parsed_payload_deletes_nothing(self):
+        # Booth "b" has no size, so the payload can't be trusted to list every booth
+        state = self.sync_booths({"booths": [{"id": "a", "name": "A", "size": 5}, {"id": "b", "name": "B"}]})
+        self.assertEqual(self.remaining(), ["a", "b", "c"])
+        self.assertEqual(ProjectBoothModel.objects.get(booth_id="a").size, 5)
+        state.save.assert_not_called()  # Fetched again next time
+
+    def test_booths_with_impressions_are_kept(self):
+        booth_c = ProjectBoothModel.objects.get(booth_id="c")
+        ImpressionModel.objects.create(
+            project=self.project, booth=booth_c, latest_datetime=timezone.now(), dwell_time=1.0,
+            energy_median=0.5, face_height_median=10, biological_sex="male", biological_age="20-39",
+        )
+        self.sync_booths({"booths": [{"id": "a", "name": "A", "size": 5}]})
+        self.assertEqual(self.remaining(), ["a", "c"])
@@ -0,0 +1,229 @@
+import math
+import hashlib
+import datetime
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# With refresh token rotation every refresh (and logout) first asks the database whether the
+# token is blacklisted, almost always to hear that it isn't. A Bloom filter of the blacklisted
+# jtis answers "not blacklisted" without the query; only a "maybe" still goes to the database, so
+# the filter can never let a blacklisted token through, whatever is missing from it.
+#
+# There is one filter per day of token expiry: a token is checked against its own expiry day's
+# filter, and a day's filter is simply dropped once its tokens have expired, so the filters never
+# fill up with tokens that can't be presented any more. A filter is loaded from the database the
+# first time it is needed; blacklisting a token afterwards adds it (post_save on BlacklistedToken).
+#
+# JWT_BLACKLIST_BLOOM picks where the filters live: "memory" (per process, so the settings refuse it
+# unless there is a single web process, since tokens another process blacklists would be missing),
+# "redis" (shared through REDIS_URL) or "off".
+
+
+def filter_size(capacity, error_rate):
+    """(bits, hash functions) of a filter for `capacity` jtis at the given false positive rate."""
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+def bit_positions(jti, bits, hashes):
+    digest = hashlib.blake2b(jti.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:], "big") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def expiry_day(expires_at):
+    return expires_at.astimezone(datetime.timezone.utc).date()
+
+
+class MemoryFilters:
+    """
+    Per process filters: {day: bytearray}. Bits added before a day is loaded are kept, so a token
+    blacklisted while the day loads is in the filter even if the load's query didn't see it yet.
+    """
+
+    def __init__(self, bits):
+        self.bits = bits
+        self.filters = {}
+        self.loaded = set()
+
+    def test(self, day, positions):
+        """None if the day's filter isn't loaded, else whether all positions are set."""
+        if day not in self.loaded:
+            return None
+        bitmap = self.filters[day]
+        return all(bitmap[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def add(self, day, positions_list, loaded=False):
+        bitmap = self.filters.get(day)
+        if bitmap is None:
+            bitmap = self.filters[day] = bytearray(self.bits // 8 + 1)
+        for positions in positions_list:
+            for p in positions:
+                bitmap[p >> 3] |= 1 << (p & 7)
+        if loaded:
+            self.loaded.add(day)
+
+    def forget(self, day):
+        self.filters.pop(day, None)
+        self.loaded.discard(day)
+
+    def drop_before(self, day):
+        for old in [d for d in self.filters if d < day]:
+            self.forget(old)
+
+
+class RedisFilters:
+    """
+    Shared filters, one Redis string per day used as a bitmap. The bit after the filter's last
+    one marks the day as loaded, so a bitmap that only holds bits added since (or that Redis
+    evicted) is never mistaken for a complete one.
+    """
+
+    def __init__(self, bits):
+        import redis
+
+        if not settings.REDIS_URL:
+            raise ImproperlyConfigured("JWT_BLACKLIST_BLOOM=redis needs REDIS_URL.")
+        self.bits = bits
+        self.client = redis.Redis.from_url(settings.REDIS_URL)
+
+    def key(self, day):
+        return f"jwt:blacklist:bloom:{day:%Y%m%d}"
+
+    def test(self, day, positions):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.getbit(self.key(day), self.bits)
+        for p in positions:
+            pipe.getbit(self.key(day), p)
+        loaded, *values = pipe.execute()
+        if not loaded:
+            return None
+        return all(values)
+
+    def add(self, day, positions_list, loaded=False):
+        key = self.key(day)
+        pipe = self.client.pipeline(transaction=False)
+        for positions in positions_list:
+            for p in positions:
+                pipe.setbit(key, p, 1)
+        if loaded:
+            pipe.setbit(key, self.bits, 1)
+        # Kept a day past the last expiry in it
+        pipe.expireat(key, datetime.datetime.combine(day + datetime.timedelta(days=2), datetime.time.min, tzinfo=datetime.timezone.utc))
+        pipe.execute()
+
+    def forget(self, day):
+        self.client.delete(self.key(day))
+
+    def drop_before(self, day):
+        pass  # The keys expire
+
+
+class BlacklistFilter:
+    def __init__(self, backend, capacity, error_rate):
+        self.bits, self.hashes = filter_size(capacity, error_rate)
+        self.store = MemoryFilters(self.bits) if backend == "memory" else RedisFilters(self.bits)
+
+    def load(self, day):
+        start = datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+        jtis = list(BlacklistedToken.objects.filter(
+            token__expires_at__gte=start, token__expires_at__lt=start + datetime.timedelta(days=1)
+        ).values_list("token__jti", flat=True))
+        # Marked loaded only once every jti is in; tokens blacklisted meanwhile are added by the signal
+        self.store.add(day, [bit_positions(jti, self.bits, self.hashes) for jti in jtis], loaded=True)
+        print(f"Loaded the token blacklist filter for {day}: {len(jtis)} tokens")
+
+    def might_contain(self, jti, expires_at):
+        day = expiry_day(expires_at)
+        positions = bit_positions(jti, self.bits, self.hashes)
+        found = self.store.test(day, positions)
+        if found is None:
+            self.store.drop_before(expiry_day(timezone.now()))
+            self.load(day)
+            found = self.store.test(day, positions)
+        return found
+
+    def add(self, jti, expires_at):
+        day = expiry_day(expires_at)
+        try:
+            self.store.add(day, [bit_positions(jti, self.bits, self.hashes)])
+        except Exception:
+            # A loaded filter must never miss a blacklisted token: make the day load again
+            self.store.forget(day)
+            raise
+
+
+_filter = None
+
+
+def get_filter():
+    """The process' BlacklistFilter, or None when JWT_BLACKLIST_BLOOM is off."""
+    global _filter
+    if settings.JWT_BLACKLIST_BLOOM == "off":
+        return None
+    if _filter is None:
+        _filter = BlacklistFilter(
+            settings.JWT_BLACKLIST_BLOOM,
+            settings.JWT_BLACKLIST_BLOOM_CAPACITY,
+            settings.JWT_BLACKLIST_BLOOM_ERROR_RATE,
+        )
+    return _filter
+
+
+def token_blacklisted(sender, instance, created, **kwargs):
+    # Added before the row commits: a rolled back blacklisting only costs a false positive
+    blacklist_filter = get_filter()
+    if not created or blacklist_filter is None:
+        return
+    try:
+        blacklist_filter.add(instance.token.jti, instance.token.expires_at)
+    except Exception as e:
+        print(f"Error adding token {instance.token.jti} to the blacklist filter: {str(e)}")
+
+
+def connect_signals():
+    post_save.connect(token_blacklisted, sender=BlacklistedToken, dispatch_uid="token_blacklist_filter")
+
+
+class FilteredRefreshToken(RefreshToken):
+    """RefreshToken that only asks the database about the blacklist when the filter says maybe."""
+
+    def check_blacklist(self):
+        blacklist_filter = get_filter()
+        if blacklist_filter is not None:
+            try:
+                expires_at = datetime.datetime.fromtimestamp(self.payload["exp"], tz=datetime.timezone.utc)
+                if not blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM], expires_at):
+                    return
+            except Exception as e:
+                print(f"Error checking the token blacklist filter: {str(e)}")
+        super().check_blacklist()
+
+
+def prune_expired_tokens(chunk_size=5000, before=None, max_chunks=None):
+    """
+    Delete outstanding tokens (and their blacklist rows) that expired before `before` (default now),
+    chunk_size at a time, each chunk in its own transaction so the tables are never locked for long.
+    Stops after max_chunks chunks. Returns {"outstanding": n, "blacklisted": n}.
+    """
+    before = before or timezone.now()
+    deleted = {"outstanding": 0, "blacklisted": 0}
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        chunks += 1
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lt=before).order_by("expires_at").values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            deleted["blacklisted"] += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+            deleted["outstanding"] += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+    return deleted
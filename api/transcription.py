@@ -0,0 +1,125 @@
+import os
+from openai import OpenAI
+from deepgram import DeepgramClient, PrerecordedOptions
+from api.processing_cache import get_processing_cache, hash_file
+
+DEEPGRAM_OPTIONS = {
+    "model": "nova-3",
+    "language": "en",
+    "smart_format": True,
+}
+
+SUMMARY_MODEL = "gpt-4"
+
+SUMMARY_PROMPT_TEMPLATE = """
+            {template}
+            {chunk}
+        """.strip()
+
+
+def extract_sentences(response):
+    """Flatten Deepgram paragraphs into the sentence list stored on SessionModel."""
+    all_sentences = []
+    paragraphs = response['results']['channels'][0]['alternatives'][0]['paragraphs']['paragraphs']
+    index = 0
+    for para in paragraphs:
+        for sentence in para['sentences']:
+            all_sentences.append({
+                "id": index,
+                "text": sentence['text'],
+                "start": sentence['start'],
+                "end": sentence['end']
+            })
+            index += 1
+    transcript = response['results']['channels'][0]['alternatives'][0]['transcript']
+    return transcript, all_sentences
+
+
+def transcribe_audio(audio_url, audio_path):
+    """
+    Transcribe the audio at audio_url with Deepgram and return (transcript, sentences).
+    audio_path is the local copy of the same audio, used to look the result up by content hash
+    so the same recording is never sent to Deepgram twice.
+    """
+    cache = get_processing_cache()
+    audio_hash = hash_file(audio_path)
+
+    cached = cache.get_transcript(audio_hash, DEEPGRAM_OPTIONS)
+    if cached:
+        print(f"Transcript cache hit for audio {audio_hash[:12]}")
+        return cached["transcript"], cached["sentences"]
+
+    try:
+        dg_client = DeepgramClient(os.environ.get("DEEPGRAM_API_KEY"))
+        options = PrerecordedOptions(**DEEPGRAM_OPTIONS)
+
+        source = {"url": audio_url}
+        response = dg_client.listen.prerecorded.v("1").transcribe_url(source, options)
+    except Exception as e:
+        raise RuntimeError(f"Deepgram transcription failed: {e}")
+
+    transcript, sentences = extract_sentences(response)
+    cache.set_transcript(audio_hash, DEEPGRAM_OPTIONS, transcript, sentences)
+    return transcript, sentences
+
+
+def split_transcript(transcript, max_chars=8000):
+    sentences = transcript.split('. ')
+    chunks = []
+    current = ''
+    for sentence in sentences:
+        sentence += '. '
+        if len(current) + len(sentence) <= max_chars:
+            current += sentence
+        else:
+            chunks.append(current.strip())
+            current = sentence
+    if current:
+        chunks.append(current.strip())
+    return chunks
+
+
+def summarize_transcript(transcript, template, prompt_template=SUMMARY_PROMPT_TEMPLATE, model=SUMMARY_MODEL, on_chunk=None):
+    """
+    Summarize the transcript chunk by chunk with OpenAI.
+    Each fragment is cached by (chunk hash, template hash, model), so only chunks whose
+    text or template changed are sent again.
+    on_chunk(done, total) is called after every chunk, cached or not.
+    """
+    cache = get_processing_cache()
+    client = None
+    # The cache key covers everything that goes into the prompt except the chunk itself
+    template_text = prompt_template.format(chunk="", template=template)
+
+    try:
+        chunks = split_transcript(transcript)
+        summaries = []
+
+        for i, chunk in enumerate(chunks):
+            summary = cache.get_summary(chunk, template_text, model)
+            if summary is not None:
+                print(f"🧠 Summary cache hit for chunk {i + 1}/{len(chunks)}")
+                summaries.append(summary)
+                if on_chunk:
+                    on_chunk(i + 1, len(chunks))
+                continue
+
+            print(f"🧠 Summarizing chunk {i + 1}/{len(chunks)}...")
+            if client is None:
+                client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+            prompt = prompt_template.format(chunk=chunk, template=template)
+
+            response = client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}]
+            )
+            summary = response.choices[0].message.content
+            cache.set_summary(chunk, template_text, model, summary)
+            summaries.append(summary)
+            if on_chunk:
+                on_chunk(i + 1, len(chunks))
+
+        return "\n\n".join(summaries)
+
+    except Exception as e:
+        raise RuntimeError(f"OpenAI summarization failed: {e}")
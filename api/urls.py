@@ -26,10 +26,16 @@ urlpatterns = [
     path('admin/get-presigned-url', GetPresignedUrlView.as_view(), name='get_presigned_url'),
     path("admin/update-project/", AdminUpdateProjectView.as_view(), name='update-project'),
     path("admin/upload-video/", AdminUploadVideoView.as_view(), name='upload-video'),
+    path("admin/request-stats/", AdminRequestStatsView.as_view(), name="request-stats"),
+    path("admin/profiling/", AdminProfilingView.as_view(), name="profiling"),
+    path("admin/profiles/<int:profile_id>/", AdminProfileDownloadView.as_view(), name="profile-download"),
     path('admin/sync-all-project', AdminSyncAllProjectAPIView.as_view(), name='sync_all_project'),
     path("admin/users/<int:user_id>/projects/", AdminAssignUserProjectsView.as_view(), name="user-projects"),
+    path("admin/users/bulk/", AdminBulkUserActionView.as_view(), name="users-bulk"),
+    path("admin/users/projects/bulk/", AdminBulkAssignProjectsView.as_view(), name="user-projects-bulk"),
     path('admin/sync-project-list', AdminSyncProjectListAPIView.as_view(), name='sync_project_list'),
     path('admin/sync-one-project/<int:project_id>/', AdminSyncOneProjectAPIView.as_view(), name='sync_one_project'),
+    path("admin/sync-runs/", AdminSyncRunListView.as_view(), name="sync-runs"),
     path("admin/upload-project-image/", ProjectImageUploadView.as_view(), name="upload-project-image"),
     path("auth/verify-email/", VerifyEmailView.as_view(), name="verify-email"),
     path("auth/forgot-password/", ForgotPasswordView.as_view(), name="forgot-password"),
@@ -51,6 +57,8 @@ urlpatterns = [
     path("profile/upload-avatar/", AvatarUploadView.as_view(), name="upload-avatar"),
     path("profile", ProfileViewSet.as_view()),
     path("user/comments/", CommentInfoView.as_view(), name="get_comments"),  # GET request
+    path("user/sessions/<int:session_id>/sentences/", SessionSentenceListView.as_view(), name="session-sentences"),
+    path("user/projects/<int:project_id>/sentences/search/", ProjectSentenceSearchView.as_view(), name="project-sentence-search"),
     path("admin/comments/add", CommentAddView.as_view(), name="add_comment"),  # POST request
     path("admin/comments/delete/<int:comment_id>/", CommentDeleteView.as_view(), name="delete_comment"),
     path("pub/send-contact-email/", SendContactEmail.as_view(), name="send_contact_email"),
@@ -0,0 +1,414 @@
+import os
+import io
+import re
+import csv
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from api.authentication import invalidate_user
+from api.outbox import enqueue_many
+
+# Bulk user administration: create, update and delete many users, or change many users' project
+# assignments, from one CSV upload or JSON list. Every row is validated first, with a few queries for
+# the whole batch; if any row is invalid nothing is written. Otherwise all writes happen in one
+# transaction and the invitation emails are queued with one insert, as part of it.
+#
+# User rows:       action (create, update or delete; default create), id, email, username, password,
+#                  is_staff, is_reviewer, is_superuser, is_active, project_ids
+# Assignment rows: user_id or email, project_ids, mode (set, add or remove; default set)
+#
+# Updates and deletes find the user by id, else by email. Missing or blank columns are left unchanged;
+# users created without a password get a temporary one in their invitation. project_ids are separated
+# by ";" (or spaces) in CSV files.
+
+USER_ACTIONS = ("create", "update", "delete")
+ASSIGNMENT_MODES = ("set", "add", "remove")
+BOOLEAN_FIELDS = ("is_staff", "is_reviewer", "is_superuser", "is_active")
+TRUE_VALUES = ("1", "true", "yes", "y")
+FALSE_VALUES = ("0", "false", "no", "n")
+
+
+class BulkInputError(Exception):
+    pass
+
+
+def read_rows(request, key):
+    """Rows of a multipart `file` CSV upload, or the JSON list in request.data[key] (or request.data itself)."""
+    upload = request.FILES.get("file")
+    if upload is not None:
+        try:
+            text = upload.read().decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise BulkInputError("The CSV file must be UTF-8 encoded.")
+        rows = [
+            {name.strip(): value.strip() for name, value in row.items() if name and value and value.strip()}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+    else:
+        rows = request.data.get(key) if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise BulkInputError(f"Send a CSV file as `file` or a JSON list of objects as `{key}`.")
+
+    if not rows:
+        raise BulkInputError("No rows to process.")
+    if len(rows) > settings.BULK_USER_ADMIN_MAX_ROWS:
+        raise BulkInputError(f"At most {settings.BULK_USER_ADMIN_MAX_ROWS} rows per request.")
+    return rows
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in TRUE_VALUES:
+        return True
+    if str(value).strip().lower() in FALSE_VALUES:
+        return False
+    raise ValueError(f"{value!r} is not true or false")
+
+
+def parse_ids(value):
+    if isinstance(value, (list, tuple)):
+        return [int(item) for item in value]
+    if isinstance(value, int):
+        return [value]
+    return [int(item) for item in re.split(r"[;,\s]+", str(value).strip()) if item]
+
+
+def given(row, field):
+    return row.get(field) not in (None, "")
+
+
+def welcome_email(email, name, token):
+    """The outbox arguments of the invitation a new user gets, with a link to set their password."""
+    frontend_url = os.environ.get("FRONTEND_URL")
+    return {
+        "to": email,
+        "subject": "Welcome to ROME!",
+        "template_name": "invitation_welcome_email.html",
+        "context": {
+            "user_email": email,
+            "user_name": name,
+            "set_password_link": f"{frontend_url}/reset-password?token={token}",
+            "login_link": f"{frontend_url}/login",
+        },
+    }
+
+
+def invitation_emails(users):
+    """
+    The invitations of new users, (email, name) pairs. No password is emailed (or kept in the
+    outbox): each links to the reset password page with a token valid for INVITATION_TOKEN_DAYS.
+    """
+    from api.models import ResetPasswordTokenModel
+
+    expires = timezone.now() + datetime.timedelta(days=settings.INVITATION_TOKEN_DAYS)
+    tokens = {email: get_random_string(length=32) for email, _ in users}
+    ResetPasswordTokenModel.objects.filter(email__in=tokens).delete()
+    ResetPasswordTokenModel.objects.bulk_create(
+        [ResetPasswordTokenModel(email=email, token=token, expires=expires) for email, token in tokens.items()]
+    )
+    return [welcome_email(email, name, tokens[email]) for email, name in users]
+
+
+def summarize(report):
+    summary = {}
+    for entry in report:
+        summary[entry["status"]] = summary.get(entry["status"], 0) + 1
+    return summary
+
+
+def load_references(rows, id_field):
+    """Users referenced by id or email and projects referenced by id, with three queries for all rows."""
+    from api.models import ProjectModel, UserModel
+
+    user_ids = set()
+    emails = set()
+    project_ids = set()
+    for row in rows:
+        try:
+            if given(row, id_field):
+                user_ids.add(int(row[id_field]))
+            if given(row, "project_ids"):
+                project_ids.update(parse_ids(row["project_ids"]))
+        except (TypeError, ValueError):
+            pass  # Reported by the row's own validation
+        if given(row, "email"):
+            emails.add(UserModel.objects.normalize_email(str(row["email"]).strip()))
+
+    users_by_id = UserModel.objects.in_bulk(user_ids)
+    users_by_email = {user.email: user for user in UserModel.objects.filter(email__in=emails)}
+    projects = set(ProjectModel.objects.filter(id__in=project_ids).values_list("id", flat=True))
+    return users_by_id, users_by_email, projects
+
+
+def find_user(row, id_field, users_by_id, users_by_email, errors):
+    from api.models import UserModel
+
+    if given(row, id_field):
+        try:
+            user = users_by_id.get(int(row[id_field]))
+        except (TypeError, ValueError):
+            errors.append(f"{id_field} must be a number.")
+            return None
+    elif given(row, "email"):
+        user = users_by_email.get(UserModel.objects.normalize_email(str(row["email"]).strip()))
+    else:
+        errors.append(f"{id_field} or email is required.")
+        return None
+    if user is None:
+        errors.append("User not found.")
+    return user
+
+
+def validate_project_ids(row, projects, errors):
+    try:
+        project_ids = parse_ids(row["project_ids"])
+    except (TypeError, ValueError):
+        errors.append("project_ids must be numbers.")
+        return None
+    unknown = sorted(set(project_ids) - projects)
+    if unknown:
+        errors.append(f"Unknown projects: {', '.join(map(str, unknown))}.")
+    return list(dict.fromkeys(project_ids))
+
+
+def plan_assignment_changes(changes):
+    """
+    changes: {user_id: (mode, project_ids)}. Returns (assignment ids to delete, (user_id, project_id)
+    pairs to create, {user_id: {"added": n, "removed": n}}), reading the current assignments with one query.
+    """
+    from api.models import ProjectAssignmentModel
+
+    current = {}
+    for assignment_id, user_id, project_id in ProjectAssignmentModel.objects.filter(
+        user_id__in=list(changes)
+    ).values_list("id", "user_id", "project_id"):
+        current.setdefault(user_id, {})[project_id] = assignment_id
+
+    to_delete = []
+    to_create = []
+    counts = {}
+    for user_id, (mode, project_ids) in changes.items():
+        assigned = current.get(user_id, {})
+        wanted = set(project_ids)
+        if mode == "set":
+            removed = [assignment_id for project_id, assignment_id in assigned.items() if project_id not in wanted]
+        elif mode == "remove":
+            removed = [assignment_id for project_id, assignment_id in assigned.items() if project_id in wanted]
+        else:
+            removed = []
+        added = [project_id for project_id in project_ids if project_id not in assigned] if mode != "remove" else []
+        to_delete.extend(removed)
+        to_create.extend((user_id, project_id) for project_id in added)
+        counts[user_id] = {"added": len(added), "removed": len(removed)}
+    return to_delete, to_create, counts
+
+
+def apply_assignment_changes(to_delete, to_create):
+    from api.models import ProjectAssignmentModel
+
+    if to_delete:
+        ProjectAssignmentModel.objects.filter(id__in=to_delete).delete()
+    if to_create:
+        ProjectAssignmentModel.objects.bulk_create(
+            [ProjectAssignmentModel(user_id=user_id, project_id=project_id) for user_id, project_id in to_create],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+def bulk_users(rows, acting_user):
+    """
+    Validate and apply user rows. Returns (ok, report): report has one entry per row with its
+    status: created, updated or deleted, or when not ok, invalid (with errors) or valid. Nothing is
+    written unless every row is valid.
+    """
+    from api.models import UserModel
+
+    users_by_id, users_by_email, projects = load_references(rows, "id")
+    report = []
+    creates = []
+    updates = []
+    deletes = []
+    assignment_changes = {}
+    seen_users = set()
+    seen_emails = set()
+
+    for index, row in enumerate(rows, start=1):
+        errors = []
+        action = str(row.get("action") or "create").strip().lower()
+        entry = {"row": index, "action": action, "email": row.get("email")}
+        report.append(entry)
+        if action not in USER_ACTIONS:
+            entry.update(status="invalid", errors=[f"action must be one of {', '.join(USER_ACTIONS)}."])
+            continue
+
+        user = None
+        if action != "create":
+            user = find_user(row, "id", users_by_id, users_by_email, errors)
+            if user is not None:
+                entry.update(id=user.id, email=user.email)
+                if user.id in seen_users:
+                    errors.append("The user is in an earlier row too.")
+                seen_users.add(user.id)
+                if user.id == acting_user.id:
+                    errors.append(f"You can't {action} yourself in bulk.")
+
+        values = {}
+        if action != "delete":
+            if given(row, "email") and (action == "create" or given(row, "id")):
+                email = UserModel.objects.normalize_email(str(row["email"]).strip())
+                try:
+                    validate_email(email)
+                except ValidationError:
+                    errors.append("Enter a valid email address.")
+                owner = users_by_email.get(email)
+                if email in seen_emails or (owner is not None and owner != user):
+                    errors.append("A user with this email already exists.")
+                seen_emails.add(email)
+                values["email"] = entry["email"] = email
+            elif action == "create":
+                errors.append("email is required.")
+
+            if given(row, "username"):
+                values["username"] = str(row["username"]).strip()
+                if len(values["username"]) > 150:
+                    errors.append("username must be at most 150 characters.")
+            elif action == "create":
+                errors.append("username is required.")
+
+            for field in BOOLEAN_FIELDS:
+                if given(row, field):
+                    try:
+                        values[field] = parse_bool(row[field])
+                    except ValueError as e:
+                        errors.append(f"{field}: {str(e)}.")
+
+            if given(row, "password"):
+                values["password"] = str(row["password"])
+                if not 8 <= len(values["password"]) <= 128:
+                    errors.append("password must be 8 to 128 characters.")
+
+            if given(row, "project_ids"):
+                project_ids = validate_project_ids(row, projects, errors)
+                if project_ids is not None:
+                    entry["project_ids"] = project_ids
+
+        if errors:
+            entry.update(status="invalid", errors=errors)
+            continue
+        entry["status"] = "valid"  # Until written
+        if action == "create":
+            creates.append((entry, values))
+        elif action == "update":
+            updates.append((entry, user, values))
+        else:
+            deletes.append((entry, user))
+
+    if any(entry["status"] == "invalid" for entry in report):
+        return False, report
+
+    # Hashing is the slow part (hundreds of ms per password); PBKDF2 releases the GIL, so hash in threads
+    for _, values in creates:
+        if "password" not in values:
+            # Nobody knows it, the invitation lets the user set theirs
+            values["password"] = get_random_string(length=12)
+    passwords = [values["password"] for _, values in creates] + [
+        values["password"] for _, _, values in updates if "password" in values
+    ]
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+        hashes = iter(pool.map(make_password, passwords))
+
+    new_users = []
+    for _, values in creates:
+        values.pop("password")
+        new_users.append(UserModel(**values, password=next(hashes)))
+
+    update_fields = {"updated"}
+    for entry, user, values in updates:
+        if "password" in values:
+            values["password"] = next(hashes)
+        for field, value in values.items():
+            setattr(user, field, value)
+        user.updated = datetime.date.today()
+        update_fields.update(values)
+
+    with transaction.atomic():
+        UserModel.objects.bulk_create(new_users, batch_size=1000)
+        # bulk_create doesn't return primary keys on MySQL
+        created_ids = dict(UserModel.objects.filter(email__in=[user.email for user in new_users]).values_list("email", "id"))
+        for entry, values in creates:
+            entry.update(id=created_ids[values["email"]], status="created")
+        if updates:
+            UserModel.objects.bulk_update([user for _, user, _ in updates], sorted(update_fields), batch_size=1000)
+        if deletes:
+            UserModel.objects.filter(id__in=[user.id for _, user in deletes]).delete()
+
+        for entry in report:
+            if "project_ids" in entry and entry["action"] != "delete":
+                assignment_changes[entry["id"]] = ("set", entry["project_ids"])
+        to_delete, to_create, _ = plan_assignment_changes(assignment_changes)
+        apply_assignment_changes(to_delete, to_create)
+        enqueue_many(invitation_emails([(user.email, user.username) for user in new_users]))
+
+    for entry, user, values in updates:
+        entry["status"] = "updated"
+        invalidate_user(user.id)
+    for entry, user in deletes:
+        entry["status"] = "deleted"
+        invalidate_user(user.id)
+    return True, report
+
+
+def bulk_assignments(rows):
+    """
+    Validate and apply assignment rows. Returns (ok, report) like bulk_users(), each entry with the
+    number of assignments added and removed (status updated or unchanged).
+    """
+    users_by_id, users_by_email, projects = load_references(rows, "user_id")
+    report = []
+    changes = {}
+
+    for index, row in enumerate(rows, start=1):
+        errors = []
+        mode = str(row.get("mode") or "set").strip().lower()
+        entry = {"row": index, "mode": mode}
+        report.append(entry)
+        if mode not in ASSIGNMENT_MODES:
+            errors.append(f"mode must be one of {', '.join(ASSIGNMENT_MODES)}.")
+
+        user = find_user(row, "user_id", users_by_id, users_by_email, errors)
+        if user is not None:
+            entry.update(user_id=user.id, email=user.email)
+            if user.id in changes:
+                errors.append("The user is in an earlier row too.")
+
+        project_ids = []
+        if given(row, "project_ids"):
+            project_ids = validate_project_ids(row, projects, errors)
+        elif mode != "set":
+            errors.append("project_ids is required.")
+
+        if errors:
+            entry.update(status="invalid", errors=errors)
+        else:
+            entry.update(status="valid", project_ids=project_ids)
+            changes[user.id] = (mode, project_ids)
+
+    if any(entry["status"] == "invalid" for entry in report):
+        return False, report
+
+    with transaction.atomic():
+        to_delete, to_create, counts = plan_assignment_changes(changes)
+        apply_assignment_changes(to_delete, to_create)
+
+    for entry in report:
+        entry.update(counts[entry["user_id"]])
+        entry["status"] = "updated" if entry["added"] or entry["removed"] else "unchanged"
+    return True, report
@@ -3,7 +3,6 @@ import math
 import boto3
 import uuid
 import json
-from openai import OpenAI
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
 from django.conf import settings
 from django.shortcuts import render
@@ -17,46 +16,55 @@ from rest_framework_simplejwt.views import (
 from .serializers import *
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
-from rest_framework_simplejwt.tokens import RefreshToken
+from api.token_blacklist import FilteredRefreshToken
+from api.images import ImageProcessingError, rendition_urls, save_renditions
 from rest_framework import status
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
 from rest_framework.response import Response
 from rest_framework import viewsets
 from rest_framework import generics
 from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.generics import GenericAPIView, RetrieveAPIView
 from django.shortcuts import get_object_or_404
 import json
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.utils.timezone import now
 from django.utils.crypto import get_random_string
 from datetime import timedelta
 from django.contrib.auth.hashers import check_password, make_password
 from api.utils import send_email
+from api.outbox import enqueue
 from django.core.management import call_command
 from django.contrib.auth.models import User
+from django.db import connection, transaction
 from django.db.models import Prefetch, Avg, Max, Count, Sum, F, Q
 from collections import defaultdict
 from django.http import Http404
-from .permissions import IsStaffOrReviewer, IsStaffOrSuperAdmin, IsStaffOrReviewerOrReadOnly
+from .permissions import IsStaffOrReviewer, IsStaffOrSuperAdmin, IsStaffOrReviewerOrReadOnly, ProjectScopeMixin
 from django.db.models.functions import Lower, TruncMinute
-import resend
 from django.template.loader import render_to_string
-from api.management.commands.sync_zenus_data import sync_project_list, sync_single_project
+from api.management.commands.sync_zenus_data import sync_accounts, sync_project_list, sync_single_project
 from imageio_ffmpeg import get_ffmpeg_exe
 import subprocess
 import re
+import io
 from boto3.s3.transfer import TransferConfig
 from tqdm import tqdm  # Optional for testing locally
-from deepgram import DeepgramClient, PrerecordedOptions, FileSource
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from api.transcription import transcribe_audio, summarize_transcript
+from api.streaming_transcription import StreamingTranscriber
+from api.progress import ProgressReporter, is_valid_job_id
+from api.middleware import request_stats
+from api import profiling
+from api import zenus
+from api.cold_storage import ensure_rehydrated
+from api.authentication import invalidate_user
+from api.user_admin import BulkInputError, bulk_assignments, bulk_users, invitation_emails, read_rows, summarize
 
 ALLOWED_IMAGE_TYPES = ["image/jpeg", "image/jpg", "image/png", "image/webp"]
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 
-resend.api_key = os.environ.get("RESEND_API_KEY")
 support_email = os.environ.get("NNG_EMAIL")
 
 # Create your views here.
@@ -127,26 +135,28 @@ class RegisterationViewSet(ModelViewSet, TokenObtainPairView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Save the new user
-        user = serializer.save()
+        # The user, token and queued verification email are committed together
+        with transaction.atomic():
+            # Save the new user
+            user = serializer.save()
 
-        # Remove existing token for the email if it exists
-        VerificationTokenModel.objects.filter(email=user.email).delete()
+            # Remove existing token for the email if it exists
+            VerificationTokenModel.objects.filter(email=user.email).delete()
 
-        # Generate a verification token
-        verification_token = get_random_string(length=32)
-        expiration_time = now() + timedelta(hours=1)  # Token expires in 1 hour
+            # Generate a verification token
+            verification_token = get_random_string(length=32)
+            expiration_time = now() + timedelta(hours=1)  # Token expires in 1 hour
 
-        # Create a new row in VerificationTokenModel
-        VerificationTokenModel.objects.create(
-            email=user.email,
-            token=verification_token,
-            expires=expiration_time,
-        )
+            # Create a new row in VerificationTokenModel
+            VerificationTokenModel.objects.create(
+                email=user.email,
+                token=verification_token,
+                expires=expiration_time,
+            )
 
-        # Here, you can send the verification email (implementation depends on your email backend)
-        frontend_url = os.environ.get("FRONTEND_URL")
-        self.send_verification_email(user.email, verification_token, frontend_url)
+            # Here, you can send the verification email (implementation depends on your email backend)
+            frontend_url = os.environ.get("FRONTEND_URL")
+            self.send_verification_email(user.email, verification_token, frontend_url)
 
         return Response(
             {"message": "User registered successfully. Email verification sent."},
@@ -183,7 +193,7 @@ class UserLogoutView(GenericAPIView):
     def post(self, request, *args, **kwargs):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
             return Response(status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
@@ -218,7 +228,7 @@ class UserListViewSet(APIView):
                 filters["is_active"] = request.query_params.get("status") == "active"
 
             # if self.request.user.is_superuser:
-            userlistInstance = UserModel.objects.filter(**filters).exclude(id=request.user.id)
+            userlistInstance = UserModel.objects.filter(**filters).exclude(id=request.user.id).prefetch_related("assigned_projects")
             userlistSerializer = UserSerializer(userlistInstance, many=True)
             return Response(
                 {"status": "success", "data": userlistSerializer.data},
@@ -255,8 +265,7 @@ class AdminUserActionViewSet(APIView):
             )
 
         user = serializer.save()
-        password = serializer.validated_data.get('password')
-        self.send_welcome_invitation_email(user.email, user.username, password)
+        self.send_welcome_invitation_email(user.email, user.username)
         return Response(
             {"status": "success", "data": serializer.data},
             status=status.HTTP_201_CREATED,
@@ -270,6 +279,7 @@ class AdminUserActionViewSet(APIView):
                 serializer = UserSerializer(user, data=request.data, partial=True)
                 if serializer.is_valid():
                     serializer.save()
+                    invalidate_user(user.id)
                     return Response(
                         {"status": "success", "data": serializer.data},
                         status=status.HTTP_200_OK,
@@ -293,6 +303,7 @@ class AdminUserActionViewSet(APIView):
         try:
             userInstance = get_object_or_404(UserModel, id=request.data["user_id"])
             userInstance.delete()
+            invalidate_user(request.data["user_id"])
             return Response(
                 {"status": "success", "data": "User removed successfully"},
                 status=status.HTTP_200_OK,
@@ -303,20 +314,34 @@ class AdminUserActionViewSet(APIView):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-    def send_welcome_invitation_email(self, email, name, temp_password):
-        frontend_url = os.environ.get("FRONTEND_URL")
-        login_link = f"{frontend_url}/login"
-        context = {
-            "user_email": email,
-            "user_name": name,
-            "temporary_password": temp_password,
-            "login_link": login_link,
-        }
-        send_email(
-            to=email,
-            subject="Welcome to ROME!",
-            template_name="invitation_welcome_email.html",
-            context=context,
+    def send_welcome_invitation_email(self, email, name):
+        send_email(**invitation_emails([(email, name)])[0])
+
+class AdminBulkUserActionView(APIView):
+    """
+    Create, update and delete many users in one request, from a CSV file or a JSON list
+    (see api/user_admin.py for the columns). All or nothing: the response reports every row.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+
+    def post(self, request):
+        # only superusers can add
+        if not request.user.is_superuser:
+            return Response(
+                {"status": "error", "data": "permission denied"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        try:
+            rows = read_rows(request, "users")
+        except BulkInputError as e:
+            return Response({"status": "error", "data": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        ok, report = bulk_users(rows, request.user)
+        return Response(
+            {"status": "success" if ok else "error", "data": {"summary": summarize(report), "rows": report}},
+            status=status.HTTP_200_OK if ok else status.HTTP_400_BAD_REQUEST,
         )
 
 class GetPresignedUrlView(APIView):
@@ -390,15 +415,24 @@ class AdminMatchActionView(APIView):
 class AdminUploadVideoView(APIView):
     permission_classes = [IsAdminUser]
 
+    reporter = None
+
     def send_progress_update(self, stage, progress):
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "video_upload_progress",
-            {
-                'type': 'send_progress',
-                'stage': stage,
-                'progress': progress,
-            }
+        # Throttled by the reporter, callers can report as often as they like
+        self.reporter.update(stage, progress)
+
+    def publish_sentences(self, session, batch, total_seconds):
+        # Persist the newly transcribed sentences and push them to the progress channel
+        TranscriptSentenceModel.objects.append_for_session(session, batch)
+        self.reporter.send_sentences(batch)
+        self.send_progress_update('transcribing', min(batch[-1]["end"] / total_seconds * 100, 99))
+
+    def error_response(self, message):
+        if self.reporter:
+            self.reporter.fail(message)
+        return Response(
+            {"status": "error", "message": message},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
     def put(self, request):
@@ -406,16 +440,25 @@ class AdminUploadVideoView(APIView):
             template_id = request.POST.get("template_id")
             session_id = request.POST.get("session_id")
             video_file = request.FILES.get("video_file")
+            # Clients pick the job_id and subscribe to ws/progress/<job_id>/ before uploading
+            job_id = request.POST.get("job_id") or None
 
             if not session_id or not video_file or not template_id:
                 return Response(
                     {"status": "error", "message": "Missing session_id or video_file or template_id"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            if job_id and not is_valid_job_id(job_id):
+                # It names the progress channel group, which only takes a limited set of characters
+                return Response(
+                    {"status": "error", "message": "job_id must be 1-64 letters, digits, '-' or '_'"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
             session = SessionModel.objects.get(id=session_id)
             template = AITemplateModel.objects.get(id=template_id)
 
+            self.reporter = ProgressReporter(job_id, session.id)
             self.send_progress_update('uploading_video', 0)
 
             # Save video locally
@@ -445,25 +488,62 @@ class AdminUploadVideoView(APIView):
             h, m, s = map(float, duration_match.groups())
             total_seconds = h * 3600 + m * 60 + s
 
+            stream_transcript = str(request.POST.get("stream_transcript", "")).lower() in ("1", "true", "yes")
+            transcriber = None
+
             # Command to extract audio
-            command = [
+            file_command = [
                 ffmpeg_path,
                 "-i", video_full_path,
                 "-vn",
                 "-acodec", "libmp3lame",
                 audio_path
             ]
+            if stream_transcript:
+                # Write constant bitrate MP3 to stdout so it can be transcribed while ffmpeg runs
+                command = [
+                    ffmpeg_path,
+                    "-i", video_full_path,
+                    "-vn",
+                    "-acodec", "libmp3lame",
+                    "-b:a", "128k",
+                    "-f", "mp3",
+                    "pipe:1"
+                ]
+            else:
+                command = file_command
 
             process = subprocess.Popen(
                 command,
                 stderr=subprocess.PIPE,
-                stdout=subprocess.DEVNULL,
-                text=True,
-                bufsize=1
+                stdout=subprocess.PIPE if stream_transcript else subprocess.DEVNULL,
             )
+            stderr = io.TextIOWrapper(process.stderr, encoding="utf-8", errors="replace")
+
+            if stream_transcript:
+                TranscriptSentenceModel.objects.filter(session=session).delete()
+                audio_file = open(audio_path, "wb")
+                self.send_progress_update('transcribing', 0)
+                try:
+                    transcriber = StreamingTranscriber(
+                        lambda batch: self.publish_sentences(session, batch, total_seconds)
+                    )
+                    transcriber.start(process.stdout, audio_file)
+                except Exception as e:
+                    # Nothing reads ffmpeg's stdout, stop it and extract to the file for transcription afterwards
+                    print(f"Streaming transcription for session {session_id} could not start: {e}")
+                    transcriber = None
+                    process.kill()
+                    process.wait()
+                    process.stdout.close()
+                    process.stderr.close()
+                    audio_file.close()
+                    os.remove(audio_path)  # ffmpeg would ask before overwriting it
+                    process = subprocess.Popen(file_command, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL)
+                    stderr = io.TextIOWrapper(process.stderr, encoding="utf-8", errors="replace")
 
             while True:
-                line = process.stderr.readline()
+                line = stderr.readline()
                 if not line:
                     break
 
@@ -477,6 +557,17 @@ class AdminUploadVideoView(APIView):
 
             # Wait for FFmpeg to finish
             process.wait()
+
+            streamed = None
+            if transcriber:
+                try:
+                    streamed = transcriber.wait()
+                except RuntimeError as e:
+                    # Fall back to transcribing the uploaded audio file below
+                    print(f"Streaming transcription for session {session_id} failed: {e}")
+                finally:
+                    audio_file.close()
+
             if process.returncode != 0:
                 raise RuntimeError("FFmpeg failed during audio extraction.")
             
@@ -538,59 +629,26 @@ class AdminUploadVideoView(APIView):
 
             self.send_progress_update('uploading_audio_to_s3', 100)
 
-            self.send_progress_update('transcribing', 0)
-            self.send_progress_update('transcribing', 80)
-
-            DEEPGRAM_API_KEY = os.environ.get("DEEPGRAM_API_KEY")
-
-            def transcribe_audio_from_url(audio_url):
+            if not streamed:
+                self.send_progress_update('transcribing', 0)
 
-                try:
-                    dg_client = DeepgramClient(DEEPGRAM_API_KEY)
-                    options = PrerecordedOptions(
-                        model="nova-3",
-                        language="en",
-                        smart_format=True,
-                    )
-
-                    source = {"url": audio_url}
-                    response = dg_client.listen.prerecorded.v("1").transcribe_url(
-                        source,
-                        options
-                    )
-                    return response
-                except Exception as e:
-                    raise RuntimeError(f"Deepgram transcription failed: {e}")
-                
             try:
-                response = transcribe_audio_from_url(audio_url)
-                all_sentences = []
-                paragraphs = response['results']['channels'][0]['alternatives'][0]['paragraphs']['paragraphs']
-                index = 0
-                for para in paragraphs:
-                    for sentence in para['sentences']:
-                        all_sentences.append({
-                            "id": index,
-                            "text": sentence['text'],
-                            "start": sentence['start'],
-                            "end": sentence['end']
-                        })
-                        index += 1
-                transcript = response['results']['channels'][0]['alternatives'][0]['transcript']
+                if streamed:
+                    transcript, all_sentences = streamed
+                else:
+                    transcript, all_sentences = transcribe_audio(audio_url, audio_path)
 
             except Exception as e:
-                return Response(
-                    {"status": "error", "message": f"Transcription failed: {e}"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+                return self.error_response(f"Transcription failed: {e}")
             
             self.send_progress_update('transcribing', 100)
 
             self.send_progress_update('Summarizing', 0)
-            self.send_progress_update('Summarizing', 80)
                 
             try:
-                summary = self.summarize_transcript(transcript, template)
+                summary = summarize_transcript(
+                    transcript, template, on_chunk=self.reporter.counter('Summarizing')
+                )
 
                 SummaryModel.objects.update_or_create(
                     session=session,
@@ -600,10 +658,7 @@ class AdminUploadVideoView(APIView):
                     }
                 )
             except Exception as e:
-                return Response(
-                    {"status": "error", "message": f"Summary generation failed: {e}"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+                return self.error_response(f"Summary generation failed: {e}")
             
             self.send_progress_update('Summarizing', 100)
 
@@ -611,9 +666,12 @@ class AdminUploadVideoView(APIView):
             session.video_url = video_url
             session.audio_url = audio_url 
             session.transcript = transcript
-            session.sentences = all_sentences
             session.save()
 
+            # Streamed sentences were stored as they arrived
+            if not streamed:
+                TranscriptSentenceModel.objects.replace_for_session(session, all_sentences)
+
             # Clean up local temp files
             try:
                 os.remove(video_full_path)
@@ -626,71 +684,82 @@ class AdminUploadVideoView(APIView):
                 "message": "Uploaded to S3 and saved successfully",
                 "video_url": video_url,
                 "audio_url": audio_url,
-                "summary": summary
+                "summary": summary,
+                "job_id": job_id,
             })
 
         except Exception as e:
-            return Response(
-                {"status": "error", "message": str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+            return self.error_response(str(e))
         
-    def split_transcript(self, transcript, max_chars=8000):
-        sentences = transcript.split('. ')
-        chunks = []
-        current = ''
-        for sentence in sentences:
-            sentence += '. '
-            if len(current) + len(sentence) <= max_chars:
-                current += sentence
-            else:
-                chunks.append(current.strip())
-                current = sentence
-        if current:
-            chunks.append(current.strip())
-        return chunks
-
-    def summarize_transcript(self, transcript, template):
-        client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
-        # prompt_template = """
-        #     You are an assistant that outputs only HTML. Use <h2> or <h3> for headings, <p> for paragraphs, <strong> for bold, <em> for italic, and <ul><li> for bullet lists. Do not include any extra text or code blocks. 
-
-        #     Here's the content to format:
-        #     - Title: Project Overview
-        #     - Sections:
-        #     1. Goals: Describe the goals in 2-3 sentences.
-        #     2. Features: List key features as bullet points: user auth, data export, notifications or anything else.
-        #     3. Notes: Emphasize any special considerations in bold or italic.
-
-        #     Generate the HTML for this content.
-            
-        #     Here's the transcript to format into HTML:
-        #     {chunk}
-        # """.strip()
+class AdminRequestStatsView(APIView):
+    """
+    Rolling request timing and SQL statistics of this server process, per URL name.
+    Example usage:
+    - GET /admin/request-stats/
+    - DELETE /admin/request-stats/  (start a new measurement window)
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"status": "success", **request_stats.summary()})
 
-        prompt_template = """
-            {template}
-            {chunk}
-        """.strip()
+    def delete(self, request):
+        request_stats.reset()
+        return Response({"status": "success", "message": "Request stats reset"})
 
-        try:
-            chunks = self.split_transcript(transcript)
-            summaries = []
+class AdminProfilingView(APIView):
+    """
+    Runtime profiling toggle (overrides the PROFILING_* settings on every process) and the stored profiles.
+    Example usage:
+    - GET /admin/profiling/
+    - PUT /admin/profiling/  {"enabled": true, "url_patterns": ["analytics-projects"], "sync_steps": ["*"], "threshold_ms": 500}
+    - DELETE /admin/profiling/  (back to the settings)
+    """
+    permission_classes = [IsAdminUser]
 
-            for i, chunk in enumerate(chunks):
-                print(f"🧠 Summarizing chunk {i + 1}/{len(chunks)}...")
-                prompt = prompt_template.format(chunk=chunk, template=template)
+    def get(self, request):
+        profiles = ProfileModel.objects.defer("stats")
+        return Response({
+            "status": "success",
+            "config": profiling.get_config(),
+            "profiles": ProfileSerializer(profiles, many=True).data,
+        })
 
-                response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                summaries.append(response.choices[0].message.content)
+    def put(self, request):
+        serializer = ProfilingConfigSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"status": "error", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        current = profiling.get_config()
+        config = profiling.set_config({**current, **serializer.validated_data})
+        return Response({"status": "success", "config": config})
 
-            return "\n\n".join(summaries)
+    def delete(self, request):
+        return Response({"status": "success", "config": profiling.set_config(None)})
 
-        except Exception as e:
-            raise RuntimeError(f"OpenAI summarization failed: {e}")
+class AdminProfileDownloadView(APIView):
+    """
+    Download a stored profile as a .prof file (pstats, snakeviz, ...) or, with ?output=text, as pstats output.
+    Example usage:
+    - GET /admin/profiles/12/
+    - GET /admin/profiles/12/?output=text&sort=tottime
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        profile = get_object_or_404(ProfileModel, id=profile_id)
+        if request.query_params.get("output") == "text":
+            sort = request.query_params.get("sort", "cumulative")
+            if sort not in profiling.SORT_KEYS:
+                return Response(
+                    {"detail": f"sort must be one of: {', '.join(profiling.SORT_KEYS)}."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            text = profiling.profile_as_text(profile, sort=sort)
+            return HttpResponse(text, content_type="text/plain; charset=utf-8")
+
+        response = HttpResponse(bytes(profile.stats), content_type="application/octet-stream")
+        response["Content-Disposition"] = f'attachment; filename="profile-{profile.id}.prof"'
+        return response
 
 class AdminUpdateProjectView(APIView):
     permission_classes = [IsAdminUser]
@@ -752,15 +821,8 @@ class VerifyEmailView(APIView):
             )
 
         try:
-            # Look up the token in the database
-            verification_token = VerificationTokenModel.objects.get(token=token)
-
-            # Check if the token has expired
-            if verification_token.expires < now():
-                return Response(
-                    {"message": "This verification link has expired."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+            # Look up the token in the database, expired ones don't match
+            verification_token = VerificationTokenModel.objects.get(token=token, expires__gt=now())
 
             # Mark the user's email as verified
             user = UserModel.objects.get(email=verification_token.email)
@@ -808,6 +870,7 @@ class ProfileViewSet(APIView):
             serializer = UserSerializer(user, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
+                invalidate_user(user.id)
                 return Response(
                     {"status": "success", "data": serializer.data},
                     status=status.HTTP_200_OK,
@@ -903,15 +966,8 @@ class ResetPasswordView(APIView):
             )
 
         try:
-            # Validate token
-            reset_token = ResetPasswordTokenModel.objects.get(token=token)
-
-            # Check if the token has expired
-            if reset_token.expires < now():
-                return Response(
-                    {"message": "This reset password link has expired."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+            # Validate token, expired ones don't match
+            reset_token = ResetPasswordTokenModel.objects.get(token=token, expires__gt=now())
 
             # Fetch the user associated with the token
             user = UserModel.objects.get(email=reset_token.email)
@@ -1029,6 +1085,7 @@ class UpdateUserInfoView(APIView):
 
         try:
             user.save()
+            invalidate_user(user.id)
             serializer = UserSerializer(user) 
             return Response({"message": "Profile updated successfully.","user": serializer.data}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -1061,13 +1118,13 @@ class AvatarUploadView(APIView):
         if file.size > MAX_FILE_SIZE:
             return Response({"message": "File size exceeds 5MB limit."}, status=400)
 
-        # Save the file to a public folder
-        file_path = os.path.join("avatars", file.name)
-        file_name = default_storage.save(file_path, file)
-        # file_url = os.path.join(settings.MEDIA_URL, file_name)
-        file_url = file_name
+        # Store the resized WebP renditions, the full one's name goes in the user's avatar
+        try:
+            file_url = save_renditions(file, "avatars")
+        except ImageProcessingError as e:
+            return Response({"message": str(e)}, status=400)
 
-        return Response({"file_url": file_url}, status=status.HTTP_200_OK)
+        return Response({"file_url": file_url, "renditions": rendition_urls(file_url)}, status=status.HTTP_200_OK)
 
 class ProjectImageUploadView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1092,16 +1149,18 @@ class ProjectImageUploadView(APIView):
             return Response({"message": "File size exceeds 5MB limit."}, status=400)
 
 
-        file_path = default_storage.save(f"project_images/{file.name}", file)
-        file_url = file_path
-
         # Find the project
         project = get_object_or_404(ProjectModel, id=project_id)
 
+        try:
+            file_url = save_renditions(file, "project_covers")
+        except ImageProcessingError as e:
+            return Response({"message": str(e)}, status=400)
+
         project.cover_image_url = file_url
         project.save()
 
-        return Response({"file_url": file_url}, status=status.HTTP_200_OK)
+        return Response({"file_url": file_url, "renditions": rendition_urls(file_url)}, status=status.HTTP_200_OK)
 
 class ProfileViewSet(APIView):
     permission_classes = (IsAuthenticated,)
@@ -1125,6 +1184,7 @@ class ProfileViewSet(APIView):
             serializer = UserSerializer(user, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
+                invalidate_user(user.id)
                 return Response(
                     {"status": "success", "data": serializer.data},
                     status=status.HTTP_200_OK,
@@ -1145,27 +1205,9 @@ class AdminSyncAllProjectAPIView(APIView):
 
     def post(self, request, *args, **kwargs):
         try:
-            # Fetch the first and second API keys
-            first_key = os.environ.get("ZENUS_API_KEY_1")
-            second_key = os.environ.get("ZENUS_API_KEY_2")
-            
-            # Check if the first API key is missing
-            if first_key:
-                # Use the first API key initially
-                os.environ["ZENUS_API_KEY"] = first_key
-                print("Start sync with first API key")
-                call_command('sync_zenus_data')  # Sync data with the first key
-            else: print("ZENUS_API_KEY_1 is missing in environment variables.")
-
-            # Check if the second API key is missing
-            if second_key:
-                # Switch to the second API key
-                os.environ["ZENUS_API_KEY"] = second_key
-                print("Start sync with seconde API key")
-                call_command('sync_zenus_data')  # Sync data with the second key
-            else: print("ZENUS_API_KEY_2 is missing in environment variables.")
-
-            return Response({"status": "Data sync completed with both API keys."}, status=200)
+            # Syncs every account in ZENUS_ACCOUNTS at the same time, each with its own key
+            call_command('sync_zenus_data')
+            return Response({"status": "Data sync completed for every Zenus account."}, status=200)
 
         except Exception as e:
             return Response({"error": str(e)}, status=400)  
@@ -1175,23 +1217,15 @@ class AdminSyncProjectListAPIView(APIView):
 
     def post(self, request, *args, **kwargs):
         try:
-            first_key = os.environ.get("ZENUS_API_KEY_1")
-            second_key = os.environ.get("ZENUS_API_KEY_2")
-
-            if not first_key and not second_key:
+            if not zenus.accounts():
                 return JsonResponse({"error": "No valid API keys found."}, status=400)
 
             projects = []
-
-            if first_key:
-                os.environ["ZENUS_API_KEY"] = first_key
-                print("Syncing project list with first API key...")
-                projects += sync_project_list()  # Accumulate projects from first key
-
-            if second_key:
-                os.environ["ZENUS_API_KEY"] = second_key
-                print("Syncing project list with second API key...")
-                projects += sync_project_list()  # Accumulate projects from second key
+            for account, result in sync_accounts(sync_project_list).items():
+                if isinstance(result, Exception):
+                    print(f"Error syncing the project list of account {account}: {str(result)}")
+                    continue
+                projects += result or []  # Accumulate projects from every account
 
             if not projects:
                 return JsonResponse({"error": "No projects synced."}, status=400)
@@ -1208,20 +1242,8 @@ class AdminSyncOneProjectAPIView(APIView):
 
     def post(self, request, project_id, *args, **kwargs):
         try:
-            first_key = os.environ.get("ZENUS_API_KEY_1")
-            second_key = os.environ.get("ZENUS_API_KEY_2")
-
-            project = None
-
-            if first_key:
-                os.environ["ZENUS_API_KEY"] = first_key
-                print(f"Syncing project {project_id} with first API key...")
-                project = sync_single_project(project_id)
-
-            if second_key and not project:
-                os.environ["ZENUS_API_KEY"] = second_key
-                print(f"Syncing project {project_id} with second API key...")
-                project = sync_single_project(project_id)
+            # Synced with the key of the account the project belongs to
+            project = sync_single_project(project_id)
 
             if project:
                 return JsonResponse({"status": "Sync completed.", "project": project.id})
@@ -1230,23 +1252,36 @@ class AdminSyncOneProjectAPIView(APIView):
 
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=400)
+
+class AdminSyncRunListView(generics.ListAPIView):
+    """
+    Stored Zenus sync runs, newest first, with per project and step timings and row counts.
+    Example usage:
+    - GET /admin/sync-runs/
+    - GET /admin/sync-runs/?status=failed
+    """
+    serializer_class = SyncRunSerializer
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        qs = SyncRunModel.objects.all()
+        run_status = self.request.query_params.get("status")
+        if run_status:
+            qs = qs.filter(status=run_status)
+        return qs
            
-class ProjectListAPIView(generics.ListAPIView):
+class ProjectListAPIView(ProjectScopeMixin, generics.ListAPIView):
     queryset = ProjectModel.objects.all()
     serializer_class = ProjectSerializer
     permission_classes = [IsAuthenticated]  # requires authentication
 
     def get(self, request):
         try:
-            user = request.user
-
             # base queryset of active projects
             qs = ProjectModel.objects.filter(is_active=True)
 
             # non-staff users only get their assigned projects
-            if not (user.is_staff or user.is_superuser):
-                assigned = getattr(user, "assigned_project_ids", []) or []
-                qs = qs.filter(id__in=assigned)
+            qs = self.scope_to_user(qs, project_field="")
 
             qs = qs.order_by("-id")
 
@@ -1322,15 +1357,15 @@ class ProjectListAPIView(generics.ListAPIView):
             .prefetch_related('stages__sessions')
         )
     
-class ProjectAnalyticsListAPIView(generics.ListAPIView):
+class ProjectAnalyticsListAPIView(ProjectScopeMixin, generics.ListAPIView):
     """
     API view to list all projects with their session analytics
     """
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        # Modify this to filter based on your requirement
-        return ProjectModel.objects.filter(is_active=True)
+        # Non-staff users only get their assigned projects
+        return self.scope_to_user(ProjectModel.objects.filter(is_active=True), project_field="")
 
     def get(self, request, *args, **kwargs):
         projects = self.get_queryset()
@@ -1392,33 +1427,14 @@ class ProjectAnalyticsListAPIView(generics.ListAPIView):
                     "over_40_energy_avg": (sum_analytics["over_40_energy_avg"] / total_count) * 100,
                 }
 
-            booth_ids = list(project.booths.values_list('id', flat=True))
-
-            if booth_ids:
-                unique_analytics, impression_analytics = get_booth_impression_analytics(booth_ids)
-            else:
-                unique_analytics = {
-                    "visits": 0, "dwell_visits": 0, "averageEnergy": 0, "averageDwellTime": "00:00:00"
-                }
-                impression_analytics = {
-                    "total_impressions": 0, "stop_rate": 0,
-                    "energy_avg": 0, "male_energy_avg": 0,
-                    "female_energy_avg": 0, "under_40_energy_avg": 0,
-                    "over_40_energy_avg": 0
-                }
-            
-            project_sessions = SessionModel.objects.filter(project=project)
-
-            if project_sessions.exists():
-                qr_analytics = get_qr_analytics_for_project_sessions(project_sessions)
+            if project.cold_stored_at and project.cold_storage_summary:
+                # Raw rows are in cold storage, use what was computed before the export
+                raw_analytics = project.cold_storage_summary
+            elif project.archived_at and project.archive_summary:
+                # Raw rows are in the archive tables, use what was computed before moving them
+                raw_analytics = project.archive_summary
             else:
-                qr_analytics = {
-                    "total_qr_scans": 0,
-                    "unique_qr_scans": 0,
-                    "avg_dwell_time": 0,
-                    "max_dwell_time": 0,
-                    "unique_stage_qr_codes": {},
-                }
+                raw_analytics = project_list_raw_analytics(project)
 
             # Add the project data with calculated analytics
             project_data.append({
@@ -1427,6 +1443,7 @@ class ProjectAnalyticsListAPIView(generics.ListAPIView):
                 "start_datetime": project.start_datetime,
                 "end_datetime": project.end_datetime,
                 "cover_image_url": project.cover_image_url.url if project.cover_image_url else None,
+                "cover_image_renditions": rendition_urls(project.cover_image_url),
                 "deployment_timezone": project.deployment_timezone,
                 "is_ready": project.is_ready,
                 "client_id": project.client.id if project.client else None,
@@ -1436,13 +1453,52 @@ class ProjectAnalyticsListAPIView(generics.ListAPIView):
                 "country": project.country,
                 "city": project.city,
                 "obs_average_analytics": obs_average_analytics,
-                "uniqueImpressionAnalytics": unique_analytics,
-                "impressionAnalytics": impression_analytics,
-                "qr_analytics": qr_analytics
+                "uniqueImpressionAnalytics": raw_analytics["uniqueImpressionAnalytics"],
+                "impressionAnalytics": raw_analytics["impressionAnalytics"],
+                "qr_analytics": raw_analytics["qr_analytics"]
             })
 
         return Response(project_data)
 
+def project_list_raw_analytics(project):
+    """
+    The parts of the project list analytics read from raw impressions and QR codes.
+    Also stored on the project when its raw data is archived or goes to cold storage.
+    """
+    booth_ids = list(project.booths.values_list('id', flat=True))
+
+    if booth_ids:
+        unique_analytics, impression_analytics = get_booth_impression_analytics(booth_ids)
+    else:
+        unique_analytics = {
+            "visits": 0, "dwell_visits": 0, "averageEnergy": 0, "averageDwellTime": "00:00:00"
+        }
+        impression_analytics = {
+            "total_impressions": 0, "stop_rate": 0,
+            "energy_avg": 0, "male_energy_avg": 0,
+            "female_energy_avg": 0, "under_40_energy_avg": 0,
+            "over_40_energy_avg": 0
+        }
+
+    project_sessions = SessionModel.objects.filter(project=project)
+
+    if project_sessions.exists():
+        qr_analytics = get_qr_analytics_for_project_sessions(project_sessions)
+    else:
+        qr_analytics = {
+            "total_qr_scans": 0,
+            "unique_qr_scans": 0,
+            "avg_dwell_time": 0,
+            "max_dwell_time": 0,
+            "unique_stage_qr_codes": {},
+        }
+
+    return {
+        "uniqueImpressionAnalytics": unique_analytics,
+        "impressionAnalytics": impression_analytics,
+        "qr_analytics": qr_analytics,
+    }
+
 def get_booth_impression_analytics(booth_ids):
     # Prepare Unique Impression Analytics
     unique_impressions = UniqueImpressionModel.objects.filter(
@@ -1652,7 +1708,7 @@ class UpdateSessionVideoDatetimeAPIView(generics.UpdateAPIView):
 #         # Get all observations for the session
 #         observations = ObservationModel.objects.filter(session_id=session_id)
 
-class ObservationsBySessionView(generics.ListAPIView):
+class ObservationsBySessionView(ProjectScopeMixin, generics.ListAPIView):
     """
     Returns all Observation records for a given session_id, grouped by minute,
     with averages calculated for specific fields (no pagination).
@@ -1662,15 +1718,23 @@ class ObservationsBySessionView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     pagination_class = None  # Disable pagination
 
-    def get_queryset(self):
-        session_id = self.kwargs.get('session_id')
-
+    def list(self, request, *args, **kwargs):
         # Check if the session exists; raise 404 if it doesn't
-        if not SessionModel.objects.filter(id=session_id).exists():
+        project_ids = self.scope_to_user(SessionModel.objects.filter(id=self.kwargs.get('session_id'))).values_list("project_id", flat=True)
+        if not project_ids:
             raise Http404("Session not found.")
 
+        # The observations of a cold stored or archived project are only there once they're loaded back
+        rehydrating = ensure_rehydrated(project_ids)
+        if rehydrating:
+            return Response({"status": "rehydrating", "project_ids": rehydrating}, status=status.HTTP_202_ACCEPTED)
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        session_id = self.kwargs.get('session_id')
+
         # Get all observations for the session
-        observations = ObservationModel.objects.filter(session_id=session_id)
+        observations = self.scope_to_user(ObservationModel.objects.filter(session_id=session_id))
 
         # Group by minute (rounding to the start of the minute)
         observations = observations.annotate(minute_group=TruncMinute('datetime'))
@@ -1798,11 +1862,86 @@ class CommentInfoView(generics.ListAPIView):
         comments = CommentModel.objects.filter(session_id=session_id).order_by("time")
         serializer = CommentSerializer(comments, many=True)
 
+        # Clients that page through user/sessions/<id>/sentences/ can skip the full transcript
+        if request.query_params.get("include_sentences", "true").lower() in ("0", "false", "no"):
+            return Response({"comments": serializer.data})
+
+        sentences = TranscriptSentenceModel.objects.filter(session=session).order_by("index")
+
         return Response({
             "comments": serializer.data,
-            "sentences": session.sentences or [],
+            "sentences": TranscriptSentenceSerializer(sentences, many=True).data,
         })
 
+class SentencePagination(PageNumberPagination):
+    page_size = 200
+    page_size_query_param = "page_size"
+    max_page_size = 2000
+
+class SessionSentenceListView(ProjectScopeMixin, generics.ListAPIView):
+    """
+    Paginated transcript sentences of one session.
+    Example usage:
+    - GET /user/sessions/<session_id>/sentences/?from=120&to=180  (sentences overlapping 2:00-3:00)
+    - GET /user/sessions/<session_id>/sentences/?after=41  (sentences appended after index 41)
+    """
+    serializer_class = TranscriptSentenceSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = SentencePagination
+
+    def get_queryset(self):
+        session_id = self.kwargs.get("session_id")
+        # Sessions of projects the user isn't assigned to don't exist for them
+        if not self.scope_to_user(SessionModel.objects.filter(id=session_id)).exists():
+            raise Http404("Session not found.")
+
+        queryset = self.scope_to_user(
+            TranscriptSentenceModel.objects.filter(session_id=session_id), project_field="session__project"
+        )
+        params = self.request.query_params
+
+        try:
+            if params.get("from") not in ("", None):
+                queryset = queryset.filter(end__gte=float(params["from"]))
+            if params.get("to") not in ("", None):
+                queryset = queryset.filter(start__lte=float(params["to"]))
+            if params.get("after") not in ("", None):
+                queryset = queryset.filter(index__gt=int(params["after"]))
+        except ValueError:
+            raise serializers.ValidationError("from, to and after must be numbers.")
+
+        return queryset.order_by("start", "index")
+
+class ProjectSentenceSearchView(ProjectScopeMixin, generics.ListAPIView):
+    """
+    Full-text search over the transcripts of all sessions in a project.
+    Example usage: GET /user/projects/<project_id>/sentences/search/?q=pricing
+    """
+    serializer_class = TranscriptSentenceSearchSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = SentencePagination
+
+    def get_queryset(self):
+        query = self.request.query_params.get("q", "").strip()
+        if not query:
+            raise serializers.ValidationError("q is required.")
+
+        queryset = self.scope_to_user(
+            TranscriptSentenceModel.objects.filter(session__project_id=self.kwargs.get("project_id")),
+            project_field="session__project",
+        ).select_related("session")
+
+        if connection.vendor == "mysql":
+            # Served by the FULLTEXT index created in migration 0017
+            queryset = queryset.extra(
+                where=["MATCH (api_transcriptsentencemodel.text) AGAINST (%s IN NATURAL LANGUAGE MODE)"],
+                params=[query],
+            )
+        else:
+            queryset = queryset.filter(text__icontains=query)
+
+        return queryset.order_by("session_id", "start")
+
 class CommentAddView(generics.CreateAPIView):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated, IsStaffOrReviewer]
@@ -1835,7 +1974,7 @@ class CommentDeleteView(generics.DestroyAPIView):
         comment.delete()
         return Response({"message": "Comment deleted successfully"}, status=status.HTTP_200_OK)
 
-class SessionAnalyticsListAPIView(APIView):
+class SessionAnalyticsListAPIView(ProjectScopeMixin, APIView):
     """
     Retrieve analytics data for multiple session IDs.
     Example usage:
@@ -1877,12 +2016,12 @@ class SessionAnalyticsListAPIView(APIView):
         """
         Internal method to fetch session analytics based on session IDs.
         """
-        analytics = SessionAnalyticsModel.objects.filter(session_id__in=session_ids)
+        analytics = self.scope_to_user(SessionAnalyticsModel.objects.filter(session_id__in=session_ids))
         serializer = SessionAnalyticsSerializer(analytics, many=True)
 
         return Response({"status": "success", "analytics": serializer.data}, status=status.HTTP_200_OK)
     
-class ImpressionTotalAnalyticsAPIView(APIView):
+class ImpressionTotalAnalyticsAPIView(ProjectScopeMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -1900,9 +2039,9 @@ class ImpressionTotalAnalyticsAPIView(APIView):
             project_id = int(project_id)
 
             # Retrieve the impression analytics for the given project_id and zones
-            impression_analytics = ImpressionAnalyticsModel.objects.filter(
+            impression_analytics = self.scope_to_user(ImpressionAnalyticsModel.objects.filter(
                 project_id=project_id, zone__in=["internal", "aisle"]
-            )
+            ))
 
             if not impression_analytics.exists():
                 return Response(
@@ -1922,7 +2061,7 @@ class ImpressionTotalAnalyticsAPIView(APIView):
             # Handling any unexpected errors
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class ImpressionDetailAnalyticsAPIView(APIView):
+class ImpressionDetailAnalyticsAPIView(ProjectScopeMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -1954,13 +2093,19 @@ class ImpressionDetailAnalyticsAPIView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            # Load the raw impressions back if the project is in cold storage or archived
+            booths = self.scope_to_user(ProjectBoothModel.objects.filter(id__in=all_booth_ids))
+            rehydrating = ensure_rehydrated(booths.values_list("project_id", flat=True))
+            if rehydrating:
+                return Response({"status": "rehydrating", "project_ids": rehydrating}, status=status.HTTP_202_ACCEPTED)
+
             # for unique_impression analytics
             # Retrieve UniqueImpressions for the given booth_ids with additional filters
-            unique_impressions = UniqueImpressionModel.objects.filter(
+            unique_impressions = self.scope_to_user(UniqueImpressionModel.objects.filter(
                 booth_id__in=all_booth_ids,
                 is_staff=False,
                 zone="internal"
-            )
+            ))
             if not unique_impressions.exists():
                 return Response(
                     {"detail": "No unique impressions found for the given booth IDs."},
@@ -2014,21 +2159,21 @@ class ImpressionDetailAnalyticsAPIView(APIView):
             # Loop through each booth_id to gather all impressions for each device_id
             for booth_id in all_booth_ids:
                 # Group by device_id within each booth and get the device_id with the most impressions
-                booth_impressions = ImpressionModel.objects.filter(
+                booth_impressions = self.scope_to_user(ImpressionModel.objects.filter(
                     booth_id=booth_id,
                     zone="aisle"
-                ).values('device_id').annotate(impression_count=Count('device_id'))
+                )).values('device_id').annotate(impression_count=Count('device_id'))
 
                 most_frequent_device = max(booth_impressions, key=lambda x: x['impression_count'], default=None)
 
                 if most_frequent_device:
                     device_id = most_frequent_device['device_id']
                     # Retrieve all impressions for this device_id in the current booth
-                    device_impressions = ImpressionModel.objects.filter(
+                    device_impressions = self.scope_to_user(ImpressionModel.objects.filter(
                         booth_id=booth_id,
                         device_id=device_id,
                         zone="aisle"
-                    )
+                    ))
 
                     # Add impressions from this booth to the all_device_impressions list
                     all_device_impressions.extend(device_impressions)
@@ -2193,20 +2338,20 @@ class SendContactEmail(APIView):
             {message}
             """
 
-            # Send email using Resend API
-            resend.Emails.send({
-                "from": "noreply@nonamegroup.com",
-                "to": [support_email],
-                "subject": subject,
-                "text": email_body,
-            })
+            # Queue the email, the run_worker command sends it
+            enqueue(
+                to=support_email,
+                subject=subject,
+                text=email_body,
+                from_email="noreply@nonamegroup.com",
+            )
 
             return Response({"success": True, "message": "Email sent successfully."}, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-class QrAnalyticsListAPIView(APIView):
+class QrAnalyticsListAPIView(ProjectScopeMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
@@ -2214,7 +2359,10 @@ class QrAnalyticsListAPIView(APIView):
         serializer.is_valid(raise_exception=True)
         session_ids = serializer.validated_data["session_ids"]
 
-        sessions = SessionModel.objects.filter(id__in=session_ids)
+        sessions = self.scope_to_user(SessionModel.objects.filter(id__in=session_ids))
+        rehydrating = ensure_rehydrated(sessions.values_list("project_id", flat=True))
+        if rehydrating:
+            return Response({"status": "rehydrating", "project_ids": rehydrating}, status=status.HTTP_202_ACCEPTED)
 
         qr_codes_queryset = QrCodeModel.objects.none()
         stage_qr_codes_map = {}
@@ -2332,6 +2480,23 @@ class QrAnalyticsListAPIView(APIView):
         return Response(response_serializer.data, status=status.HTTP_200_OK)
 
 
+class AdminBulkAssignProjectsView(APIView):
+    """Change many users' project assignments in one request, from a CSV file or a JSON list."""
+    permission_classes = [IsStaffOrSuperAdmin]
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+
+    def post(self, request):
+        try:
+            rows = read_rows(request, "assignments")
+        except BulkInputError as e:
+            return Response({"status": "error", "data": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        ok, report = bulk_assignments(rows)
+        return Response(
+            {"status": "success" if ok else "error", "data": {"summary": summarize(report), "rows": report}},
+            status=status.HTTP_200_OK if ok else status.HTTP_400_BAD_REQUEST,
+        )
+
 class AdminAssignUserProjectsView(APIView):
     permission_classes = [IsStaffOrSuperAdmin]
     
@@ -2342,7 +2507,7 @@ class AdminAssignUserProjectsView(APIView):
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
         return Response(
-            {"assigned_project_ids": user.assigned_project_ids},
+            {"assigned_project_ids": list(user.project_assignments.order_by("id").values_list("project_id", flat=True))},
             status=status.HTTP_200_OK,
         )
 
@@ -2359,9 +2524,15 @@ class AdminAssignUserProjectsView(APIView):
         except UserModel.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        user.assigned_project_ids = project_ids
-        user.save()
+        # Unknown project ids are dropped
+        project_ids = list(ProjectModel.objects.filter(id__in=project_ids).values_list("id", flat=True))
+        with transaction.atomic():
+            user.project_assignments.exclude(project_id__in=project_ids).delete()
+            ProjectAssignmentModel.objects.bulk_create(
+                [ProjectAssignmentModel(user=user, project_id=project_id) for project_id in project_ids],
+                ignore_conflicts=True,
+            )
         return Response(
-            {"assigned_project_ids": user.assigned_project_ids},
+            {"assigned_project_ids": list(user.project_assignments.order_by("id").values_list("project_id", flat=True))},
             status=status.HTTP_200_OK,
         )
@@ -0,0 +1,72 @@
+import requests
+from django.conf import settings
+from api import sync_telemetry as telemetry
+
+# Projects live under one of several Zenus accounts, each with its own API key (ZENUS_ACCOUNTS,
+# {label: key}). The list sync of an account stores its label on the projects it returns
+# (ProjectModel.zenus_account), so syncing one project afterwards goes straight to the right
+# account. Every account gets its own ZenusClient; nothing switches keys through the environment.
+
+
+class ZenusAccountError(Exception):
+    pass
+
+
+class ZenusClient:
+    """One Zenus account: its API key and an HTTP session, so its requests reuse connections."""
+
+    def __init__(self, account, api_key, base_url):
+        self.account = account
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def get(self, endpoint, params=None, headers=None):
+        """GET an endpoint, counting the request and its bytes."""
+        response = self.session.get(f"{self.base_url}/{endpoint}", headers=headers, params=params)
+        telemetry.count(http_requests=1, http_bytes=len(response.content))
+        return response
+
+    def __repr__(self):
+        return f"<ZenusClient {self.account}>"
+
+
+def accounts():
+    return list(settings.ZENUS_ACCOUNTS)
+
+
+def get_client(account):
+    """A new client for the account. Clients aren't shared between threads."""
+    try:
+        api_key = settings.ZENUS_ACCOUNTS[account]
+    except KeyError:
+        raise ZenusAccountError(f"Zenus account {account} is not configured.")
+    return ZenusClient(account, api_key, settings.ZENUS_API_URL)
+
+
+def clients(only=None):
+    """A client per configured account, or per account in `only`."""
+    only = only or accounts()
+    if not only:
+        raise ZenusAccountError("No Zenus API keys are configured (ZENUS_API_KEY_1, ZENUS_API_KEY_2 or ZENUS_API_KEY).")
+    return [get_client(account) for account in only]
+
+
+def clients_for_project(project_id):
+    """
+    The clients to sync a project with: the one of the account that owns it, or every account
+    (to try in turn) for a project no sync has seen yet.
+    """
+    from api.models import ProjectModel
+
+    account = ProjectModel.objects.filter(id=project_id).values_list("zenus_account", flat=True).first()
+    if account in settings.ZENUS_ACCOUNTS:
+        return [get_client(account)]
+    return clients()
+
+
+def client_for(project):
+    """The client of the account that owns the project, the first account for projects without one."""
+    if project.zenus_account in settings.ZENUS_ACCOUNTS:
+        return get_client(project.zenus_account)
+    return clients()[0]
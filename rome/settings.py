@@ -14,6 +14,7 @@ from pathlib import Path
 import os
 from dotenv import load_dotenv
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 
 load_dotenv(override=True)
 
@@ -50,6 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestInstrumentationMiddleware',  # First, so it times everything below it
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.ImageCacheMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -155,7 +159,7 @@ APPEND_SLASH = True
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "api.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_RENDERER_CLASSES": ("rest_framework.renderers.JSONRenderer",),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
@@ -215,7 +219,7 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
     "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "api.serializers.ClaimsTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
@@ -234,23 +238,202 @@ ALLOWED_HOSTS = [
 CORS_ALLOW_ALL_ORIGINS = True
 
 # Redis settings (for Channels)
-# CHANNEL_LAYERS = {
-#     "default": {
-#         "BACKEND": "channels_redis.core.RedisChannelLayer",
-#         "CONFIG": {
-#             "hosts": [('127.0.0.1', 6379)],  # Ensure Redis is installed and running
-#         },
-#     },
-# }
-
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+# With REDIS_URL set, progress events and their replay state are shared through Redis so uploads and
+# websocket clients can live in different ASGI processes. Without it everything stays in process,
+# which is enough for local development and tests but limits the websocket tier to one process.
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [REDIS_URL],
+                "capacity": int(os.environ.get("CHANNEL_LAYER_CAPACITY", 1000)),
+                "expiry": 60,
+                "group_expiry": 24 * 60 * 60,
+            },
+        },
+    }
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        }
+    }
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
     }
-}
 
 CORS_ALLOW_ALL_ORIGINS = True
 
 MEDIA_ROOT = os.path.join(BASE_DIR, "media/")
 MEDIA_URL = "/media/"
 
+
+
+# Content-addressed cache for Deepgram transcripts and OpenAI summary fragments.
+# BACKEND is "local" (LOCATION is a directory) or "s3" (LOCATION is a key prefix in AWS_S3_BUCKET_NAME),
+# anything else disables the cache. Entries are evicted oldest first once MAX_SIZE bytes is exceeded.
+PROCESSING_CACHE_BACKEND = os.environ.get("PROCESSING_CACHE_BACKEND", "local")
+PROCESSING_CACHE = {
+    "BACKEND": PROCESSING_CACHE_BACKEND,
+    "LOCATION": os.environ.get(
+        "PROCESSING_CACHE_LOCATION",
+        "processing-cache" if PROCESSING_CACHE_BACKEND == "s3" else os.path.join(BASE_DIR, "processing_cache"),
+    ),
+    "MAX_SIZE": int(os.environ.get("PROCESSING_CACHE_MAX_SIZE", 2 * 1024 * 1024 * 1024)),  # 2GB
+}
+
+# Backend used when an upload asks for streaming transcription ("deepgram" or the offline "local" stand-in).
+# The local backend reads its sentences, one per line, from TRANSCRIPTION_LOCAL_FIXTURE.
+TRANSCRIPTION_STREAMING_BACKEND = os.environ.get("TRANSCRIPTION_STREAMING_BACKEND", "deepgram")
+TRANSCRIPTION_LOCAL_FIXTURE = os.environ.get("TRANSCRIPTION_LOCAL_FIXTURE", os.path.join(BASE_DIR, "transcript.txt"))
+
+# Upload progress events are coalesced: within a stage one is sent at most every PROGRESS_MIN_INTERVAL
+# seconds and only once progress moved by PROGRESS_MIN_DELTA points. Stage start and end are always sent.
+PROGRESS_MIN_INTERVAL = float(os.environ.get("PROGRESS_MIN_INTERVAL", 0.5))
+PROGRESS_MIN_DELTA = int(os.environ.get("PROGRESS_MIN_DELTA", 1))
+
+# Per-request timing and SQL counts, tagged by URL name. Sent as a Server-Timing header in DEBUG and
+# kept for the last REQUEST_STATS_WINDOW requests of every URL name at admin/request-stats/.
+REQUEST_INSTRUMENTATION = os.environ.get("REQUEST_INSTRUMENTATION", "true").lower() in ("1", "true", "yes")
+REQUEST_STATS_WINDOW = int(os.environ.get("REQUEST_STATS_WINDOW", 500))
+REQUEST_STATS_SLOWEST_QUERIES = 5
+
+# Zenus sync telemetry. Every sync run is stored in SyncRunModel with per project and step timings,
+# HTTP bytes, row and query counts. Step summaries are logged at INFO on the "api.sync" logger; per-row
+# events at DEBUG (set SYNC_LOG_LEVEL=DEBUG), sampled to the first and every SYNC_LOG_SAMPLE_RATE-th of a step.
+SYNC_LOG_SAMPLE_RATE = int(os.environ.get("SYNC_LOG_SAMPLE_RATE", 1000))
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "api.sync": {
+            "handlers": ["console"],
+            "level": os.environ.get("SYNC_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
+
+# Opt-in cProfile captures of slow requests and sync steps, downloadable from admin/profiles/.
+# URL patterns are regular expressions matched against the request path or URL name, sync steps are
+# SYNC_STEPS names ("*" for all). Only runs over PROFILING_THRESHOLD_MS are kept, newest
+# PROFILING_RETENTION first. admin/profiling/ overrides these at runtime for every process (through the
+# cache, re-read every PROFILING_CONFIG_TTL seconds).
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILING_URL_PATTERNS = [p for p in os.environ.get("PROFILING_URL_PATTERNS", "").split(",") if p]
+PROFILING_SYNC_STEPS = [s for s in os.environ.get("PROFILING_SYNC_STEPS", "").split(",") if s]
+PROFILING_THRESHOLD_MS = int(os.environ.get("PROFILING_THRESHOLD_MS", 1000))
+PROFILING_RETENTION = int(os.environ.get("PROFILING_RETENTION", 50))
+PROFILING_CONFIG_TTL = 5
+
+# Raw observation, impression and QR code tables. On MySQL they can be partitioned "project" (hash of
+# project_id into RAW_TABLE_PARTITIONS partitions) or "month" (by time, RAW_TABLE_PARTITION_MONTHS_AHEAD
+# empty months kept ready by the partition_raw_tables command). Applied by migration 0020 or that command.
+# archive_projects moves the raw rows of projects that ended ARCHIVE_PROJECTS_AFTER_DAYS ago to archive tables.
+# Opening a detail view of an archived project moves them back, and it isn't archived again for
+# ARCHIVE_KEEP_RESTORED_DAYS days.
+RAW_TABLE_PARTITIONING = os.environ.get("RAW_TABLE_PARTITIONING", "none")
+RAW_TABLE_PARTITIONS = int(os.environ.get("RAW_TABLE_PARTITIONS", 16))
+RAW_TABLE_PARTITION_MONTHS_AHEAD = 3
+ARCHIVE_PROJECTS_AFTER_DAYS = int(os.environ.get("ARCHIVE_PROJECTS_AFTER_DAYS", 90))
+ARCHIVE_KEEP_RESTORED_DAYS = int(os.environ.get("ARCHIVE_KEEP_RESTORED_DAYS", 30))
+
+# Cold storage for the raw data of long closed projects (see the cold_store_projects command). BACKEND is
+# "local" (LOCATION is a directory) or "s3" (LOCATION is a key prefix in AWS_S3_BUCKET_NAME). FORMAT is "json"
+# (gzipped columnar JSON) or "parquet" (needs pyarrow). Projects that ended COLD_STORAGE_AFTER_DAYS ago are
+# exported, except ones rehydrated in the last COLD_STORAGE_KEEP_REHYDRATED_DAYS days. A request for the raw data
+# of a cold project loads it back right away when it has at most COLD_STORAGE_SYNC_REHYDRATE_MAX_ROWS rows, and
+# otherwise answers 202 and leaves it to the run_worker command.
+COLD_STORAGE_BACKEND = os.environ.get("COLD_STORAGE_BACKEND", "local")
+COLD_STORAGE = {
+    "BACKEND": COLD_STORAGE_BACKEND,
+    "LOCATION": os.environ.get(
+        "COLD_STORAGE_LOCATION",
+        "cold-storage" if COLD_STORAGE_BACKEND == "s3" else os.path.join(BASE_DIR, "cold_storage"),
+    ),
+    "FORMAT": os.environ.get("COLD_STORAGE_FORMAT", "json"),
+}
+COLD_STORAGE_AFTER_DAYS = int(os.environ.get("COLD_STORAGE_AFTER_DAYS", 365))
+COLD_STORAGE_KEEP_REHYDRATED_DAYS = int(os.environ.get("COLD_STORAGE_KEEP_REHYDRATED_DAYS", 30))
+COLD_STORAGE_SYNC_REHYDRATE_MAX_ROWS = int(os.environ.get("COLD_STORAGE_SYNC_REHYDRATE_MAX_ROWS", 50000))
+
+# Outbound emails are queued in OutboundEmailModel and delivered by the run_worker command. BACKEND is
+# "resend", "file" (.eml files in EMAIL_OUTBOX_FILE_PATH) or "smtp" (e.g. a local capture server). Failed
+# sends are retried after EMAIL_OUTBOX_RETRY_DELAY seconds, doubling up to EMAIL_OUTBOX_MAX_RETRY_DELAY,
+# until EMAIL_OUTBOX_MAX_ATTEMPTS. A worker's claim on a batch expires after EMAIL_OUTBOX_SEND_TIMEOUT seconds.
+# Sent and failed emails are deleted EMAIL_OUTBOX_RETENTION_DAYS later, by run_worker's sweep.
+EMAIL_OUTBOX_BACKEND = os.environ.get("EMAIL_OUTBOX_BACKEND", "resend")
+EMAIL_OUTBOX_FROM = os.environ.get("EMAIL_OUTBOX_FROM", "ROME <noreply@nonamegroup.com>")
+EMAIL_OUTBOX_FILE_PATH = os.environ.get("EMAIL_OUTBOX_FILE_PATH", os.path.join(BASE_DIR, "sent_emails"))
+EMAIL_OUTBOX_SMTP_HOST = os.environ.get("EMAIL_OUTBOX_SMTP_HOST", "localhost")
+EMAIL_OUTBOX_SMTP_PORT = int(os.environ.get("EMAIL_OUTBOX_SMTP_PORT", 1025))
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", 50))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 8))
+EMAIL_OUTBOX_RETRY_DELAY = 30
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 3600
+EMAIL_OUTBOX_SEND_TIMEOUT = 300
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.environ.get("EMAIL_OUTBOX_RETENTION_DAYS", 30))
+
+# Invitations link to the reset password page with a token valid this long, instead of emailing a password
+INVITATION_TOKEN_DAYS = int(os.environ.get("INVITATION_TOKEN_DAYS", 7))
+WORKER_POLL_INTERVAL = float(os.environ.get("WORKER_POLL_INTERVAL", 2))
+
+# Access tokens carry the user's flags, email and name, and ClaimsJWTAuthentication
+# serves requests from them without loading the user. Views that change a user call invalidate_user(),
+# which every process notices within JWT_USER_CACHE_TTL seconds through the cache. A process local cache
+# would let other processes serve a deactivated user until the token expires, so it's only on by default
+# with REDIS_URL, and turning it on without it refuses to start. JWT_CLAIMS_AUTH=false loads the user on
+# every request.
+JWT_CLAIMS_AUTH = os.environ.get("JWT_CLAIMS_AUTH", "true" if REDIS_URL else "false").lower() in ("1", "true", "yes")
+if JWT_CLAIMS_AUTH and CACHES["default"]["BACKEND"] == "django.core.cache.backends.locmem.LocMemCache":
+    raise ImproperlyConfigured("JWT_CLAIMS_AUTH needs a cache shared by every process, set REDIS_URL.")
+JWT_USER_CACHE_TTL = int(os.environ.get("JWT_USER_CACHE_TTL", 30))
+
+# Rows accepted per request by the bulk user and project assignment endpoints (api/user_admin.py)
+BULK_USER_ADMIN_MAX_ROWS = int(os.environ.get("BULK_USER_ADMIN_MAX_ROWS", 1000))
+
+# Bloom filter in front of the refresh token blacklist lookup (api/token_blacklist.py): "off",
+# "memory" or "redis" (needs REDIS_URL). Capacity is per day of token expiry. A process' memory filter
+# misses the tokens other processes blacklist, which could then be replayed, so "memory" refuses to start
+# unless WEB_CONCURRENCY (gunicorn's worker count) is 1. Expired tokens are deleted by the prune_tokens
+# command, run it daily.
+JWT_BLACKLIST_BLOOM = os.environ.get("JWT_BLACKLIST_BLOOM", "off")
+if JWT_BLACKLIST_BLOOM == "memory" and os.environ.get("WEB_CONCURRENCY") != "1":
+    raise ImproperlyConfigured("JWT_BLACKLIST_BLOOM=memory needs a single web process (WEB_CONCURRENCY=1), use redis.")
+JWT_BLACKLIST_BLOOM_CAPACITY = int(os.environ.get("JWT_BLACKLIST_BLOOM_CAPACITY", 100000))
+JWT_BLACKLIST_BLOOM_ERROR_RATE = float(os.environ.get("JWT_BLACKLIST_BLOOM_ERROR_RATE", 0.001))
+
+# run_worker deletes expired email verification/reset tokens (api/sweeper.py) and expired JWT
+# tokens (prune_tokens) every TOKEN_SWEEP_INTERVAL seconds, at most TOKEN_SWEEP_MAX_BATCHES batches
+# per table each time. 0 turns it off, e.g. when cron runs sweep_expired_tokens and prune_tokens.
+TOKEN_SWEEP_INTERVAL = float(os.environ.get("TOKEN_SWEEP_INTERVAL", 3600))
+TOKEN_SWEEP_MAX_BATCHES = int(os.environ.get("TOKEN_SWEEP_MAX_BATCHES", 10))
+
+# Uploaded avatars and project covers are stored as WebP renditions under content-hashed names
+# (api/images.py). Larger images are rejected before they are decoded.
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 40_000_000))
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Zenus accounts the sync pulls projects from, {label: API key}: ZENUS_API_KEY_1 and ZENUS_API_KEY_2 are
+# accounts "1" and "2", a lone ZENUS_API_KEY is "default". Each project remembers its account (api/zenus.py)
+# and sync_zenus_data syncs the accounts concurrently.
+ZENUS_API_URL = os.environ.get("ZENUS_API_URL")
+ZENUS_ACCOUNTS = {
+    label: key
+    for label, key in (("1", os.environ.get("ZENUS_API_KEY_1")), ("2", os.environ.get("ZENUS_API_KEY_2")))
+    if key
+} or ({"default": os.environ["ZENUS_API_KEY"]} if os.environ.get("ZENUS_API_KEY") else {})